@@ -12,37 +12,153 @@ import bmesh
 import os.path as path
 import ArmaToolbox
 from math import sqrt
+import numpy as np
+from Heightfield import ASCHeader, UNIT_SCALE, tileBounds, writeASCHeader, writeASCRows, createRaster
 
-def vertIdx(x,y,ncols, nrows):
-    return y*ncols + x
+def gridSize(obj):
+    '''
+    (ncols, nrows) of a heightfield object. Objects imported before the
+    grid size was stored are assumed to be square.
+    '''
+    props = obj.armaHFProps
+    numVerts = len(obj.data.vertices)
+    if props.ncols > 0 and props.nrows > 0:
+        if props.ncols * props.nrows != numVerts:
+            raise ValueError("{0} has {1} vertices, expected {2}x{3}".format(
+                obj.name, numVerts, props.ncols, props.nrows))
+        return props.ncols, props.nrows
+
+    rowcols = int(round(sqrt(numVerts)))
+    if rowcols * rowcols != numVerts:
+        raise ValueError("{0} has no stored grid size and {1} vertices is not a square grid".format(
+            obj.name, numVerts))
+    return rowcols, rowcols
+
+def meshHeights(obj, rows, cols):
+    '''
+    Heights of the vertices as (rows, cols), in metres. The importer scales
+    them down by UNIT_SCALE. Vertices still at the imported NODATA height
+    get the object's NODATA value back exactly.
+    '''
+    vertices = obj.data.vertices
+    if len(vertices) != rows * cols:
+        raise ValueError("{0} has {1} vertices instead of {2}x{3}, heightfields can only be edited in height".format(
+            obj.name, len(vertices), rows, cols))
+    co = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", co)
+    z = co[2::3].reshape(rows, cols)
+    # Scaled in double precision, a float32 division adds its own rounding
+    heights = z.astype(np.float64) / UNIT_SCALE
+    # NODATA has to compare equal to np.float32(nodata) again. The mask
+    # repeats the float32 product gridVertices stored for it.
+    nodata = obj.armaHFProps.undefVal
+    scaledNodata = (np.array([nodata], dtype=np.float32) * UNIT_SCALE)[0]
+    heights[z == scaledNodata] = np.float32(nodata)
+    return heights
 
-def exportASC(context, fileName):
-    filePtr = open(fileName, "wt")
+def exportASC(context, fileName, stitchTiles=True):
     obj = context.object
     props = obj.armaHFProps
-    
-    # dump Header
-    verts = len(obj.data.vertices)
-    rowcols = sqrt(verts)
-    
-    filePtr.write("ncols         " + str(rowcols) + "\n")
-    filePtr.write("nrows         " + str(rowcols) + "\n")
-    filePtr.write("xllcorner     " + str(props.northing) + "\n")
-    filePtr.write("yllcorner     " + str(props.easting) + "\n")
-    filePtr.write("cellsize      " + str(props.cellSize) + "\n")
-    filePtr.write("NODATA_value  " + str(props.undefVal) + "\n")
-    
-    # dump the heightfield. One line contains one row of vertices
-    row = rowcols
-    for v in obj.data.vertices:
-        filePtr.write("{:.4f}".format(v.co[2]))
-        row -= 1
-        if row == 0:
-            filePtr.write("\n")
-            row = rowcols 
-        else:
-            filePtr.write(" ")
-        
-    
-    filePtr.close()
-    
\ No newline at end of file
+    if stitchTiles and len(props.tileGroup) > 0:
+        return exportASCTiles(context, fileName)
+
+    ncols, nrows = gridSize(obj)
+    header = ASCHeader(ncols, nrows, props.northing, props.easting, props.cellSize, props.undefVal)
+
+    heights = meshHeights(obj, nrows, ncols)
+
+    with open(fileName, "wt") as filePtr:
+        writeASCHeader(filePtr, header)
+        # dump the heightfield. One line contains one row of vertices
+        writeASCRows(filePtr, heights)
+
+
+###
+##  Tiled heightfields
+#
+
+def tileObjects(tileGroup):
+    ''' {(tileRow, tileCol): object} of all tiles of a group '''
+    return {(obj.armaHFProps.tileRow, obj.armaHFProps.tileCol): obj
+                for obj in bpy.data.objects
+                    if obj.type == 'MESH'
+                        and obj.armaHFProps.isHeightfield
+                        and obj.armaHFProps.tileGroup == tileGroup}
+
+
+def iterStitchedRows(tiles, props):
+    '''
+    Yields the core rows of each band of tiles, so only one band of the
+    heightfield is in memory at a time. Each tile contributes its core,
+    the overlapping rows and columns come from the neighbour owning them.
+    '''
+    rowBounds = tileBounds(props.gridRows, props.tileCount, props.overlap)
+    colBounds = tileBounds(props.gridCols, props.tileCount, props.overlap)
+
+    for tileRow, (coreStart, coreEnd, start, end) in enumerate(rowBounds):
+        band = np.empty((coreEnd - coreStart, props.gridCols), dtype=np.float32)
+        for tileCol, (colCoreStart, colCoreEnd, colStart, colEnd) in enumerate(colBounds):
+            obj = tiles.get((tileRow, tileCol))
+            if obj is None:
+                raise ValueError("Tile {0},{1} of {2} is missing".format(tileRow, tileCol, props.tileGroup))
+            heights = meshHeights(obj, end - start, colEnd - colStart)
+            band[:, colCoreStart:colCoreEnd] = heights[coreStart - start:coreEnd - start,
+                                                       colCoreStart - colStart:colCoreEnd - colStart]
+        yield band
+
+def exportASCTiles(context, fileName):
+    ''' Stitch all tiles of the active object's tile group into one ASC file '''
+    props = context.object.armaHFProps
+    tiles = tileObjects(props.tileGroup)
+
+    header = ASCHeader(props.gridCols, props.gridRows, props.northing, props.easting,
+                       props.cellSize, props.undefVal)
+    with open(fileName, "wt") as filePtr:
+        writeASCHeader(filePtr, header)
+        for band in iterStitchedRows(tiles, props):
+            writeASCRows(filePtr, band)
+
+###
+##  Binary rasters
+#
+
+def validRange(heights, nodata):
+    valid = heights[heights != np.float32(nodata)]
+    if len(valid) == 0:
+        return (0.0, 1.0)
+    return (float(valid.min()), float(valid.max()))
+
+def exportRaster(context, fileName, dtype="float32", stitchTiles=True):
+    '''
+    Write the heightfield as raw or .npy heightmap with a JSON sidecar
+    (see Heightfield.createRaster). Tiles are stitched like for ASC.
+    '''
+    obj = context.object
+    props = obj.armaHFProps
+
+    if stitchTiles and len(props.tileGroup) > 0:
+        tiles = tileObjects(props.tileGroup)
+        header = ASCHeader(props.gridCols, props.gridRows, props.northing, props.easting,
+                           props.cellSize, props.undefVal)
+        heightRange = None
+        if dtype not in ("float32", "float16"):
+            # Integer types need the height range up front, one extra pass
+            low, high = np.inf, -np.inf
+            for band in iterStitchedRows(tiles, props):
+                bandLow, bandHigh = validRange(band, props.undefVal)
+                low, high = min(low, bandLow), max(high, bandHigh)
+            heightRange = (low, high)
+        writer = createRaster(fileName, header, dtype, heightRange)
+        row = 0
+        for band in iterStitchedRows(tiles, props):
+            writer.write(row, band)
+            row += len(band)
+        writer.close()
+        return
+
+    ncols, nrows = gridSize(obj)
+    header = ASCHeader(ncols, nrows, props.northing, props.easting, props.cellSize, props.undefVal)
+    heights = meshHeights(obj, nrows, ncols)
+    writer = createRaster(fileName, header, dtype, validRange(heights, props.undefVal))
+    writer.write(0, heights)
+    writer.close()
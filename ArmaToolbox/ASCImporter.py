@@ -11,124 +11,227 @@ import bpy
 import bmesh
 import os.path as path
 import ArmaToolbox
+import math
+import numpy as np
+from Heightfield import readASC, readRaster, readASCHeader, iterRowBands, tileBounds, openPyramid, \
+    gridVertices, gridTriangles, gridLoopUVs
 
-def expectKeyword(line, word):
-    pair = line.split()
-    kw = pair[0].strip().decode("utf-8")
-    val = pair[1].strip().decode("utf-8")
-    
-    #print ("kw = ", kw, "val = ", val)
-    
-    if kw == word:
-        return float(val)
-    else:
-        return -1
+def buildGridMesh(name, verts, tris, uvs):
+    ''' Mesh from the arrays of Heightfield.gridVertices/gridTriangles/gridLoopUVs '''
+    mesh = bpy.data.meshes.new(name=name)
+    numLoops = tris.size
+
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set("co", verts.ravel())
+    mesh.loops.add(numLoops)
+    mesh.loops.foreach_set("vertex_index", tris.ravel())
+    mesh.polygons.add(len(tris))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, numLoops, 3, dtype=np.int32))
+    # Computed from loop_start in newer Blender versions
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", np.full(len(tris), 3, dtype=np.int32))
+    mesh.polygons.foreach_set("use_smooth", np.ones(len(tris), dtype=bool))
 
-def vertIdx(x,y,ncols, nrows):
-    return y*ncols + x
+    mesh.update(calc_edges=True)
+
+    # Unmap the polygon flat
+    layer = mesh.uv_layers.new(name="Terrain")
+    layer.data.foreach_set("uv", uvs.ravel())
+    return mesh
+
+def setHeightfieldProperties(obj, header):
+    obj.armaHFProps.isHeightfield = True
+    obj.armaHFProps.cellSize = header.cellsize
+    obj.armaHFProps.northing = header.xllcorner
+    obj.armaHFProps.easting = header.yllcorner
+    obj.armaHFProps.undefVal = header.nodata
 
-def importASC(context, fileName):
-    filePtr = open(fileName, "rb")
+def importASCTiles(context, fileName, tileCount, overlap=1):
+    '''
+    Import the grid as tileCount x tileCount objects in a new collection.
+    The file is read once, band by band, and only one tile's mesh arrays
+    exist at a time.
+    '''
     objName = path.basename(fileName).split(".")[0]
-    
-    # This isn't very flexible (yet). No idea if there can be comments in ASC DEM files
-    # expect the ncols/nrows etc at the beginning
-    
-    line = filePtr.readline()
-    ncols = int(expectKeyword(line, "ncols"))
-    if ncols == -1:
-        return -1
-    
-    line = filePtr.readline()
-    nrows = int(expectKeyword(line, "nrows"))
-    if nrows == -1:
-        return -1
 
+    collection = bpy.data.collections.new(objName)
+    context.scene.collection.children.link(collection)
 
-    
-    line = filePtr.readline()
-    xllcorner = expectKeyword(line, "xllcorner")
-    if xllcorner == -1:
-        return -1
+    with open(fileName, "rb") as filePtr:
+        header = readASCHeader(filePtr)
+        ncols = header.ncols
+        nrows = header.nrows
+        cellsize = header.cellsize
+        xext = (ncols * cellsize)/100;
+        yext = (nrows * cellsize)/100;
 
+        rowBounds = tileBounds(nrows, tileCount, overlap)
+        colBounds = tileBounds(ncols, tileCount, overlap)
+        bands = iterRowBands(filePtr, header, [(start, end) for coreStart, coreEnd, start, end in rowBounds])
 
-    line = filePtr.readline()
-    yllcorner = expectKeyword(line, "yllcorner")
-    if yllcorner == -1:
-        return -1   
-    
-    line = filePtr.readline()
-    cellsize = expectKeyword(line, "cellsize")
-    if cellsize == -1:
-        return -1
-    
-    line = filePtr.readline()
-    nodata = expectKeyword(line, "NODATA_value")
-    
-    #print("debug: size = " , nrows, "x", ncols, " cellsize ", cellsize , "corner at ", xllcorner, ",", yllcorner)
-    
-    # read the height field data
-    verts = []
-    for y in range(0,nrows):
-        line = filePtr.readline()
-        line = line.decode("utf-8")
-        vals = line.split(" ")
-        for x in range(0,ncols):
-            f = float(vals [x])
-            point = [(x*cellsize)/100,((nrows-1-y)*cellsize/100), f/100]
-            verts.append (point)
-    
-    filePtr.close()
-    
-    faces = []
-    # Create the triangulation
-    for y in range(0,nrows-1):
-        for x in range(0,ncols-1):
-            idx1 = vertIdx(x,y,ncols,nrows)
-            idx2 = vertIdx(x+1,y,ncols,nrows)
-            idx3 = vertIdx(x,y+1, ncols, nrows)
-            idx4 = vertIdx(x+1,y+1, ncols, nrows)
-            face1 = [idx3, idx2, idx1]
-            face2 = [idx2, idx3, idx4]
-            faces.append(face1)
-            faces.append(face2)
-      
-    numFaces = len(faces)  
-    # Create the mesh.
-    mymesh = bpy.data.meshes.new(name="heightfield")
-    mymesh.from_pydata(verts, [], faces) 
-
-    #mymesh.update(True)
+        for tileRow, (firstRow, band) in enumerate(bands):
+            for tileCol, (coreStart, coreEnd, firstCol, endCol) in enumerate(colBounds):
+                heights = band[:, firstCol:endCol]
+                verts = gridVertices(heights, cellsize, nrows, firstRow, firstCol)
+                tris = gridTriangles(heights.shape[0], heights.shape[1])
+                uvs = gridLoopUVs(verts, tris, xext, yext)
+                name = "{0}_{1}_{2}".format(objName, tileRow, tileCol)
+                mesh = buildGridMesh(name, verts, tris, uvs)
+                del verts, tris, uvs
+
+                obj = bpy.data.objects.new(name, mesh)
+                collection.objects.link(obj)
+
+                setHeightfieldProperties(obj, header)
+                hfProps = obj.armaHFProps
+                hfProps.tileGroup = objName
+                hfProps.tileCount = tileCount
+                hfProps.tileRow = tileRow
+                hfProps.tileCol = tileCol
+                hfProps.gridRowOffset = firstRow
+                hfProps.gridColOffset = firstCol
+                hfProps.gridRows = nrows
+                hfProps.gridCols = ncols
+                hfProps.overlap = overlap
+                hfProps.nrows = heights.shape[0]
+                hfProps.ncols = heights.shape[1]
+
+    return 0
+
+def importASCPreview(context, fileName, step, method='STRIDE'):
+    '''
+    Import a decimated preview of the grid from the file's pyramid (built
+    on first use). Regions of it can be refined to full resolution with
+    refineHeightfield later.
+    '''
+    objName = path.basename(fileName).split(".")[0]
+    pyramid = openPyramid(fileName)
+    header = pyramid.header
+    nrows = header.nrows
+
+    heights, offset, step = pyramid.preview(step, method)
+    verts = gridVertices(heights, header.cellsize, nrows, offset, offset, step)
+    tris = gridTriangles(heights.shape[0], heights.shape[1])
+    uvs = gridLoopUVs(verts, tris, (header.ncols * header.cellsize)/100, (nrows * header.cellsize)/100)
+    mesh = buildGridMesh(objName + "_preview", verts, tris, uvs)
+    del verts, tris, uvs
+
+    obj = bpy.data.objects.new(objName + "_preview", mesh)
+    context.scene.collection.objects.link(obj)
+
+    setHeightfieldProperties(obj, header)
+    hfProps = obj.armaHFProps
+    # Exports as a coarse DEM of the same area
+    hfProps.cellSize = header.cellsize * step
+    hfProps.nrows = heights.shape[0]
+    hfProps.ncols = heights.shape[1]
+    hfProps.gridRows = header.nrows
+    hfProps.gridCols = header.ncols
+    hfProps.pyramidSource = fileName
+    hfProps.previewStep = step
+    hfProps.previewOffset = offset
+    return obj
+
+def previewRegion(obj, selected):
+    '''
+    Full resolution (rowStart, rowEnd, colStart, colEnd) covered by the
+    selected vertices of a preview, the whole grid if none are selected
+    '''
+    props = obj.armaHFProps
+    if len(selected) != props.nrows * props.ncols:
+        raise ValueError("{0} has {1} vertices, expected {2}x{3}; the preview grid was edited".format(
+            obj.name, len(selected), props.ncols, props.nrows))
+    if not selected.any():
+        return 0, props.gridRows, 0, props.gridCols
+
+    rows, cols = np.nonzero(selected.reshape(props.nrows, props.ncols))
+    step = props.previewStep
+    offset = props.previewOffset
+    # One preview step around the selection, so the refined part covers
+    # the selected cells completely
+    rowStart = max(0, int(math.floor(offset + (rows.min() - 1) * step)))
+    rowEnd = min(props.gridRows, int(math.ceil(offset + (rows.max() + 1) * step)) + 1)
+    colStart = max(0, int(math.floor(offset + (cols.min() - 1) * step)))
+    colEnd = min(props.gridCols, int(math.ceil(offset + (cols.max() + 1) * step)) + 1)
+    return rowStart, rowEnd, colStart, colEnd
+
+def refineHeightfield(context, obj, rowStart, rowEnd, colStart, colEnd):
+    '''
+    New full resolution object for a region of a preview's grid, read from
+    the memory mapped pyramid instead of the ASC file
+    '''
+    props = obj.armaHFProps
+    fileName = props.pyramidSource
+    pyramid = openPyramid(fileName)
+    header = pyramid.header
+    nrows = header.nrows
+    cellsize = header.cellsize
+
+    heights = pyramid.region(rowStart, rowEnd, colStart, colEnd)
+    verts = gridVertices(heights, cellsize, nrows, rowStart, colStart)
+    tris = gridTriangles(heights.shape[0], heights.shape[1])
+    uvs = gridLoopUVs(verts, tris, (header.ncols * cellsize)/100, (nrows * cellsize)/100)
+    name = "{0}_r{1}_c{2}".format(path.basename(fileName).split(".")[0], rowStart, colStart)
+    mesh = buildGridMesh(name, verts, tris, uvs)
+    del verts, tris, uvs
+
+    region = bpy.data.objects.new(name, mesh)
+    for collection in obj.users_collection:
+        collection.objects.link(region)
+
+    setHeightfieldProperties(region, header)
+    hfProps = region.armaHFProps
+    # Lower left corner of the region, so it exports as a DEM of its own
+    hfProps.northing = header.xllcorner + colStart * cellsize
+    hfProps.easting = header.yllcorner + (nrows - rowEnd) * cellsize
+    hfProps.nrows = heights.shape[0]
+    hfProps.ncols = heights.shape[1]
+    hfProps.gridRowOffset = rowStart
+    hfProps.gridColOffset = colStart
+    hfProps.gridRows = nrows
+    hfProps.gridCols = header.ncols
+    hfProps.pyramidSource = fileName
+    return region
+
+def createHeightfieldObject(context, objName, grid):
+    ''' Single heightfield object for a whole ASCGrid '''
+    header = grid.header
+    ncols = header.ncols
+    nrows = header.nrows
+    cellsize = header.cellsize
+
+    xext = (ncols * cellsize)/100;
+    yext = (nrows * cellsize)/100;
+
+    verts = gridVertices(grid.heights, cellsize, nrows)
+    tris = gridTriangles(nrows, ncols)
+    uvs = gridLoopUVs(verts, tris, xext, yext)
+    mymesh = buildGridMesh("heightfield", verts, tris, uvs)
+    del verts, tris, uvs
 
     obj = bpy.data.objects.new(objName, mymesh)
     
-    scn = bpy.context.scene
+    scn = context.scene
     scn.collection.objects.link(obj)
     #scn.collection.objects.active = obj
     
-    xext = (ncols * cellsize)/100;
-    yext = (nrows * cellsize)/100;
-    
-    # Unmap the polygon flat   
-    mymesh.uv_layers.new(name="Terrain")
-    layer = mymesh.uv_layers[-1]
-    index = 0
-    for f in mymesh.polygons:
-        f.use_smooth = True
-        for vIdx in f.vertices:
-            v = mymesh.vertices[vIdx]
-            x = v.co[0]
-            y = v.co[1]
-            
-            layer.data[index].uv = [x/xext, y/yext] 
-            index += 1
+    setHeightfieldProperties(obj, header)
+    obj.armaHFProps.ncols = ncols
+    obj.armaHFProps.nrows = nrows
+    return obj
 
-    
-    obj.armaHFProps.isHeightfield = True
-    obj.armaHFProps.cellSize = cellsize
-    obj.armaHFProps.northing = xllcorner
-    obj.armaHFProps.easting = yllcorner
-    obj.armaHFProps.undefVal = nodata    
-    
-        
+def importASC(context, fileName, tileCount=1, overlap=1, previewStep=1, previewMethod='STRIDE'):
+    if previewStep > 1:
+        importASCPreview(context, fileName, previewStep, previewMethod)
+        return 0
+    if tileCount > 1:
+        return importASCTiles(context, fileName, tileCount, overlap)
+
+    objName = path.basename(fileName).split(".")[0]
+    createHeightfieldObject(context, objName, readASC(fileName))
     return 0
+
+def importRaster(context, fileName):
+    ''' Import a raw or .npy heightmap (see Heightfield.readRaster) '''
+    objName = path.basename(fileName).split(".")[0]
+    return createHeightfieldObject(context, objName, readRaster(fileName))
@@ -730,7 +730,9 @@ def selectTransparencyObj(obj):
     bmesh.update_edit_mesh(obj.data)
 
 def optimize_export_lod(obj):
-    # ? bpy.context.scene.objects.active = obj
+    # The mode switches below act on the active object, which isn't
+    # necessarily obj when running without a UI.
+    bpy.context.view_layer.objects.active = obj
     obj.select_set(True)
 
     bpy.ops.object.mode_set(mode='EDIT')
@@ -768,3 +770,109 @@ def PostProcessLOD(obj):
                         
     bm.to_mesh(me)
     bm.free()
+
+
+###
+##  Heightfield surface maps
+#
+
+def storeSurfaceMap(obj, name, values, output):
+    ''' Store a (rows, cols) map as point attribute or float image named after the object '''
+    import numpy as np
+    if output == 'ATTRIBUTES':
+        mesh = obj.data
+        attr = mesh.attributes.get(name)
+        if attr is not None and (attr.domain != 'POINT' or attr.data_type != 'FLOAT'):
+            mesh.attributes.remove(attr)
+            attr = None
+        if attr is None:
+            attr = mesh.attributes.new(name, 'FLOAT', 'POINT')
+        attr.data.foreach_set("value", values.ravel())
+    else:
+        rows, cols = values.shape
+        imageName = "{0}_{1}".format(obj.name, name)
+        image = bpy.data.images.get(imageName)
+        if image is not None and tuple(image.size) != (cols, rows):
+            bpy.data.images.remove(image)
+            image = None
+        if image is None:
+            image = bpy.data.images.new(imageName, cols, rows, alpha=False, float_buffer=True)
+        # Images start at the bottom, the grid at the northern edge
+        pixels = np.ones((rows, cols, 4), dtype=np.float32)
+        pixels[..., :3] = values[::-1, :, None]
+        image.pixels.foreach_set(pixels.ravel())
+        image.update()
+
+def tileSurfaceMaps(props, maps, output):
+    '''
+    Surface maps for all tiles of a tile group, computed on the stitched
+    grid one band of tiles at a time. Tile edges see their neighbours'
+    heights, and the overlap vertices of a tile get the values of the tile
+    owning them, so the maps match the whole grid without seams.
+    '''
+    from Heightfield import tileBounds, surfaceMaps
+    from ASCExporter import tileObjects, iterStitchedRows
+    import numpy as np
+
+    tiles = tileObjects(props.tileGroup)
+    nrows = props.gridRows
+    rowBounds = tileBounds(nrows, props.tileCount, props.overlap)
+    colBounds = tileBounds(props.gridCols, props.tileCount, props.overlap)
+
+    # (firstRow, band) of the stitched bands still needed, read ahead as
+    # far as the overlap and halo rows of the current tile row reach
+    bands = iterStitchedRows(tiles, props)
+    window = []
+    nextRow = 0
+    def stitchedRows(first, last):
+        nonlocal nextRow
+        while nextRow < last:
+            band = next(bands)
+            window.append((nextRow, band))
+            nextRow += len(band)
+        while window[0][0] + len(window[0][1]) <= first:
+            window.pop(0)
+        offset = window[0][0]
+        return np.concatenate([band for row, band in window])[first - offset:last - offset]
+
+    objects = []
+    for tileRow, (coreStart, coreEnd, start, end) in enumerate(rowBounds):
+        haloTop = start > 0
+        haloBottom = end < nrows
+        block = stitchedRows(start - 1 if haloTop else start, end + 1 if haloBottom else end)
+        bandMaps = surfaceMaps(block, props.cellSize, props.undefVal, haloTop, haloBottom)
+        del block
+        for tileCol, (colCoreStart, colCoreEnd, colStart, colEnd) in enumerate(colBounds):
+            o = tiles[(tileRow, tileCol)]
+            for name in maps:
+                storeSurfaceMap(o, name, bandMaps[name][:, colStart:colEnd], output)
+            o.data.update()
+            objects.append(o)
+    return objects
+
+def heightfieldSurfaceMaps(context, obj, maps, output='ATTRIBUTES', bandRows=1024):
+    '''
+    Compute slope, aspect and/or curvature for a heightfield object, or for
+    every tile of its tile group (see tileSurfaceMaps). maps is a list of
+    Heightfield.SURFACE_MAPS names. Returns the objects processed.
+    '''
+    import numpy as np
+    from Heightfield import iterSurfaceMaps
+    from ASCExporter import gridSize, meshHeights
+
+    props = obj.armaHFProps
+    if len(props.tileGroup) > 0:
+        return tileSurfaceMaps(props, maps, output)
+
+    ncols, nrows = gridSize(obj)
+    heights = meshHeights(obj, nrows, ncols)
+    result = {name: np.empty((nrows, ncols), dtype=np.float32) for name in maps}
+    for row, bandMaps in iterSurfaceMaps(heights, props.cellSize, props.undefVal, bandRows):
+        for name in maps:
+            band = bandMaps[name]
+            result[name][row:row + len(band)] = band
+    del heights
+    for name in maps:
+        storeSurfaceMap(obj, name, result[name], output)
+    obj.data.update()
+    return [obj]
@@ -0,0 +1,314 @@
+'''
+Created on 19.10.2026
+
+SQLite index of the P3D and rvmat files below a root folder (normally the
+P drive). Answers questions like "which models use this rvmat", "which
+models reference this proxy" or "where is xyz_mlod.p3d" without walking
+the file system.
+
+    python AssetIndex.py --root P:\\ --db P:\\ArmaToolbox.index
+    python AssetIndex.py --db P:\\ArmaToolbox.index --find xyz_mlod.p3d
+
+Indexing is incremental, only files whose modification time or size
+changed since the last run are parsed again. Parsing happens in a process
+pool, the database is only written from the calling process.
+
+All names in the index are stored normalized (see normalizeName), paths
+of files as they are on disk.
+
+'''
+import sys, os
+sys.path.append(os.path.dirname(__file__))
+
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import MLODCodec
+from MLODCodec import BinaryStream, MLODError
+
+INDEX_FILE_NAME = "ArmaToolbox.index"
+INDEXED_EXTENSIONS = (".p3d", ".rvmat")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id      INTEGER PRIMARY KEY,
+    path    TEXT UNIQUE NOT NULL,
+    name    TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    mtime   REAL NOT NULL,
+    size    INTEGER NOT NULL,
+    error   TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+
+CREATE TABLE IF NOT EXISTS lods (
+    file_id     INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    resolution  REAL NOT NULL,
+    points      INTEGER NOT NULL,
+    faces       INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lods_file ON lods(file_id);
+
+CREATE TABLE IF NOT EXISTS refs (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    kind    TEXT NOT NULL,
+    name    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_name ON refs(kind, name);
+CREATE INDEX IF NOT EXISTS refs_file ON refs(file_id);
+'''
+
+# Reference kinds
+REF_TEXTURE = "texture"
+REF_MATERIAL = "material"
+REF_PROXY = "proxy"
+
+def normalizeName(name):
+    '''
+    Normalize a texture, material or model path the way the game sees
+    it: lower case, backslashes, no drive and no leading backslash.
+    '''
+    name = name.strip().replace('/', '\\')
+    if len(name) > 1 and name[1] == ':':
+        name = name[2:]
+    return name.lstrip('\\').lower()
+
+def proxyModelName(selectionName):
+    '''
+    Model path of a proxy selection, "proxy:\\a3\\x\\box.001" becomes
+    "a3\\x\\box.p3d"
+    '''
+    name = selectionName[6:]
+    base, ext = os.path.splitext(name)
+    if ext.lstrip('.').isdigit():
+        name = base
+    return normalizeName(name) + ".p3d"
+
+def defaultIndexFile(root):
+    return os.path.join(root, INDEX_FILE_NAME)
+
+###
+##  Parsing, runs in the worker processes
+#
+
+def scanP3D(fileName):
+    '''
+    Read the LOD headers, face names and tagg names of an MLOD file.
+    Geometry and tagg contents are skipped.
+    '''
+    lods = []
+    refs = set()
+    with open(fileName, "rb") as filePtr:
+        stream = BinaryStream(filePtr)
+        sig, version, numLods = MLODCodec.readMLODHeader(stream)
+        if sig != MLODCodec.MLOD_SIGNATURE or version != MLODCodec.MLOD_VERSION:
+            raise MLODError("Not an MLOD file (binarized?)")
+
+        for i in range(numLods):
+            numPoints, numNormals, numFaces, flags = MLODCodec.readLODHeader(stream)
+            stream.skip(numPoints * MLODCodec.POINT_DTYPE.itemsize + numNormals * 12)
+
+            for f in range(numFaces):
+                stream.skip(MLODCodec.FACE_RECORD_SIZE)
+                texture = stream.readCString()
+                material = stream.readCString()
+                if len(texture) > 0 and texture[0] != '#':
+                    refs.add((REF_TEXTURE, normalizeName(texture)))
+                if len(material) > 0:
+                    refs.add((REF_MATERIAL, normalizeName(material)))
+
+            if stream.read(4) != MLODCodec.TAGG_SIGNATURE:
+                raise MLODError("No tagg signature")
+            while True:
+                active, name, size = MLODCodec.readTaggHeader(stream)
+                stream.skip(size)
+                if name == MLODCodec.END_OF_FILE:
+                    break
+                if name.lower().startswith("proxy:"):
+                    refs.add((REF_PROXY, proxyModelName(name)))
+
+            lods.append((stream.readFloat(), numPoints, numFaces))
+    return lods, sorted(refs)
+
+def scanRVMat(fileName):
+    from RVMatTools import rt_FindTextureNames
+    refs = {(REF_TEXTURE, normalizeName(t)) for t in rt_FindTextureNames(fileName)}
+    return [], sorted(refs)
+
+def scanFile(fileName):
+    ''' Returns (fileName, lods, refs, error) '''
+    try:
+        if fileName.lower().endswith(".p3d"):
+            lods, refs = scanP3D(fileName)
+        else:
+            lods, refs = scanRVMat(fileName)
+        return fileName, lods, refs, None
+    except Exception as e:
+        return fileName, [], [], "{0}: {1}".format(type(e).__name__, e)
+
+###
+##  Database
+#
+
+def openIndex(dbFile):
+    db = sqlite3.connect(dbFile)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.execute("PRAGMA journal_mode = WAL")
+    db.executescript(SCHEMA)
+    return db
+
+def findIndexedFiles(root):
+    ''' Returns {path: (mtime, size)} for all indexable files below root '''
+    result = {}
+    for dirPath, dirs, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(INDEXED_EXTENSIONS):
+                fileName = os.path.join(dirPath, name)
+                try:
+                    st = os.stat(fileName)
+                except OSError:
+                    continue
+                result[fileName] = (st.st_mtime, st.st_size)
+    return result
+
+def storeResult(db, fileName, stat, lods, refs, error):
+    name = os.path.basename(fileName).lower()
+    kind = os.path.splitext(name)[1][1:]
+    db.execute("DELETE FROM files WHERE path = ?", (fileName,))
+    cur = db.execute("INSERT INTO files (path, name, kind, mtime, size, error) VALUES (?, ?, ?, ?, ?, ?)",
+                     (fileName, name, kind, stat[0], stat[1], error))
+    fileId = cur.lastrowid
+    db.executemany("INSERT INTO lods (file_id, resolution, points, faces) VALUES (?, ?, ?, ?)",
+                   [(fileId,) + tuple(lod) for lod in lods])
+    db.executemany("INSERT INTO refs (file_id, kind, name) VALUES (?, ?, ?)",
+                   [(fileId,) + tuple(ref) for ref in refs])
+
+def updateIndex(dbFile, root, jobs=None, progress=None):
+    '''
+    Bring the index up to date with the files below root. Returns a
+    dictionary with the number of scanned, unchanged, removed and failed
+    files. progress, if given, is called with (done, total).
+    '''
+    start = time.perf_counter()
+    db = openIndex(dbFile)
+    root = os.path.abspath(root)
+
+    onDisk = findIndexedFiles(root)
+
+    known = {}
+    for fileName, mtime, size in db.execute("SELECT path, mtime, size FROM files"):
+        known[fileName] = (mtime, size)
+
+    # Only look at files below this root, an index can hold more than one
+    prefix = os.path.join(root, "")
+    removed = [f for f in known if f.startswith(prefix) and f not in onDisk]
+    changed = [f for f, stat in onDisk.items() if known.get(f) != stat]
+
+    with db:
+        db.executemany("DELETE FROM files WHERE path = ?", [(f,) for f in removed])
+
+    failed = 0
+    if len(changed) > 0:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for done, (fileName, lods, refs, error) in enumerate(pool.map(scanFile, changed, chunksize=16)):
+                storeResult(db, fileName, onDisk[fileName], lods, refs, error)
+                if error is not None:
+                    failed += 1
+                if done % 500 == 0:
+                    db.commit()
+                    if progress is not None:
+                        progress(done, len(changed))
+        db.commit()
+
+    db.close()
+    return {
+        "files": len(onDisk),
+        "scanned": len(changed),
+        "unchanged": len(onDisk) - len(changed),
+        "removed": len(removed),
+        "failed": failed,
+        "seconds": time.perf_counter() - start,
+    }
+
+###
+##  Queries
+#
+
+def _paths(cursor):
+    return [row[0] for row in cursor]
+
+def findFiles(db, fileName, under=None):
+    ''' Paths of all indexed files with this file name, optionally below a folder '''
+    paths = _paths(db.execute("SELECT path FROM files WHERE name = ? ORDER BY path",
+                              (os.path.basename(fileName).lower(),)))
+    if under:
+        prefix = os.path.join(os.path.abspath(under), "")
+        paths = [p for p in paths if p.startswith(prefix)]
+    return paths
+
+def filesReferencing(db, kind, name):
+    return _paths(db.execute(
+        "SELECT DISTINCT files.path FROM refs JOIN files ON files.id = refs.file_id "
+        "WHERE refs.kind = ? AND refs.name = ? ORDER BY files.path",
+        (kind, normalizeName(name))))
+
+def modelsUsingMaterial(db, rvmatName):
+    return filesReferencing(db, REF_MATERIAL, rvmatName)
+
+def filesUsingTexture(db, textureName):
+    ''' Models and rvmats referencing the texture '''
+    return filesReferencing(db, REF_TEXTURE, textureName)
+
+def modelsReferencingProxy(db, proxyPath):
+    name = normalizeName(proxyPath)
+    if not name.endswith(".p3d"):
+        name += ".p3d"
+    return filesReferencing(db, REF_PROXY, name)
+
+def fileLods(db, fileName):
+    return db.execute(
+        "SELECT resolution, points, faces FROM lods JOIN files ON files.id = lods.file_id "
+        "WHERE files.path = ?", (fileName,)).fetchall()
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="AssetIndex", description="Index P3D and rvmat files")
+    parser.add_argument("--root", default=None, help="Folder to index")
+    parser.add_argument("--db", default=None, help="Index file, defaults to <root>/" + INDEX_FILE_NAME)
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--find", default=None, help="Find files with this name")
+    parser.add_argument("--material", default=None, help="List models using this rvmat")
+    parser.add_argument("--texture", default=None, help="List files using this texture")
+    parser.add_argument("--proxy", default=None, help="List models referencing this proxy model")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArguments(sys.argv[1:] if argv is None else argv)
+    if args.root is None and args.db is None:
+        print("Either --root or --db is required")
+        return 2
+    dbFile = args.db or defaultIndexFile(args.root)
+
+    if args.root:
+        print(updateIndex(dbFile, args.root, args.jobs,
+                          lambda done, total: print("{0}/{1}".format(done, total))))
+
+    db = openIndex(dbFile)
+    results = []
+    if args.find:
+        results += findFiles(db, args.find)
+    if args.material:
+        results += modelsUsingMaterial(db, args.material)
+    if args.texture:
+        results += filesUsingTexture(db, args.texture)
+    if args.proxy:
+        results += modelsReferencingProxy(db, args.proxy)
+    db.close()
+
+    for r in results:
+        print(r)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
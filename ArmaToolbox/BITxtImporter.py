@@ -0,0 +1,314 @@
+'''
+Created on 19.10.2026
+
+Import BITxt text models, as written by BITxtWriter.exportBITxt.
+
+The file is streamed with a small state machine, one section keyword
+(:lod, :points, :face, :edges, :selection, :mass, :end) at a time. Numbers
+are collected in array.array buffers, so a LOD costs a few bytes per value
+instead of one Python object each. Per point data (:mass) goes into an
+array preallocated from the :points count. Only the LOD being read is held in
+memory. Each LOD becomes one mesh, filled with foreach_set once the LOD is
+complete.
+
+Long lines (all :edges and :mass values are on one line) are read in
+pieces of at most LINE_CHUNK characters, cut at whitespace.
+
+'''
+import bpy
+import bmesh
+import os.path as path
+import numpy as np
+from array import array
+
+import ArmaTools
+from MDLImporter import getMaterial, setLodProperties, resolutionName, addSelection, \
+    setSharpEdges, maybeAddEdgeSplit
+
+LINE_CHUNK = 1 << 20
+
+class BITxtError(Exception):
+    pass
+
+def iterLines(filePtr, chunkSize=LINE_CHUNK):
+    '''
+    Lines of the file without the line end. Lines longer than chunkSize
+    are returned in several pieces, cut after the last whitespace of each
+    piece so that no number is split.
+    '''
+    carry = ""
+    while True:
+        piece = filePtr.readline(chunkSize)
+        if len(piece) == 0:
+            if len(carry) > 0:
+                yield carry
+            return
+        if piece[-1] == "\n":
+            yield carry + piece.rstrip("\r\n")
+            carry = ""
+            continue
+        cut = max(piece.rfind(" "), piece.rfind("\t"))
+        if cut < 0:
+            carry = carry + piece
+        else:
+            yield carry + piece[:cut]
+            carry = piece[cut + 1:]
+
+def quotedName(line):
+    ''' The value of a keyword "value" line, quotes are optional '''
+    start = line.find('"')
+    end = line.rfind('"')
+    if start < 0 or end <= start:
+        return line.partition(" ")[2].strip()
+    return line[start + 1:end]
+
+class BITxtSelection:
+    ''' Named selection in the form MDLImporter.addSelection expects '''
+    def __init__(self, name, numPoints):
+        self.name = name
+        self.numPoints = numPoints
+        self.indices = array('i')
+        self.weights = array('f')
+
+    def vertexWeights(self):
+        weights = np.zeros(self.numPoints, dtype=np.float32)
+        indices = np.frombuffer(self.indices, dtype=np.int32)
+        valid = (indices >= 0) & (indices < self.numPoints)
+        weights[indices[valid]] = np.frombuffer(self.weights, dtype=np.float32)[valid]
+        return weights
+
+class BITxtLod:
+    ''' Everything read for one LOD, in flat typed arrays '''
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.points = array('d')
+        self.sides = array('B')
+        self.loopVerts = array('i')
+        self.uvs = array('f')
+        self.faceKeys = array('i')
+        self.sharpEdges = array('i')
+        self.selections = []
+        self.mass = None
+
+    @property
+    def numPoints(self):
+        return len(self.points) // 3
+
+class BITxtReader:
+    '''
+    State machine over the lines of a BITxt file. Call read() to get the
+    LODs one by one. materialKeys collects the (texture, material) pairs
+    the faces refer to by index.
+    '''
+    def __init__(self, filePtr):
+        self.lines = iterLines(filePtr)
+        self.materialKeys = []
+        self.keyIndex = {}
+        self.lineNumber = 0
+
+    def faceKey(self, textureName, materialName):
+        key = (textureName, materialName)
+        index = self.keyIndex.get(key)
+        if index is None:
+            index = len(self.materialKeys)
+            self.materialKeys.append(key)
+            self.keyIndex[key] = index
+        return index
+
+    def error(self, message):
+        return BITxtError("Line {0}: {1}".format(self.lineNumber, message))
+
+    def read(self):
+        ''' Yields a BITxtLod for every :lod of the file '''
+        lod = None
+        state = None
+        face = None
+        selection = None
+
+        for line in self.lines:
+            self.lineNumber += 1
+            stripped = line.strip()
+            if len(stripped) == 0:
+                continue
+
+            if stripped[0] == ':':
+                # Section keyword. A face ends with the next keyword
+                if face is not None:
+                    lod.faceKeys.append(self.faceKey(*face))
+                    face = None
+
+                keyword = stripped.split(None, 1)[0]
+                if keyword == ':lod':
+                    if lod is not None:
+                        yield lod
+                    lod = BITxtLod(float(stripped.split()[1]))
+                    state = None
+                elif keyword == ':end':
+                    break
+                elif keyword in (':header', ':object'):
+                    state = keyword
+                elif lod is None:
+                    raise self.error("{0} outside of a :lod".format(keyword))
+                elif keyword == ':points':
+                    state = keyword
+                elif keyword == ':face':
+                    state = keyword
+                    face = ["", ""]
+                elif keyword == ':edges':
+                    state = keyword
+                elif keyword == ':selection':
+                    state = keyword
+                    selection = BITxtSelection(quotedName(stripped), lod.numPoints)
+                    lod.selections.append(selection)
+                elif keyword == ':mass':
+                    # The point count is known by now
+                    state = keyword
+                    lod.mass = np.zeros(lod.numPoints, dtype=np.float32)
+                    massCount = 0
+                else:
+                    print("BITxt import: skipping unknown section {0} (line {1})".format(keyword, self.lineNumber))
+                    state = None
+                continue
+
+            if state == ':points':
+                x, y, z = stripped.split()[:3]
+                lod.points.extend((float(x), float(y), float(z)))
+            elif state == ':face':
+                tag, _, rest = stripped.partition(" ")
+                if tag == 'index':
+                    indices = [int(i) - 1 for i in rest.split()]
+                    lod.sides.append(len(indices))
+                    lod.loopVerts.extend(indices)
+                elif tag == 'uv':
+                    lod.uvs.extend(float(v) for v in rest.split())
+                elif tag == 'texture':
+                    face[0] = quotedName(stripped)
+                elif tag == 'material':
+                    face[1] = quotedName(stripped)
+            elif state == ':edges':
+                lod.sharpEdges.frombytes(np.fromstring(stripped, dtype=np.int32, sep=' ').tobytes())
+            elif state == ':selection':
+                index, weight = stripped.split()[:2]
+                selection.indices.append(int(index) - 1)
+                selection.weights.append(float(weight))
+            elif state == ':mass':
+                values = np.fromstring(stripped, dtype=np.float32, sep=' ')
+                if massCount + len(values) > len(lod.mass):
+                    raise self.error("More mass values than points")
+                lod.mass[massCount:massCount + len(values)] = values
+                massCount += len(values)
+
+        if face is not None:
+            lod.faceKeys.append(self.faceKey(*face))
+        if lod is not None:
+            yield lod
+
+###
+##  Blender side
+#
+
+def buildMesh(name, lod):
+    ''' Mesh from the point and face arrays of a BITxtLod '''
+    numPoints = lod.numPoints
+    sides = np.frombuffer(lod.sides, dtype=np.uint8).astype(np.int32)
+    loopVerts = np.frombuffer(lod.loopVerts, dtype=np.int32)
+    if len(loopVerts) > 0 and (loopVerts.min() < 0 or loopVerts.max() >= numPoints):
+        raise BITxtError("Face refers to a point that doesn't exist in lod {0}".format(lod.resolution))
+
+    mesh = bpy.data.meshes.new(name=name)
+    mesh.vertices.add(numPoints)
+    # Points are in millimetres
+    mesh.vertices.foreach_set("co", np.frombuffer(lod.points, dtype=np.float64) / 1000.0)
+    mesh.loops.add(len(loopVerts))
+    mesh.loops.foreach_set("vertex_index", loopVerts)
+    mesh.polygons.add(len(sides))
+    loopStart = np.zeros(len(sides), dtype=np.int32)
+    np.cumsum(sides[:-1], out=loopStart[1:])
+    mesh.polygons.foreach_set("loop_start", loopStart)
+    # Computed from loop_start in newer Blender versions
+    if not mesh.polygons.bl_rna.properties["loop_total"].is_readonly:
+        mesh.polygons.foreach_set("loop_total", sides)
+
+    mesh.update(calc_edges=True)
+
+    uvs = np.frombuffer(lod.uvs, dtype=np.float32)
+    if len(uvs) == 2 * len(loopVerts) and len(uvs) > 0:
+        layer = mesh.uv_layers.new(name="UVMap")
+        layer.data.foreach_set("uv", uvs)
+    return mesh
+
+def setMaterials(mesh, lod, materialKeys, materialData):
+    ''' Assign the materials of the faces, one slot per texture/rvmat combination '''
+    slots = {}
+    keyToSlot = np.zeros(max(len(materialKeys), 1), dtype=np.int32)
+    for key in np.unique(np.frombuffer(lod.faceKeys, dtype=np.int32)).tolist():
+        mat = getMaterial(materialData, *materialKeys[key])
+        if mat is None:
+            continue
+        if mat.name not in slots:
+            mesh.materials.append(mat)
+            slots[mat.name] = len(mesh.materials) - 1
+        keyToSlot[key] = slots[mat.name]
+    if len(lod.faceKeys) == len(mesh.polygons):
+        mesh.polygons.foreach_set("material_index", keyToSlot[np.frombuffer(lod.faceKeys, dtype=np.int32)])
+
+def setVertexMass(obj, mass):
+    obj.armaObjProps.mass = float(mass.sum())
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    bm.verts.ensure_lookup_table()
+
+    weight_layer = bm.verts.layers.float.new('FHQWeights')
+    for v, w in zip(bm.verts, mass.tolist()):
+        v[weight_layer] = w
+
+    bm.to_mesh(obj.data)
+    bm.free()
+
+def createLodObject(coll, objName, lod, materialKeys, materialData):
+    meshName = objName + "_" + resolutionName(lod.resolution)
+    mesh = buildMesh(meshName, lod)
+    obj = bpy.data.objects.new(meshName, mesh)
+    coll.objects.link(obj)
+
+    setMaterials(mesh, lod, materialKeys, materialData)
+
+    for sel in lod.selections:
+        addSelection(obj, sel)
+
+    if len(lod.sharpEdges) > 1:
+        edges = np.frombuffer(lod.sharpEdges, dtype=np.int32)
+        setSharpEdges(mesh, edges[:len(edges) // 2 * 2].reshape(-1, 2))
+
+    mesh.polygons.foreach_set("use_smooth", np.ones(len(mesh.polygons), dtype=bool))
+    maybeAddEdgeSplit(obj)
+
+    setLodProperties(obj, lod.resolution)
+
+    if lod.mass is not None and len(lod.mass) > 0:
+        setVertexMass(obj, lod.mass)
+
+    if obj.armaObjProps.lod == '1.000e+13' or obj.armaObjProps.lod == '4.000e+13':
+        ArmaTools.attemptFixMassLod(obj)
+
+    return obj
+
+def importBITxt(context, fileName):
+    '''
+    Import all LODs of a BITxt file into a new collection named after the
+    file. Returns the created objects.
+    '''
+    objName = path.basename(fileName).split(".")[0]
+    coll = bpy.data.collections.new(objName)
+    context.scene.collection.children.link(coll)
+
+    # texture/rvmat combination -> material, shared by all LODs
+    materialData = {}
+    objects = []
+    with open(fileName, "r", encoding="utf-8", errors="replace") as filePtr:
+        reader = BITxtReader(filePtr)
+        for lod in reader.read():
+            objects.append(createLodObject(coll, objName, lod, reader.materialKeys, materialData))
+            print("BITxt import: lod {0}, {1} points, {2} faces".format(
+                lod.resolution, lod.numPoints, len(lod.sides)))
+    return objects
@@ -9,8 +9,10 @@ Write the current object(s) into a BITxt file
 '''
 
 import bpy
+import bmesh
 import os
 import math
+import numpy as np
 
 def stripAddonPath(path):
     if path == "" or path == None: 
@@ -24,37 +26,213 @@ def stripAddonPath(path):
         return path
     
     
-def getMaterialInfo(face, obj):
+def getSlotMaterialInfo(material):
     textureName = ""
     materialName = ""
-    
-    if face.material_index >= 0 and face.material_index < len(obj.material_slots):
-        material = obj.material_slots[face.material_index].material
-        texType = material.armaMatProps.texType;
-    
-        if texType == 'Texture':
-            textureName = material.armaMatProps.texture;
-            textureName = stripAddonPath(textureName);
-        elif texType == 'Custom':
-            textureName = material.armaMatProps.colorString;
-        elif texType == 'Color':
-            textureName = "#(argb,8,8,3)color({0:.3f},{1:.3f},{2:.3f},1.0,{3})".format( 
-                material.armaMatProps.colorValue.r, 
-                material.armaMatProps.colorValue.g, 
-                material.armaMatProps.colorValue.b, 
-                material.armaMatProps.colorType)
-
-        materialName = stripAddonPath(material.armaMatProps.rvMat)
-        
-    
+
+    if material is None:
+        return (materialName, textureName)
+
+    texType = material.armaMatProps.texType;
+
+    if texType == 'Texture':
+        textureName = material.armaMatProps.texture;
+        textureName = stripAddonPath(textureName);
+    elif texType == 'Custom':
+        textureName = material.armaMatProps.colorString;
+    elif texType == 'Color':
+        textureName = "#(argb,8,8,3)color({0:.3f},{1:.3f},{2:.3f},1.0,{3})".format( 
+            material.armaMatProps.colorValue.r, 
+            material.armaMatProps.colorValue.g, 
+            material.armaMatProps.colorValue.b, 
+            material.armaMatProps.colorType)
+
+    materialName = stripAddonPath(material.armaMatProps.rvMat)
+
     return (materialName, textureName)
 
+def getMaterialInfo(face, obj):
+    if face.material_index >= 0 and face.material_index < len(obj.material_slots):
+        return getSlotMaterialInfo(obj.material_slots[face.material_index].material)
+    return ("", "")
+
 def lodKey(obj):
     if obj.armaObjProps.lod == "-1.0":
         return obj.armaObjProps.lodDistance
     else:
         return float(obj.armaObjProps.lod)
 
+###
+##  Mesh arrays
+#
+#   Everything below reads the mesh with foreach_get and formats whole
+#   sections with one preformatted format string per block of rows, so a
+#   LOD is written in a few large writes instead of one per number.
+
+WRITE_BLOCK_VALUES = 1 << 20
+
+def writeFormatted(file, rowFormat, values):
+    ''' Write the rows of a 2D array, each formatted with rowFormat, in blocks of about WRITE_BLOCK_VALUES values '''
+    rows = len(values)
+    if rows == 0:
+        return
+    values = values.reshape(rows, -1)
+    blockRows = max(1, WRITE_BLOCK_VALUES // max(values.shape[1], 1))
+    blockFormat = rowFormat * blockRows
+    for start in range(0, rows, blockRows):
+        block = values[start:start + blockRows]
+        fmt = blockFormat if len(block) == blockRows else rowFormat * len(block)
+        file.write(fmt % tuple(block.ravel().tolist()))
+
+def formatLiteral(text):
+    return text.replace("%", "%%")
+
+def getVertices(mesh):
+    co = np.zeros(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+def getLoopVertices(mesh):
+    loopVerts = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loopVerts)
+    return loopVerts
+
+def getLoopUVs(mesh, layer):
+    ''' (loops, 2) uv coordinates of a uv layer, zeros if there is none '''
+    uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+    if layer is not None:
+        layer.data.foreach_get("uv", uvs)
+    return uvs.reshape(-1, 2)
+
+def getPolygons(mesh):
+    ''' loop_start, loop_total, material_index and use_smooth of all polygons '''
+    numPolys = len(mesh.polygons)
+    loopStart = np.zeros(numPolys, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loopStart)
+    sides = np.zeros(numPolys, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", sides)
+    matIndex = np.zeros(numPolys, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", matIndex)
+    smooth = np.zeros(numPolys, dtype=bool)
+    mesh.polygons.foreach_get("use_smooth", smooth)
+    return loopStart, sides, matIndex, smooth
+
+def lodFaces(mesh, loopStart, sides, matIndex):
+    '''
+    The faces as they are written: triangles and quads as they are, n-gons
+    split into their loop triangles. Returns a list of (material index,
+    loops) with loops an (n, corners) array of loop indices, one entry per
+    material and corner count, polygon order within each entry.
+    '''
+    parts = []
+    for corners in (3, 4):
+        polys = np.flatnonzero(sides == corners)
+        parts.append((corners, polys, loopStart[polys, None] + np.arange(corners, dtype=np.int32)))
+
+    ngon = sides > 4
+    if ngon.any():
+        mesh.calc_loop_triangles()
+        numTris = len(mesh.loop_triangles)
+        triPoly = np.zeros(numTris, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("polygon_index", triPoly)
+        triLoops = np.zeros(numTris * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("loops", triLoops)
+        keep = ngon[triPoly]
+        polys, loops = parts[0][1:]
+        polys = np.concatenate((polys, triPoly[keep]))
+        loops = np.concatenate((loops, triLoops.reshape(-1, 3)[keep]))
+        order = np.argsort(polys, kind='stable')
+        parts[0] = (3, polys[order], loops[order])
+
+    faces = []
+    for corners, polys, loops in parts:
+        mats = matIndex[polys]
+        for mat in np.unique(mats).tolist():
+            faces.append((mat, loops[mats == mat]))
+    faces.sort(key=lambda f: (f[0], f[1].shape[1]))
+    return faces
+
+def getSharpEdges(mesh, loopVerts, loopStart, sides, smooth):
+    ''' Edges of the flat shaded faces plus the edges marked sharp, (n, 2) with the smaller index first '''
+    flat = ~smooth
+    counts = sides[flat]
+    first = np.repeat(loopStart[flat], counts)
+    total = np.repeat(counts, counts)
+    corner = np.arange(len(first), dtype=np.int32) - np.repeat(np.cumsum(counts) - counts, counts)
+    faceEdges = np.stack((loopVerts[first + corner], loopVerts[first + (corner + 1) % total]), axis=1)
+
+    edgeVerts = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edgeVerts)
+    sharp = np.zeros(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get("use_edge_sharp", sharp)
+
+    edges = np.sort(np.concatenate((faceEdges.reshape(-1, 2), edgeVerts.reshape(-1, 2)[sharp])), axis=1)
+
+    # Pack each edge into a single int64 key, so removing the doubles is a
+    # one dimensional unique instead of comparing pairs
+    stride = max(len(mesh.vertices), 1)
+    keys = np.unique(edges[:, 0].astype(np.int64) * stride + edges[:, 1])
+    return np.stack((keys // stride, keys % stride), axis=1)
+
+def getGroupIndex(obj, mesh):
+    '''
+    Inverted vertex group index, built in one pass over the vertices: a list
+    with one (vertex indices, weights) pair of arrays per vertex group.
+    '''
+    numGroups = len(obj.vertex_groups)
+    verts = [[] for i in range(numGroups)]
+    weights = [[] for i in range(numGroups)]
+    for vertex in mesh.vertices:
+        index = vertex.index
+        for group in vertex.groups:
+            if group.group < numGroups:
+                verts[group.group].append(index)
+                weights[group.group].append(group.weight)
+    return [(np.array(v, dtype=np.int64), np.array(w, dtype=np.float64)) for v, w in zip(verts, weights)]
+
+def getVertexMass(obj, mesh):
+    '''
+    Per vertex mass from the FHQWeights layer. Objects without one get their
+    armaObjProps.mass spread evenly over the vertices.
+    '''
+    numVerts = len(mesh.vertices)
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    if 'FHQWeights' not in bm.verts.layers.float.keys():
+        bm.free()
+        return np.full(numVerts, obj.armaObjProps.mass / max(numVerts, 1), dtype=np.float64)
+    weight_layer = bm.verts.layers.float['FHQWeights']
+    mass = np.array([v[weight_layer] for v in bm.verts], dtype=np.float64)
+    bm.free()
+    return mass
+
+class MeshArrays:
+    '''
+    Everything the BITxt, uvset and control outputs need from one object,
+    read once: loop vertices, polygon arrays, the faces in output order and
+    the uvs of every uv layer, with NaNs replaced by 0. The writers only
+    read these arrays.
+    '''
+    def __init__(self, obj):
+        mesh = obj.data
+        self.obj = obj
+        self.mesh = mesh
+        self.loopVerts = getLoopVertices(mesh)
+        self.loopStart, self.sides, self.matIndex, self.smooth = getPolygons(mesh)
+        self.faces = lodFaces(mesh, self.loopStart, self.sides, self.matIndex)
+        self.numFaces = sum(len(loops) for mat, loops in self.faces)
+        self.uvLayers = [getLoopUVs(mesh, layer).astype(np.float64) for layer in mesh.uv_layers]
+        for layer, uvs in zip(mesh.uv_layers, self.uvLayers):
+            nan = np.isnan(uvs)
+            if nan.any():
+                print("*** WARNING ***\nNaN uv coordinates for %d face corners in %s, uv layer %s" % (
+                    nan.any(axis=1).sum(), obj.name, layer.name))
+                uvs[nan] = 0.0
+        if len(self.uvLayers) > 0:
+            self.uvs = self.uvLayers[max(mesh.uv_layers.active_index, 0)]
+        else:
+            self.uvs = np.zeros((len(mesh.loops), 2), dtype=np.float64)
+
 def exportBITxt(file, ctrlFile, uvsetFile, selectedOnly = False, mergeLods = True):
     '''
     Export to file. 
@@ -102,20 +280,17 @@ def exportBITxt(file, ctrlFile, uvsetFile, selectedOnly = False, mergeLods = Tru
     hasUVSets = 0
     for obj in objects:
         if previous_lod != lodKey(obj) or mergeLods == False:
-            export_lod_list(file, work_list)
-            if export_lod_uvsets(uvsetFile, work_list, lodIdx) == True:
+            lodIdx, flag = export_lod(file, ctrlFile, uvsetFile, work_list, lodIdx)
+            if flag == True:
                 hasUVSets = hasUVSets + 1
-            lodIdx = export_ctrl(ctrlFile, work_list, lodIdx)
             work_list = []
             previous_lod = lodKey(obj)
         work_list.append(obj)
         
     # need to flush whatever is left
-    if len(work_list) != 0:
-        export_lod_list(file, work_list)
-        if export_lod_uvsets(uvsetFile, work_list, lodIdx) == True:
-                hasUVSets = hasUVSets + 1
-        lodIdx = export_ctrl(ctrlFile, work_list, lodIdx)
+    lodIdx, flag = export_lod(file, ctrlFile, uvsetFile, work_list, lodIdx)
+    if flag == True:
+        hasUVSets = hasUVSets + 1
         
     file.write("\n:end")
     if hasUVSets > 0:
@@ -124,37 +299,45 @@ def exportBITxt(file, ctrlFile, uvsetFile, selectedOnly = False, mergeLods = Tru
     else:
         return False
 
-def export_lod_uvsets(uvsetFile, list, lodIdx):
-    flag = False
+def export_lod(file, ctrlFile, uvsetFile, list, lodIdx):
+    '''
+    Write one LOD to all three outputs. The meshes are read once into
+    MeshArrays and shared. Returns the next LOD index and whether there
+    were additional uv sets.
+    '''
     if len(list) == 0:
+        return lodIdx, False
+    arrays = [MeshArrays(obj) for obj in list]
+    export_lod_list(file, arrays)
+    flag = export_lod_uvsets(uvsetFile, arrays, lodIdx)
+    return export_ctrl(ctrlFile, list, lodIdx), flag
+
+def export_lod_uvsets(uvsetFile, arrays, lodIdx):
+    flag = False
+    if len(arrays) == 0:
         return flag
     
     uvsetFile.write(str(lodIdx) + "\n")
 
-    for obj in list:
-        mesh = obj.data      
+    for data in arrays:
         # Write the UVSets
-        uvt = mesh.uv_layers
-        if len(uvt)>1:
+        if len(data.uvLayers)>1:
             flag = True
-        uvsetFile.write(str(len(uvt)) + "\n")
-        for uvset in range(0, len(uvt)):
-            layer = uvt[uvset]
-            uvsetFile.write(str(len(mesh.tessfaces)) + "\n")
-            for i, face in enumerate(mesh.tessfaces):
-                codeSnip = "faceIndex = %d;" % (i)
-                uvArray = []
-                for vertIdx in range(0,len(face.vertices)):
-                    uvPair = [0,0]
-                    try: 
-                        uvPair = [uvPair for uvPair in mesh.tessface_uv_textures[uvset].data[face.index].uv[vertIdx]]
-                    except:
-                        pass
-                    ##uvsetFile.write(str(uvPair[0]) + "\n" + str(uvPair[1]) + "\n")
-                    uvArray = uvArray + [uvPair[0], 1-uvPair[1]]
-                codeSnip = codeSnip + "faceArray = " + str(uvArray) + ";\n" 
-                uvsetFile.write(codeSnip)
-                    
+        uvsetFile.write(str(len(data.uvLayers)) + "\n")
+        for uvs in data.uvLayers:
+            uvs = uvs.copy()
+            uvs[:, 1] = 1 - uvs[:, 1]
+            uvsetFile.write(str(data.numFaces) + "\n")
+
+            # One script line per face, in the order of the :face blocks.
+            # %r gives the same digits str() of the list used to
+            faceIndex = 0
+            for mat, loops in data.faces:
+                corners = loops.shape[1]
+                lineFormat = "faceIndex = %d;faceArray = [" + ", ".join(["%r"] * (2 * corners)) + "];\n"
+                indices = np.arange(faceIndex, faceIndex + len(loops), dtype=np.float64)
+                writeFormatted(uvsetFile, lineFormat, np.hstack((indices[:, None], uvs[loops].reshape(len(loops), -1))))
+                faceIndex = faceIndex + len(loops)
     
     return flag
 
@@ -174,10 +357,11 @@ def export_ctrl(file, list, index):
     
     return index+1               
             
-def export_lod_list(file, list):
-    ''' export a list of objects with a common lod into the output file'''
-    if len(list) == 0:
+def export_lod_list(file, arrays):
+    ''' export the MeshArrays of objects with a common lod into the output file'''
+    if len(arrays) == 0:
         return
+    list = [data.obj for data in arrays]
     #print("debug: export_lod_list, list has " + str(len(list)) + " elements\n")
     #for obj in list:
     #    print ("debug: object " + obj.name)
@@ -201,76 +385,40 @@ def export_lod_list(file, list):
     for obj in list:
         bases[obj] = base_index
         mesh = obj.data
-        for vert in mesh.vertices:
-            file.write("{0:.4f} {1:.4f} {2:.4f}\n".format(
-                 vert.co.x * 1000.0, vert.co.y * 1000.0, vert.co.z * 1000.0))
-            base_index = base_index + 1
+        writeFormatted(file, "%.4f %.4f %.4f\n", getVertices(mesh).astype(np.float64) * 1000.0)
+        base_index = base_index + len(mesh.vertices)
             
     # :face's
-    for obj in list:
+    edgeLists = []
+    for data in arrays:
+        obj = data.obj
         base = bases[obj]
-        mesh = obj.data
-        mesh.calc_tessface() # In case there's n-gons left
-        #print("outputting faces, " + str(len(mesh.tessfaces)) + " to go")
-        for face in mesh.tessfaces:
-            file.write(":face\n")
-            materialName, textureName = getMaterialInfo(face, obj)
-            file.write("index ")
-            verts = (face.vertices)
-            for vertIdx in verts:
-                file.write(str(1 + vertIdx + base)) # Indices in the text format are 1-based
-                file.write(" ")
-            
-            file.write("\nuv ")
-            for vertIdx in (range(len(face.vertices))):
-                uvPair = [0,0]
-                try: 
-                    uvPair = [uvPair for uvPair in mesh.tessface_uv_textures.active.data[face.index].uv[vertIdx]]
-                except:
-                    pass
-                
-                if math.isnan(uvPair[0]) or math.isnan(uvPair[1]):
-                    print("*** WARNING ***\nNaN uv coordinates for face in lod %d" % (lod))
-                    uvPair[0] = 0.0;
-                    uvPair[1] = 0.0;
-                
-                file.write ("{0:.4f} {1:.4f} ".format(uvPair[0], uvPair[1]))
-            file.write("\n")
-            
+        mesh = data.mesh
+        loopVerts = data.loopVerts
+
+        uvs = data.uvs
+
+        slotInfo = [getSlotMaterialInfo(slot.material) for slot in obj.material_slots]
+        for mat, loops in data.faces:
+            corners = loops.shape[1]
+            materialName, textureName = slotInfo[mat] if mat >= 0 and mat < len(slotInfo) else ("", "")
+            faceFormat = ":face\nindex " + "%d " * corners + "\nuv " + "%.4f %.4f " * corners + "\n"
             if len(textureName) > 0:
-                file.write("texture \"" + textureName + "\"\n")
+                faceFormat += "texture \"" + formatLiteral(textureName) + "\"\n"
             if len(materialName) > 0:
-                file.write("material \"" + materialName + "\"\n")
+                faceFormat += "material \"" + formatLiteral(materialName) + "\"\n"
 
-                
+            # Indices in the text format are 1-based
+            indices = loopVerts[loops].astype(np.float64) + (1 + base)
+            writeFormatted(file, faceFormat, np.hstack((indices, uvs[loops].reshape(len(loops), -1))))
+
+        edgeLists.append(getSharpEdges(mesh, loopVerts, data.loopStart, data.sides, data.smooth) + base)
         
     file.write("\n:edges\n")
     # Indices of the edge-list are zero-based... well doh
-    for obj in list:
-        base = bases[obj]
-        mesh = obj.data
-        mesh.calc_tessface() # Dunno if that is actually needed at all
-        
-        mesh = obj.data
-
-        # Unfortunately, there does't seem to be a better way to do this.
-        # First, gather the edges of the flat shaded faces.
-        edges = [edge for face in mesh.tessfaces if not face.use_smooth for edge in face.edge_keys]
-        edges = sorted(set(edges))
-        
-        # Gather the edges with the "sharp" flag set
-        edges2 = [edge for edge in mesh.edges if edge.use_edge_sharp]
-        
-        # We need to go through the edges to find the doubles.
-        for edge in edges2:
-            v1 = edge.vertices[0]
-            v2 = edge.vertices[1]
-            if not (v1, v2) in edges and not (v2, v1) in edges:
-                edges = edges + [(v1, v2)]
-        
-        # write them out, on a single line
-        for edge in edges:
-            file.write("{0} {1} ".format(edge[0]+base, edge[1]+base))
+    # write them out, on a single line
+    for edges in edgeLists:
+        writeFormatted(file, "%d %d ", edges)
             
     file.write("\n");
     
@@ -278,38 +426,16 @@ def export_lod_list(file, list):
     # Selections are again one-based
     for obj in list:
         mesh = obj.data
-        grpIndex = 0
         base = bases[obj]
-        for group in obj.vertex_groups:
-            name = group.name
-            
+        groupIndex = getGroupIndex(obj, mesh)
+        for group, (verts, weights) in zip(obj.vertex_groups, groupIndex):
             file.write(":selection \"" + group.name + "\"\n")
-            
-            for vert in mesh.vertices:
-                inGroups = [grp for grp in vert.groups if grp.group == grpIndex]
-                if len(inGroups) != 0:
-                    # Can only have at most one group here that matches the index
-                    file.write("{0} {1:.3f}\n".format(vert.index + base + 1, inGroups[0].weight))
-            grpIndex = grpIndex + 1        
+            writeFormatted(file, "%d %.3f\n", np.stack((verts + (base + 1), weights), axis=1))
     
     # Mass
     # If this is a geometry LOD, write a mass
     if lod == 1.000e+13:
-        totalMass = 0
-        totalVerts = 0
-        for obj in list:
-            totalMass = totalMass + obj.armaObjProps.mass          
-            totalVerts = totalVerts + len(obj.data.vertices)  
-        
-        perVertMass = totalMass / totalVerts
         file.write(":mass\n")    
-        
         for obj in list:
-            mesh = obj.data
-            base = bases[obj]
-            for vert in mesh.vertices:
-                weight = 1.0 #FIXME: This is probably wrong
-                file.write("{0:.3f} ".format(weight * perVertMass))
-
-                 
-        file.write("\n")
\ No newline at end of file
+            writeFormatted(file, "%.3f ", getVertexMass(obj, obj.data))
+        file.write("\n")
@@ -0,0 +1,225 @@
+'''
+Created on 19.10.2026
+
+Headless batch export of P3D files, for use on build servers.
+
+Run inside Blender, for example
+
+    blender -b model.blend --python BatchExport.py -- --output P:\\out
+
+or, with the add-on enabled,
+
+    blender -b model.blend --python-expr "import BatchExport; BatchExport.main()" -- --output P:\\out
+
+Every collection containing Arma objects is written to <output>/<collection>.p3d
+through the same exportMDL path the export operator uses. A JSON summary is
+printed at the end and optionally written to a file (--summary).
+
+With --rtm, the actions of every Arma armature are exported instead, to
+<output>/<armature>/<action>.rtm (see RTMExporter.exportActions):
+
+    blender -b anims.blend --python BatchExport.py -- --rtm --action "walk_*" --output P:\\anims
+
+'''
+import sys, os
+sys.path.append(os.path.dirname(__file__))
+
+import bpy
+import json
+import time
+import fnmatch
+import argparse
+
+ADDON_NAME = "ArmaToolbox"
+
+def ensureAddon():
+    # Properties are only there when the add-on is registered. When run with
+    # --factory-startup (or the add-on isn't enabled in the user preferences),
+    # enable it for this session.
+    if not hasattr(bpy.types.Object, "armaObjProps"):
+        import addon_utils
+        addon_utils.enable(ADDON_NAME, default_set=False)
+
+def lodMatches(obj, lodFilter):
+    '''
+    True if the object's LOD is selected by lodFilter. Filter entries can
+    be LOD preset keys ("1.000e+13"), preset names ("Geometry") or
+    resolutions of graphical LODs ("1.0").
+    '''
+    from MDLexporter import lodKey
+    from properties import lodName
+
+    if lodFilter is None or len(lodFilter) == 0:
+        return True
+
+    key = lodKey(obj)
+    name = lodName(abs(key))
+    for f in lodFilter:
+        try:
+            if float(f) == key:
+                return True
+        except ValueError:
+            if name is not None and name.lower() == f.lower():
+                return True
+    return False
+
+def exportableObjects(collection, lodFilter):
+    viewLayerObjects = bpy.context.view_layer.objects
+    return [obj
+            for obj in collection.all_objects
+                if obj.type == 'MESH'
+                    and obj.armaObjProps.isArmaObject
+                    and obj.name in viewLayerObjects
+                    and lodMatches(obj, lodFilter)
+           ]
+
+def batchExportCollections(outputDir, lodFilter=None, applyModifiers=True, mergeSameLOD=False,
+                           collections=None, o2Script=None):
+    '''
+    Export every collection of the current file into outputDir. collections
+    is an optional list of fnmatch patterns for the collection names.
+    Returns a summary dictionary.
+    '''
+    from MDLexporter import exportMDL, lodCount, convertWithO2Script
+
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    os.makedirs(outputDir, exist_ok=True)
+
+    summary = {
+        "blend": bpy.data.filepath,
+        "files": [],
+        "errors": [],
+    }
+    totalStart = time.perf_counter()
+
+    for col in bpy.data.collections:
+        if collections and not any(fnmatch.fnmatch(col.name, pat) for pat in collections):
+            continue
+
+        objects = exportableObjects(col, lodFilter)
+        if len(objects) == 0:
+            continue
+
+        fileName = os.path.join(outputDir, col.name + ".p3d")
+        start = time.perf_counter()
+        try:
+            exportMDL(None, fileName, objects, applyModifiers, mergeSameLOD)
+            if o2Script:
+                convertWithO2Script(o2Script, fileName)
+        except Exception as e:
+            summary["errors"].append({"collection": col.name, "error": str(e)})
+            continue
+
+        summary["files"].append({
+            "collection": col.name,
+            "file": fileName,
+            "lods": lodCount(objects, mergeSameLOD),
+            "bytes": os.path.getsize(fileName),
+            "seconds": time.perf_counter() - start,
+        })
+
+    summary["seconds"] = time.perf_counter() - totalStart
+    return summary
+
+def batchExportActions(outputDir, armatures=None, actions=None, frameMode='KEYS', sampleAction=True):
+    '''
+    Export the actions of every Arma armature into outputDir/<armature>.
+    armatures and actions are optional lists of fnmatch patterns. Returns
+    a summary dictionary.
+    '''
+    from RTMExporter import exportActions, armatureActions
+
+    if bpy.context.object is not None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    summary = {
+        "blend": bpy.data.filepath,
+        "files": [],
+        "errors": [],
+    }
+    totalStart = time.perf_counter()
+
+    for obj in bpy.context.view_layer.objects:
+        if obj.type != 'ARMATURE' or not obj.armaObjProps.isArmaObject:
+            continue
+        if armatures and not any(fnmatch.fnmatch(obj.name, pat) for pat in armatures):
+            continue
+
+        objActions = armatureActions(obj, actions)
+        if len(objActions) == 0:
+            continue
+
+        # exportActions works on the active object like the operator does
+        bpy.context.view_layer.objects.active = obj
+        results, errors = exportActions(bpy.context, os.path.join(outputDir, obj.name),
+                                        objActions, frameMode, sampleAction)
+
+        for r in results:
+            r["armature"] = obj.name
+            r["bytes"] = os.path.getsize(r["file"])
+        for e in errors:
+            e["armature"] = obj.name
+        summary["files"] += results
+        summary["errors"] += errors
+
+    summary["seconds"] = time.perf_counter() - totalStart
+    return summary
+
+def scriptArguments():
+    # Blender passes everything after "--" through to the script
+    argv = sys.argv
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    return []
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="BatchExport", description="Export P3D or RTM files from a .blend file")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--lod", action="append", dest="lods",
+                        help="Only export this LOD (preset key, preset name or resolution). Can be repeated")
+    parser.add_argument("--collection", action="append", dest="collections",
+                        help="Only export collections matching this pattern. Can be repeated")
+    parser.add_argument("--merge", action="store_true", help="Merge objects with the same LOD")
+    parser.add_argument("--no-modifiers", action="store_true", help="Do not apply modifiers before export")
+    parser.add_argument("--o2script", default=None, help="Run the result through this O2Script binary")
+    parser.add_argument("--rtm", action="store_true", help="Export the armatures' actions as RTM files instead")
+    parser.add_argument("--armature", action="append", dest="armatures",
+                        help="With --rtm, only export armatures matching this pattern. Can be repeated")
+    parser.add_argument("--action", action="append", dest="actions",
+                        help="With --rtm, only export actions matching this pattern. Can be repeated")
+    parser.add_argument("--frames", choices=("KEYS", "ALL", "LIST"), default="KEYS",
+                        help="With --rtm, export the keyed frames, all frames or the RTM keyframe list of each action")
+    parser.add_argument("--no-sampling", action="store_true",
+                        help="With --rtm, evaluate the scene for every frame instead of sampling the action")
+    parser.add_argument("--summary", default=None, help="Write the JSON summary to this file")
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArguments(scriptArguments())
+    ensureAddon()
+
+    if args.rtm:
+        summary = batchExportActions(args.output,
+                                     armatures=args.armatures,
+                                     actions=args.actions,
+                                     frameMode=args.frames,
+                                     sampleAction=not args.no_sampling)
+    else:
+        summary = batchExportCollections(args.output,
+                                         lodFilter=args.lods,
+                                         applyModifiers=not args.no_modifiers,
+                                         mergeSameLOD=args.merge,
+                                         collections=args.collections,
+                                         o2Script=args.o2script)
+
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(text)
+    print(text)
+    return summary
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+'''
+Created on 19.10.2026
+
+Run BatchExport over a directory of .blend files, one Blender process per
+file and as many processes in parallel as there are CPU cores.
+
+    python BatchExportDriver.py --blender /path/to/blender --input P:\\models --output P:\\out
+
+Each .blend file is exported into its own sub directory of the output
+directory, at the same relative path as the file has in the input directory
+(P:\\models\\a\\car.blend goes to P:\\out\\a\\car). The per-file summaries
+written by BatchExport are collected into one JSON report. This script does
+not need Blender's Python.
+
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BatchExport.py")
+
+def findBlendFiles(inputDir, recursive=True):
+    blendFiles = []
+    for root, dirs, files in os.walk(inputDir):
+        for name in files:
+            if name.lower().endswith(".blend"):
+                blendFiles.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return sorted(blendFiles)
+
+def blendOutputDir(blendFile, inputDir, outputDir):
+    '''
+    Output directory of a .blend file: its path relative to inputDir,
+    without extension, under outputDir. Files of the same name in different
+    sub directories don't overwrite each other.
+    '''
+    relative = os.path.relpath(blendFile, inputDir) if inputDir else os.path.basename(blendFile)
+    return os.path.join(outputDir, os.path.splitext(relative)[0])
+
+def exportBlendFile(blender, blendFile, outputDir, exportArgs, inputDir=None):
+    fileOutput = blendOutputDir(blendFile, inputDir, outputDir)
+
+    fd, summaryName = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+
+    command = [blender, "-b", blendFile, "--addons", "ArmaToolbox",
+               "--python", EXPORT_SCRIPT, "--",
+               "--output", fileOutput, "--summary", summaryName] + exportArgs
+
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    except OSError as e:
+        # Blender could not be started, a failure of this file and not of the batch
+        os.remove(summaryName)
+        return {
+            "blend": blendFile,
+            "returncode": None,
+            "seconds": time.perf_counter() - start,
+            "error": str(e),
+        }
+    result = {
+        "blend": blendFile,
+        "returncode": proc.returncode,
+        "seconds": time.perf_counter() - start,
+    }
+
+    try:
+        with open(summaryName) as f:
+            result["summary"] = json.load(f)
+    except ValueError:
+        # Blender died before the summary was written
+        result["log"] = proc.stdout[-4000:]
+    finally:
+        os.remove(summaryName)
+
+    return result
+
+def exportBlendFiles(blender, blendFiles, outputDir, exportArgs, jobs=None, inputDir=None):
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # The work happens in the Blender processes, threads are only waiting on them
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(exportBlendFile, blender, blendFile, outputDir, exportArgs, inputDir)
+                   for blendFile in blendFiles]
+        return [f.result() for f in futures]
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="BatchExportDriver",
+                                     description="Export P3D files from a directory of .blend files")
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--input", required=True, help="Directory to search for .blend files")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of parallel Blender processes")
+    parser.add_argument("--no-recurse", action="store_true", help="Do not search sub directories")
+    parser.add_argument("--summary", default=None, help="Write the JSON report to this file")
+    return parser.parse_known_args(argv)
+
+def main(argv=None):
+    args, exportArgs = parseArguments(sys.argv[1:] if argv is None else argv)
+    blendFiles = findBlendFiles(args.input, not args.no_recurse)
+
+    start = time.perf_counter()
+    results = exportBlendFiles(args.blender, blendFiles, args.output, exportArgs, args.jobs, args.input)
+
+    report = {
+        "results": results,
+        "blendFiles": len(blendFiles),
+        "failed": [r["blend"] for r in results if r["returncode"] != 0 or "summary" not in r],
+        "seconds": time.perf_counter() - start,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(text)
+    print(text)
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+'''
+Created on 19.10.2026
+
+Benchmark of the import/export hot paths on synthetic data, run headless:
+
+    blender -b --factory-startup --python Benchmark.py -- --vertices 1000 10000 100000 --output bench.json
+
+Every scenario builds a scene from scratch: a visual LOD and a geometry LOD
+of about N vertices with K named selections, S sharp edges, U UV sets, M
+materials and P proxies, an armature of B bones with F keyframes and a
+square ASC heightfield. Each phase (exportMDL, importMDL, exportRTM,
+exportBITxt, importASC, exportASC) is timed over --repeat runs without
+tracing. Peak memory is the tracemalloc peak of one extra traced run, so it
+covers allocations made by Python and NumPy, but not Blender's own (C side)
+mesh data. The objects an import phase creates are removed between runs.
+
+With --baseline, results are compared against an earlier JSON file and
+phases that got slower than --threshold are listed.
+
+'''
+import sys, os
+sys.path.append(os.path.dirname(__file__))
+
+import bpy
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import traceback
+import tracemalloc
+import numpy as np
+
+from BatchExport import ensureAddon, scriptArguments
+
+###
+##  Synthetic data
+#
+
+def clearScene():
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+    for coll in (bpy.data.meshes, bpy.data.materials, bpy.data.armatures, bpy.data.actions):
+        for block in list(coll):
+            coll.remove(block)
+    for coll in list(bpy.data.collections):
+        bpy.data.collections.remove(coll)
+
+def gridMesh(name, numVerts):
+    ''' A roughly square grid of quads with about numVerts vertices '''
+    side = max(2, int(math.sqrt(numVerts)))
+    x, y = np.meshgrid(np.arange(side, dtype=np.float32), np.arange(side, dtype=np.float32))
+    z = np.sin(x * 0.3) * np.cos(y * 0.2)
+    co = np.stack((x.ravel(), y.ravel(), z.ravel()), axis=1) * 0.1
+
+    idx = np.arange(side * side).reshape(side, side)
+    quads = np.stack((idx[:-1, :-1], idx[:-1, 1:], idx[1:, 1:], idx[1:, :-1]), axis=-1).reshape(-1, 4)
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(co.tolist(), [], quads.tolist())
+    mesh.update(calc_edges=True)
+    return mesh
+
+def makeMaterials(numMaterials):
+    mats = []
+    for i in range(numMaterials):
+        mat = bpy.data.materials.new("bench_mat_%d" % i)
+        mat.armaMatProps.texType = 'Texture'
+        mat.armaMatProps.texture = "bench\\data\\texture_%d_co.paa" % i
+        mat.armaMatProps.rvMat = "bench\\data\\material_%d.rvmat" % i
+        mats.append(mat)
+    return mats
+
+def makeLodObject(name, lod, params, materials, rnd):
+    from ArmaProxy import CreateProxyPos
+    from mathutils import Vector
+
+    mesh = gridMesh(name, params.vertices)
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.armaObjProps.isArmaObject = True
+    obj.armaObjProps.lod = lod
+
+    numVerts = len(mesh.vertices)
+    numFaces = len(mesh.polygons)
+
+    for mat in materials:
+        mesh.materials.append(mat)
+    if len(materials) > 0:
+        mesh.polygons.foreach_set("material_index", np.arange(numFaces, dtype=np.int32) % len(materials))
+
+    for i in range(params.uvsets):
+        layer = mesh.uv_layers.new(name="UVSet %d" % i)
+        layer.data.foreach_set("uv", np.random.rand(len(mesh.loops) * 2).astype(np.float32))
+
+    sharp = np.zeros(len(mesh.edges), dtype=bool)
+    sharp[rnd.sample(range(len(mesh.edges)), min(params.sharp, len(mesh.edges)))] = True
+    mesh.edges.foreach_set("use_edge_sharp", sharp)
+
+    for i in range(params.selections):
+        vgrp = obj.vertex_groups.new(name="selection_%d" % i)
+        verts = rnd.sample(range(numVerts), numVerts // 10 or 1)
+        vgrp.add(verts, rnd.random(), 'REPLACE')
+
+    for i in range(params.proxies):
+        CreateProxyPos(obj, Vector((rnd.random(), rnd.random(), rnd.random())),
+                       "P:\\bench\\proxies\\proxy_%d.p3d" % (i % 5), i + 1)
+
+    if lod in ('1.000e+13', '4.000e+13'):
+        import bmesh
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        layer = bm.verts.layers.float.new('FHQWeights')
+        for v in bm.verts:
+            v[layer] = 1.0
+        bm.to_mesh(mesh)
+        bm.free()
+
+    return obj
+
+def makeArmature(numBones, numFrames):
+    arm = bpy.data.armatures.new("bench_armature")
+    obj = bpy.data.objects.new("bench_armature", arm)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.armaObjProps.isArmaObject = True
+    bpy.context.view_layer.objects.active = obj
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    parent = None
+    for i in range(numBones):
+        bone = arm.edit_bones.new("bone_%d" % i)
+        bone.head = (0, 0, i * 0.1)
+        bone.tail = (0, 0, (i + 1) * 0.1)
+        if parent is not None and i % 8 != 0:
+            bone.parent = parent
+        parent = bone
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    action = bpy.data.actions.new("bench_action")
+    obj.animation_data_create()
+    obj.animation_data.action = action
+
+    frames = np.arange(1, numFrames + 1, dtype=np.float32)
+    for pbone in obj.pose.bones:
+        pbone.rotation_mode = 'QUATERNION'
+        path = 'pose.bones["%s"].rotation_quaternion' % pbone.name
+        angle = np.random.rand(numFrames).astype(np.float32)
+        values = (np.cos(angle), np.sin(angle), np.zeros(numFrames), np.zeros(numFrames))
+        for index, v in enumerate(values):
+            fcurve = action.fcurves.new(path, index=index, action_group=pbone.name)
+            fcurve.keyframe_points.add(numFrames)
+            fcurve.keyframe_points.foreach_set("co", np.stack((frames, v), axis=1).astype(np.float32).ravel())
+            fcurve.update()
+
+    for f in range(1, numFrames + 1):
+        obj.armaObjProps.keyFrames.add().timeIndex = f
+
+    bpy.context.scene.frame_start = 1
+    bpy.context.scene.frame_end = numFrames
+    return obj
+
+def writeSyntheticASC(fileName, size):
+    x, y = np.meshgrid(np.arange(size), np.arange(size))
+    heights = 100 + 20 * np.sin(x * 0.05) * np.cos(y * 0.03)
+    with open(fileName, "w") as f:
+        f.write("ncols %d\nnrows %d\nxllcorner 200000\nyllcorner 0\ncellsize 10\nNODATA_value -9999\n" % (size, size))
+        np.savetxt(f, heights, fmt="%.3f")
+
+###
+##  Timing
+#
+
+def measure(function, repeat, cleanup=None):
+    '''
+    Run function once with tracemalloc for the peak memory, then repeat
+    times untraced for the timings (tracing slows Python code down several
+    times). cleanup runs before each timed run. Returns (min seconds,
+    median seconds, peak bytes, last result).
+    '''
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    result = None
+    for i in range(repeat):
+        if cleanup is not None:
+            cleanup()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[0], times[len(times) // 2], peak, result
+
+# Data blocks an import phase creates, removed again between its runs
+CREATED_DATA = ("objects", "meshes", "collections")
+
+def dataSnapshot():
+    return {attr: set(getattr(bpy.data, attr).keys()) for attr in CREATED_DATA}
+
+def removeCreatedData(snapshot):
+    ''' Remove the data blocks created since dataSnapshot() '''
+    for attr in CREATED_DATA:
+        blocks = getattr(bpy.data, attr)
+        for name in set(blocks.keys()) - snapshot[attr]:
+            blocks.remove(blocks[name])
+
+def fileSize(fileName):
+    return os.path.getsize(fileName) if os.path.exists(fileName) else 0
+
+def setActive(obj):
+    bpy.ops.object.select_all(action='DESELECT')
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+
+def runScenario(params, workDir, phases, repeat):
+    from MDLexporter import exportMDL
+    from MDLImporter import importMDL
+    from RTMExporter import exportRTM
+    from BITxtWriter import exportBITxt
+    from ASCImporter import importASC
+    from ASCExporter import exportASC
+
+    rnd = random.Random(params.vertices)
+    np.random.seed(params.vertices)
+    results = []
+
+    def record(phase, function, outputFile=None, creates=False):
+        ''' creates: the phase adds objects, each run starts from the scene before the first '''
+        if phases and phase not in phases:
+            return None
+        print("benchmark: %s, %d vertices" % (phase, params.vertices))
+        cleanup = None
+        if creates:
+            snapshot = dataSnapshot()
+            cleanup = lambda: removeCreatedData(snapshot)
+        try:
+            best, median, peak, result = measure(function, repeat, cleanup)
+        except Exception as e:
+            # A broken phase is reported, the other phases still run
+            traceback.print_exc()
+            results.append({"phase": phase, "error": "%s: %s" % (type(e).__name__, e)})
+            return None
+        entry = {"phase": phase, "seconds": best, "median": median, "peakMemory": peak}
+        if outputFile is not None:
+            entry["bytes"] = fileSize(outputFile)
+        results.append(entry)
+        return result
+
+    def generate():
+        clearScene()
+        materials = makeMaterials(params.materials)
+        objects = [makeLodObject("bench_lod1", '-1.0', params, materials, rnd),
+                   makeLodObject("bench_geometry", '1.000e+13', params, materials, rnd)]
+        armature = makeArmature(params.bones, params.frames)
+        return objects, armature
+
+    if phases and "generate" not in phases:
+        objects, armature = generate()
+    else:
+        generated = record("generate", generate)
+        if generated is None:
+            # Every other phase needs the generated scene
+            return results
+        objects, armature = generated
+
+    p3dFile = os.path.join(workDir, "bench.p3d")
+    record("exportMDL", lambda: exportMDL(None, p3dFile, objects, False, False), p3dFile)
+
+    if os.path.exists(p3dFile):
+        record("importMDL", lambda: importMDL(bpy.context, p3dFile, False, -1, False), creates=True)
+
+    rtmFile = os.path.join(workDir, "bench.rtm")
+    def rtm():
+        setActive(armature)
+        keyframes = [k.timeIndex for k in armature.armaObjProps.keyFrames]
+        exportRTM(bpy.context, keyframes, rtmFile)
+    record("exportRTM", rtm, rtmFile)
+
+    bitxtFile = os.path.join(workDir, "bench.txt")
+    def bitxt():
+        setActive(objects[0])
+        with open(bitxtFile, "w") as f, \
+             open(os.path.join(workDir, "bench_ctrl.txt"), "w") as ctrl, \
+             open(os.path.join(workDir, "bench_uvset.txt"), "w") as uvset:
+            exportBITxt(f, ctrl, uvset)
+    record("exportBITxt", bitxt, bitxtFile)
+
+    ascFile = os.path.join(workDir, "bench.asc")
+    ascSize = max(2, int(math.sqrt(params.vertices)))
+    writeSyntheticASC(ascFile, ascSize)
+    record("importASC", lambda: importASC(bpy.context, ascFile), creates=True)
+
+    heightfield = bpy.data.objects.get("bench")
+    if heightfield is not None:
+        ascOut = os.path.join(workDir, "bench_out.asc")
+        def asc():
+            setActive(heightfield)
+            exportASC(bpy.context, ascOut)
+        record("exportASC", asc, ascOut)
+
+    return results
+
+def compareWithBaseline(report, baselineFile, threshold):
+    ''' Returns a list of phases that got slower than threshold (a factor) '''
+    with open(baselineFile) as f:
+        baseline = json.load(f)
+
+    old = {}
+    for scenario in baseline["scenarios"]:
+        for r in scenario["results"]:
+            if "seconds" in r:
+                old[(scenario["vertices"], r["phase"])] = r["seconds"]
+
+    slower = []
+    for scenario in report["scenarios"]:
+        for r in scenario["results"]:
+            before = old.get((scenario["vertices"], r["phase"]))
+            if before and "seconds" in r and r["seconds"] > before * threshold:
+                slower.append({"vertices": scenario["vertices"], "phase": r["phase"],
+                               "before": before, "after": r["seconds"]})
+    return slower
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="Benchmark", description="Benchmark ArmaToolbox import/export")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Vertices per LOD, one scenario per value")
+    parser.add_argument("--selections", type=int, default=20, help="Named selections per LOD")
+    parser.add_argument("--sharp", type=int, default=500, help="Sharp edges per LOD")
+    parser.add_argument("--uvsets", type=int, default=2, help="UV sets per LOD")
+    parser.add_argument("--materials", type=int, default=8, help="Number of materials")
+    parser.add_argument("--proxies", type=int, default=10, help="Proxies per LOD")
+    parser.add_argument("--bones", type=int, default=64, help="Bones of the armature")
+    parser.add_argument("--frames", type=int, default=100, help="Keyframes of the animation")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per phase")
+    parser.add_argument("--phase", action="append", dest="phases", help="Only run this phase. Can be repeated")
+    parser.add_argument("--output", default=None, help="Write the JSON results to this file")
+    parser.add_argument("--baseline", default=None, help="Compare against an earlier JSON result")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Report phases slower than baseline times this factor")
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArguments(scriptArguments())
+    ensureAddon()
+
+    import ArmaToolbox
+
+    report = {
+        "blender": bpy.app.version_string,
+        "addon": ".".join(str(v) for v in ArmaToolbox.bl_info["version"]),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "scenarios": [],
+    }
+
+    with tempfile.TemporaryDirectory() as workDir:
+        for numVerts in args.vertices:
+            params = argparse.Namespace(**vars(args))
+            params.vertices = numVerts
+            results = runScenario(params, workDir, args.phases, args.repeat)
+            report["scenarios"].append({"vertices": numVerts, "results": results})
+
+    if args.baseline:
+        report["slower"] = compareWithBaseline(report, args.baseline, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,665 @@
+'''
+Created on 19.10.2026
+
+ESRI ASCII grid (ASC DEM) reading and heightfield mesh arrays, without
+Blender.
+
+The header keywords can come in any order and any case, the lower left
+corner can be given as corner (xllcorner/yllcorner) or cell center
+(xllcenter/yllcenter). The heights are read in chunks of raw bytes and
+parsed by NumPy straight into a float32 array, a 8k x 8k grid never
+exists as Python floats.
+
+'''
+import os
+import json
+import warnings
+import numpy as np
+
+# Bytes read from the file at once
+CHUNK_SIZE = 16 << 20
+
+HEADER_KEYWORDS = ("ncols", "nrows", "xllcorner", "yllcorner", "xllcenter", "yllcenter",
+                   "cellsize", "nodata_value")
+
+DEFAULT_NODATA = -9999.0
+
+# The importer scales the terrain down by 100 so it fits Blender's view
+UNIT_SCALE = 0.01
+
+class ASCError(Exception):
+    pass
+
+class ASCHeader:
+    def __init__(self, ncols, nrows, xllcorner, yllcorner, cellsize, nodata=DEFAULT_NODATA):
+        self.ncols = ncols
+        self.nrows = nrows
+        self.xllcorner = xllcorner
+        self.yllcorner = yllcorner
+        self.cellsize = cellsize
+        self.nodata = nodata
+
+    def __repr__(self):
+        return "ASCHeader({0}x{1}, corner {2},{3}, cellsize {4}, nodata {5})".format(
+            self.ncols, self.nrows, self.xllcorner, self.yllcorner, self.cellsize, self.nodata)
+
+class ASCGrid:
+    '''
+    heights is (nrows, ncols) float32, row 0 is the northernmost row like
+    in the file.
+    '''
+    def __init__(self, header, heights):
+        self.header = header
+        self.heights = heights
+
+    @property
+    def noData(self):
+        ''' Boolean mask of the NODATA cells '''
+        return self.heights == np.float32(self.header.nodata)
+
+def readASCHeader(filePtr):
+    '''
+    Read the header lines of a binary file object and leave the file at the
+    first line of data.
+    '''
+    values = {}
+    while True:
+        pos = filePtr.tell()
+        line = filePtr.readline()
+        if len(line) == 0:
+            break
+        parts = line.split()
+        if len(parts) == 0:
+            continue
+        keyword = parts[0].decode("ascii", "replace").lower()
+        if keyword not in HEADER_KEYWORDS:
+            filePtr.seek(pos)
+            break
+        if len(parts) < 2:
+            raise ASCError("No value for " + keyword)
+        try:
+            values[keyword] = float(parts[1])
+        except ValueError:
+            raise ASCError("Invalid value for {0}: {1}".format(keyword, parts[1].decode("ascii", "replace")))
+
+    for required in ("ncols", "nrows", "cellsize"):
+        if required not in values:
+            raise ASCError("Header has no " + required)
+
+    cellsize = values["cellsize"]
+    corner = []
+    for axis in "xy":
+        if axis + "llcorner" in values:
+            corner.append(values[axis + "llcorner"])
+        elif axis + "llcenter" in values:
+            corner.append(values[axis + "llcenter"] - cellsize / 2)
+        else:
+            raise ASCError("Header has no {0}llcorner or {0}llcenter".format(axis))
+
+    ncols = int(values["ncols"])
+    nrows = int(values["nrows"])
+    if ncols < 1 or nrows < 1:
+        raise ASCError("Invalid grid size {0}x{1}".format(ncols, nrows))
+
+    return ASCHeader(ncols, nrows, corner[0], corner[1], cellsize,
+                     values.get("nodata_value", DEFAULT_NODATA))
+
+def parseValues(data):
+    ''' All numbers in a bytes object as float32 '''
+    with warnings.catch_warnings():
+        # NumPy stops at the first bad token with just a warning
+        warnings.simplefilter("error")
+        try:
+            return np.fromstring(data, dtype=np.float32, sep=' ')
+        except (ValueError, DeprecationWarning):
+            raise ASCError("Invalid height value")
+
+def iterValueChunks(filePtr, chunkSize=CHUNK_SIZE):
+    ''' float32 arrays of the numbers in the rest of the file, chunk by chunk '''
+    tail = b''
+    while True:
+        data = filePtr.read(chunkSize)
+        if len(data) == 0:
+            break
+        data = tail + data
+        # Don't cut a number in half, the rest goes into the next chunk
+        cut = max(data.rfind(b' '), data.rfind(b'\n'), data.rfind(b'\t'), data.rfind(b'\r'))
+        if cut < 0:
+            tail = data
+            continue
+        tail = data[cut:]
+        values = parseValues(data[:cut])
+        if len(values) > 0:
+            yield values
+    if len(tail.strip()) > 0:
+        yield parseValues(tail)
+
+def iterRowBlocks(filePtr, header, blockRows, chunkSize=CHUNK_SIZE):
+    '''
+    Yields (firstRow, heights) with heights a (rows, ncols) float32 array
+    of up to blockRows rows, from the top row down. Only one block is held
+    at a time.
+    '''
+    ncols = header.ncols
+    block = np.empty(blockRows * ncols, dtype=np.float32)
+    filled = 0
+    row = 0
+
+    for values in iterValueChunks(filePtr, chunkSize):
+        pos = 0
+        while pos < len(values) and row < header.nrows:
+            rowsLeft = min(blockRows, header.nrows - row)
+            n = min(rowsLeft * ncols - filled, len(values) - pos)
+            block[filled:filled + n] = values[pos:pos + n]
+            filled += n
+            pos += n
+            if filled == rowsLeft * ncols:
+                yield row, block[:filled].reshape(rowsLeft, ncols)
+                row += rowsLeft
+                block = np.empty(blockRows * ncols, dtype=np.float32)
+                filled = 0
+        if row >= header.nrows:
+            return
+
+    raise ASCError("File ends after {0} of {1} rows".format(row + filled // ncols, header.nrows))
+
+def iterRowBands(filePtr, header, bounds, blockRows=256, chunkSize=CHUNK_SIZE):
+    '''
+    Yields (start, heights) for each (start, end) row range in bounds,
+    reading the file only once. The ranges must be in ascending order and
+    may overlap, only the rows of the current range are kept in memory.
+    '''
+    blocks = iterRowBlocks(filePtr, header, blockRows, chunkSize)
+    have = np.empty((0, header.ncols), dtype=np.float32)
+    haveStart = 0
+
+    for start, end in bounds:
+        if start > haveStart:
+            have = have[min(start - haveStart, len(have)):]
+            haveStart = start
+        parts = [have]
+        haveEnd = haveStart + len(have)
+        while haveEnd < end:
+            row, block = next(blocks)
+            if row + len(block) <= start:
+                haveStart = haveEnd = row + len(block)
+                continue
+            if row < start:
+                block = block[start - row:]
+                haveStart = start
+            parts.append(block)
+            haveEnd += len(block)
+        have = np.concatenate(parts) if len(parts) > 1 else have
+        yield start, have[:end - start]
+
+def readASC(fileName, chunkSize=CHUNK_SIZE):
+    ''' Read a whole ASC file into an ASCGrid '''
+    with open(fileName, "rb") as filePtr:
+        header = readASCHeader(filePtr)
+        heights = np.empty((header.nrows, header.ncols), dtype=np.float32)
+        # Blocks of about one chunk, written straight into the result
+        blockRows = max(1, chunkSize // (4 * header.ncols))
+        for row, block in iterRowBlocks(filePtr, header, blockRows, chunkSize):
+            heights[row:row + len(block)] = block
+    return ASCGrid(header, heights)
+
+###
+##  Mesh arrays
+#
+#   Vertices are laid out row by row like the file, the first row is the
+#   northern edge (largest y). Each cell is split into two triangles.
+
+def gridVertices(heights, cellsize, nrows, firstRow=0, firstCol=0, step=1):
+    '''
+    Vertex coordinates (rows * cols, 3) float32 of a block of the grid.
+    firstRow/firstCol place the block in a grid with nrows rows, step is
+    the distance between samples in grid cells for decimated grids.
+    '''
+    rows, cols = heights.shape
+    scale = cellsize * UNIT_SCALE
+    verts = np.empty((rows, cols, 3), dtype=np.float32)
+    verts[..., 0] = ((firstCol + np.arange(cols) * step) * scale)[None, :]
+    verts[..., 1] = ((nrows - 1 - (firstRow + np.arange(rows) * step)) * scale)[:, None]
+    verts[..., 2] = heights * UNIT_SCALE
+    return verts.reshape(-1, 3)
+
+def gridTriangles(rows, cols):
+    ''' Vertex indices (2 * (rows-1) * (cols-1), 3) int32 of the triangles '''
+    idx = np.arange(rows * cols, dtype=np.int32).reshape(rows, cols)
+    i1 = idx[:-1, :-1]
+    i2 = idx[:-1, 1:]
+    i3 = idx[1:, :-1]
+    i4 = idx[1:, 1:]
+    tris = np.empty((rows - 1, cols - 1, 2, 3), dtype=np.int32)
+    tris[:, :, 0] = np.stack((i3, i2, i1), axis=-1)
+    tris[:, :, 1] = np.stack((i2, i3, i4), axis=-1)
+    return tris.reshape(-1, 3)
+
+def gridLoopUVs(verts, tris, xext, yext):
+    ''' Planar UVs (len(tris) * 3, 2) float32 per loop, the whole grid is 0..1 '''
+    vertexUV = verts[:, :2] / np.array((xext, yext), dtype=np.float32)
+    return vertexUV[tris.ravel()]
+
+###
+##  Tiles
+#
+#   A large grid can be split into count x count tiles. Every tile owns a
+#   core range of vertex rows and columns, the cores cover the grid without
+#   gaps or overlaps. The tile meshes go one vertex further so neighbouring
+#   tiles share their border vertices, plus overlap extra rows and columns
+#   on every side that has a neighbour.
+
+def tileBounds(n, count, overlap):
+    '''
+    Split n vertex rows (or columns) into count tiles. Returns a list of
+    (coreStart, coreEnd, start, end) half open ranges.
+    '''
+    count = max(1, min(count, n - 1))
+    cuts = [int(round(i * (n - 1) / count)) for i in range(count + 1)]
+    result = []
+    for i in range(count):
+        coreStart = cuts[i]
+        coreEnd = cuts[i + 1] if i < count - 1 else n
+        start = max(0, coreStart - overlap)
+        end = min(n, cuts[i + 1] + 1 + overlap)
+        result.append((coreStart, coreEnd, start, end))
+    return result
+
+def writeASCHeader(filePtr, header):
+    filePtr.write("ncols         {0}\n".format(header.ncols))
+    filePtr.write("nrows         {0}\n".format(header.nrows))
+    filePtr.write("xllcorner     {0}\n".format(header.xllcorner))
+    filePtr.write("yllcorner     {0}\n".format(header.yllcorner))
+    filePtr.write("cellsize      {0}\n".format(header.cellsize))
+    filePtr.write("NODATA_value  {0}\n".format(header.nodata))
+
+# Values formatted with one % operation
+WRITE_BLOCK_VALUES = 1 << 20
+
+def writeASCRows(filePtr, heights, precision=4):
+    '''
+    Write a (rows, cols) array of heights, one line per row. Rows are
+    formatted in blocks of about WRITE_BLOCK_VALUES values with a single
+    preformatted format string.
+    '''
+    rows, cols = heights.shape
+    rowFormat = " ".join(["%.{0}f".format(precision)] * cols) + "\n"
+    blockRows = max(1, WRITE_BLOCK_VALUES // max(cols, 1))
+    blockFormat = rowFormat * blockRows
+    for start in range(0, rows, blockRows):
+        block = heights[start:start + blockRows]
+        fmt = blockFormat if len(block) == blockRows else rowFormat * len(block)
+        filePtr.write(fmt % tuple(block.ravel().tolist()))
+
+###
+##  Pyramid
+#
+#   A parsed copy of an ASC file next to it, in <file>.pyramid/. Level 0 is
+#   the full grid as float32 .npy, every further level is mean pooled by 2
+#   (NODATA cells don't count) until the grid is PYRAMID_MIN_SIZE. All
+#   levels are opened memory mapped, so previews and refinements of single
+#   regions only touch the data they need. The pyramid is rebuilt when the
+#   size or modification time of the ASC file changes.
+
+PYRAMID_SUFFIX = ".pyramid"
+PYRAMID_INFO = "pyramid.json"
+PYRAMID_MIN_SIZE = 64
+PYRAMID_VERSION = 1
+
+def pyramidDirectory(fileName):
+    return fileName + PYRAMID_SUFFIX
+
+def sourceStamp(fileName):
+    st = os.stat(fileName)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+def meanPool(block, nodata, factor=2):
+    '''
+    Mean of factor x factor cells, ignoring NODATA. Cells that are NODATA
+    everywhere stay NODATA. Edges are pooled over the cells that exist.
+    '''
+    rows, cols = block.shape
+    outRows = -(-rows // factor)
+    outCols = -(-cols // factor)
+    padded = np.full((outRows * factor, outCols * factor), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = block
+    padded[padded == np.float32(nodata)] = np.nan
+    padded = padded.reshape(outRows, factor, outCols, factor)
+
+    valid = ~np.isnan(padded)
+    count = valid.sum(axis=(1, 3))
+    total = np.where(valid, padded, 0).sum(axis=(1, 3), dtype=np.float64)
+    result = np.full((outRows, outCols), nodata, dtype=np.float32)
+    np.divide(total, count, out=result, where=count > 0, casting='unsafe')
+    return result
+
+class HeightfieldPyramid:
+    def __init__(self, directory, header, levels):
+        self.directory = directory
+        self.header = header
+        self.levels = levels
+
+    def levelFor(self, step):
+        ''' (level array, factor) of the finest level with factor <= step '''
+        k = 0
+        while k + 1 < len(self.levels) and 2 ** (k + 1) <= step:
+            k += 1
+        return self.levels[k], 2 ** k
+
+    def preview(self, step, method='STRIDE'):
+        '''
+        Decimated heights and the grid position of their first sample.
+        STRIDE takes every step-th sample of the full grid, MEAN uses the
+        pooled level closest to step. Returns (heights, offset, step).
+        '''
+        if method == 'MEAN':
+            level, factor = self.levelFor(step)
+            # A pooled sample sits in the middle of the cells it covers
+            return np.array(level), (factor - 1) / 2, factor
+        return np.array(self.levels[0][::step, ::step]), 0, step
+
+    def region(self, rowStart, rowEnd, colStart, colEnd):
+        ''' Full resolution heights of a region '''
+        return np.array(self.levels[0][rowStart:rowEnd, colStart:colEnd])
+
+def headerToDict(header):
+    return {"ncols": header.ncols, "nrows": header.nrows, "xllcorner": header.xllcorner,
+            "yllcorner": header.yllcorner, "cellsize": header.cellsize, "nodata": header.nodata}
+
+def headerFromDict(values):
+    return ASCHeader(values["ncols"], values["nrows"], values["xllcorner"], values["yllcorner"],
+                     values["cellsize"], values["nodata"])
+
+def buildPyramid(fileName, directory=None, chunkSize=CHUNK_SIZE):
+    ''' Parse an ASC file into a pyramid, returns the opened HeightfieldPyramid '''
+    from numpy.lib.format import open_memmap
+
+    if directory is None:
+        directory = pyramidDirectory(fileName)
+    os.makedirs(directory, exist_ok=True)
+
+    with open(fileName, "rb") as filePtr:
+        header = readASCHeader(filePtr)
+        level = open_memmap(os.path.join(directory, "level0.npy"), mode='w+',
+                            dtype=np.float32, shape=(header.nrows, header.ncols))
+        blockRows = max(1, chunkSize // (4 * header.ncols))
+        for row, block in iterRowBlocks(filePtr, header, blockRows, chunkSize):
+            level[row:row + len(block)] = block
+        level.flush()
+
+    numLevels = 1
+    while max(level.shape) > PYRAMID_MIN_SIZE:
+        rows, cols = level.shape
+        nextLevel = open_memmap(os.path.join(directory, "level{0}.npy".format(numLevels)), mode='w+',
+                                dtype=np.float32, shape=(-(-rows // 2), -(-cols // 2)))
+        # An even number of rows per block so pooling never straddles blocks
+        blockRows = max(2, (chunkSize // (4 * cols)) & ~1)
+        for row in range(0, rows, blockRows):
+            pooled = meanPool(level[row:row + blockRows], header.nodata)
+            nextLevel[row // 2:row // 2 + len(pooled)] = pooled
+        nextLevel.flush()
+        del level
+        level = nextLevel
+        numLevels += 1
+    del level
+
+    info = {
+        "version": PYRAMID_VERSION,
+        "source": sourceStamp(fileName),
+        "header": headerToDict(header),
+        "levels": numLevels,
+    }
+    # Written last, a pyramid without info is incomplete and gets rebuilt
+    with open(os.path.join(directory, PYRAMID_INFO), "w") as f:
+        json.dump(info, f, indent=2)
+
+    return loadPyramid(directory, info)
+
+def loadPyramid(directory, info):
+    levels = [np.load(os.path.join(directory, "level{0}.npy".format(k)), mmap_mode='r')
+                  for k in range(info["levels"])]
+    return HeightfieldPyramid(directory, headerFromDict(info["header"]), levels)
+
+def openPyramid(fileName, rebuild=False):
+    ''' The pyramid of an ASC file, built first if it is missing or out of date '''
+    directory = pyramidDirectory(fileName)
+    infoFile = os.path.join(directory, PYRAMID_INFO)
+    if not rebuild and os.path.exists(infoFile):
+        try:
+            with open(infoFile) as f:
+                info = json.load(f)
+            if info.get("version") == PYRAMID_VERSION and info.get("source") == sourceStamp(fileName):
+                return loadPyramid(directory, info)
+        except (OSError, ValueError, KeyError):
+            pass
+    return buildPyramid(fileName, directory)
+
+###
+##  Binary rasters
+#
+#   Raw heightmaps (.r32 float32, .r16 16 bit, .raw) and .npy files, with a
+#   JSON sidecar <file>.json holding what ASC has in its header:
+#
+#   {"ncols": 4096, "nrows": 4096, "xllcorner": 200000.0, "yllcorner": 0.0,
+#    "cellsize": 5.0, "nodata": -9999.0, "dtype": "uint16",
+#    "heightScale": 0.01, "heightOffset": 0.0}
+#
+#   Heights are value * heightScale + heightOffset. Little endian float32
+#   data is memory mapped and used as it is, other types are converted.
+
+RASTER_DTYPES = {
+    "float32": "<f4",
+    "float16": "<f2",
+    "uint16": "<u2",
+    "int16": "<i2",
+}
+
+RASTER_DEFAULT_DTYPES = {
+    ".r32": "float32",
+    ".r16": "uint16",
+    ".raw": "uint16",
+}
+
+# NODATA of integer rasters, the value itself is stored in the sidecar
+UINT16_NODATA = 65535
+
+def sidecarFile(fileName):
+    return fileName + ".json"
+
+def readSidecar(fileName):
+    try:
+        with open(sidecarFile(fileName)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        raise ASCError("Invalid sidecar {0}: {1}".format(sidecarFile(fileName), e))
+
+def writeSidecar(fileName, header, dtype, heightScale=1.0, heightOffset=0.0, rawNodata=None):
+    info = headerToDict(header)
+    info.update({"dtype": dtype, "heightScale": heightScale, "heightOffset": heightOffset})
+    if rawNodata is not None:
+        info["rawNodata"] = rawNodata
+    with open(sidecarFile(fileName), "w") as f:
+        json.dump(info, f, indent=2)
+
+def openRasterData(fileName, info):
+    ''' The stored values, memory mapped, as (nrows, ncols) '''
+    if fileName.lower().endswith(".npy"):
+        data = np.load(fileName, mmap_mode='r')
+        if data.ndim != 2:
+            raise ASCError("{0} is not a 2D array".format(fileName))
+        return data
+
+    ext = os.path.splitext(fileName)[1].lower()
+    dtype = info.get("dtype", RASTER_DEFAULT_DTYPES.get(ext, "float32"))
+    if dtype not in RASTER_DTYPES:
+        raise ASCError("Unsupported raster type " + dtype)
+    dtype = np.dtype(RASTER_DTYPES[dtype])
+
+    count = os.path.getsize(fileName) // dtype.itemsize
+    if "ncols" in info and "nrows" in info:
+        ncols, nrows = int(info["ncols"]), int(info["nrows"])
+    else:
+        # Without a sidecar, only square rasters can be read
+        ncols = nrows = int(round(count ** 0.5))
+    if ncols * nrows > count or ncols * nrows == 0:
+        raise ASCError("{0} is too small for a {1}x{2} raster".format(fileName, ncols, nrows))
+    return np.memmap(fileName, dtype=dtype, mode='r', shape=(nrows, ncols))
+
+def readRaster(fileName):
+    '''
+    Read a raw or .npy heightmap into an ASCGrid. Little endian float32 data
+    without scaling is returned memory mapped, anything else is converted
+    to float32 heights.
+    '''
+    info = readSidecar(fileName)
+    data = openRasterData(fileName, info)
+    nrows, ncols = data.shape
+
+    nodata = info.get("nodata", DEFAULT_NODATA)
+    header = ASCHeader(ncols, nrows, info.get("xllcorner", 0.0), info.get("yllcorner", 0.0),
+                       info.get("cellsize", 1.0), nodata)
+
+    heightScale = info.get("heightScale", 1.0)
+    heightOffset = info.get("heightOffset", 0.0)
+    if data.dtype == np.dtype("<f4") and heightScale == 1.0 and heightOffset == 0.0:
+        return ASCGrid(header, data)
+
+    heights = np.empty((nrows, ncols), dtype=np.float32)
+    rawNodata = info.get("rawNodata")
+    blockRows = max(1, CHUNK_SIZE // (4 * ncols))
+    for row in range(0, nrows, blockRows):
+        block = data[row:row + blockRows]
+        converted = block.astype(np.float32) * np.float32(heightScale) + np.float32(heightOffset)
+        if rawNodata is not None:
+            converted[block == rawNodata] = nodata
+        heights[row:row + len(block)] = converted
+    return ASCGrid(header, heights)
+
+def createRaster(fileName, header, dtype="float32", heightRange=None):
+    '''
+    Create a raster file for writing and its sidecar. Returns a RasterWriter.
+    heightRange (min, max) is needed for integer types, the heights are
+    scaled to use the whole value range.
+    '''
+    return RasterWriter(fileName, header, dtype, heightRange)
+
+class RasterWriter:
+    def __init__(self, fileName, header, dtype, heightRange):
+        from numpy.lib.format import open_memmap
+
+        if dtype not in RASTER_DTYPES:
+            raise ASCError("Unsupported raster type " + dtype)
+        self.header = header
+        self.heightScale = 1.0
+        self.heightOffset = 0.0
+        self.rawNodata = None
+
+        npDtype = np.dtype(RASTER_DTYPES[dtype])
+        self.integer = npDtype.kind in "iu"
+        if not self.integer and npDtype != np.dtype("<f4"):
+            # NODATA as it ends up in a smaller float type
+            self.rawNodata = float(npDtype.type(header.nodata))
+        if self.integer:
+            info = np.iinfo(npDtype)
+            # The top value is kept free for NODATA
+            self.rawNodata = int(info.max)
+            low, high = heightRange if heightRange is not None else (0.0, 1.0)
+            steps = float(info.max) - float(info.min) - 1
+            self.heightScale = max(high - low, 1e-6) / steps
+            self.heightOffset = low - float(info.min) * self.heightScale
+
+        shape = (header.nrows, header.ncols)
+        if fileName.lower().endswith(".npy"):
+            self.data = open_memmap(fileName, mode='w+', dtype=npDtype, shape=shape)
+        else:
+            self.data = np.memmap(fileName, dtype=npDtype, mode='w+', shape=shape)
+        writeSidecar(fileName, header, dtype, self.heightScale, self.heightOffset, self.rawNodata)
+
+    def write(self, row, heights):
+        ''' Store a block of heights in metres starting at row '''
+        target = self.data[row:row + len(heights)]
+        if not self.integer:
+            target[:] = heights
+            return
+        nodata = heights == np.float32(self.header.nodata)
+        values = np.rint((heights - self.heightOffset) / self.heightScale)
+        values[nodata] = self.rawNodata
+        target[:] = values
+
+    def close(self):
+        self.data.flush()
+        del self.data
+
+###
+##  Surface analysis
+#
+#   Slope (degrees), aspect (degrees clockwise from north, the direction
+#   the slope faces, -1 on flat ground) and curvature (ESRI convention,
+#   -(d2z/dx2 + d2z/dy2) * 100, positive is convex) from central
+#   differences. At the grid edges the heights are extrapolated linearly,
+#   which gives one sided differences there. Cells next to NODATA are
+#   NODATA. Large grids are processed in bands of rows with one row of
+#   halo, giving the same result as the whole grid at once.
+
+SURFACE_MAPS = ("slope", "aspect", "curvature")
+
+def _padRows(block, top, bottom):
+    ''' Add an extrapolated row on the sides without a halo row '''
+    if block.shape[0] < 2:
+        mode = {"mode": "edge"}
+    else:
+        mode = {"mode": "reflect", "reflect_type": "odd"}
+    return np.pad(block, ((0 if top else 1, 0 if bottom else 1), (0, 0)), **mode)
+
+def _padCols(block):
+    if block.shape[1] < 2:
+        return np.pad(block, ((0, 0), (1, 1)), mode="edge")
+    return np.pad(block, ((0, 0), (1, 1)), mode="reflect", reflect_type="odd")
+
+def surfaceMaps(block, cellsize, nodata, haloTop=False, haloBottom=False):
+    '''
+    Maps for a block of rows. With haloTop/haloBottom the first/last row of
+    block is a neighbouring row that only serves as input. Returns
+    {name: (rows, cols) float32}.
+    '''
+    z = block.astype(np.float64)
+    z[block == np.float32(nodata)] = np.nan
+    z = _padCols(_padRows(z, haloTop, haloBottom))
+
+    center = z[1:-1, 1:-1]
+    west, east = z[1:-1, :-2], z[1:-1, 2:]
+    north, south = z[:-2, 1:-1], z[2:, 1:-1]
+
+    # x goes east, y goes north (row 0 is the northern edge)
+    dzdx = (east - west) / (2 * cellsize)
+    dzdy = (north - south) / (2 * cellsize)
+    d2zdx2 = (east - 2 * center + west) / (cellsize * cellsize)
+    d2zdy2 = (north - 2 * center + south) / (cellsize * cellsize)
+
+    slope = np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+    # Downhill is (-dzdx, -dzdy), as a compass bearing
+    aspect = np.degrees(np.arctan2(-dzdx, -dzdy)) % 360
+    aspect[(dzdx == 0) & (dzdy == 0)] = -1
+    curvature = -(d2zdx2 + d2zdy2) * 100
+
+    result = {}
+    for name, values in (("slope", slope), ("aspect", aspect), ("curvature", curvature)):
+        values = values.astype(np.float32)
+        values[np.isnan(values) | np.isnan(center)] = nodata
+        result[name] = values
+    return result
+
+def iterSurfaceMaps(heights, cellsize, nodata, bandRows=1024):
+    '''
+    Yields (firstRow, maps) for bands of up to bandRows rows. heights can
+    be a memory mapped array, only one band (plus halo) is read at a time.
+    '''
+    nrows = heights.shape[0]
+    for row in range(0, nrows, bandRows):
+        end = min(nrows, row + bandRows)
+        haloTop = row > 0
+        haloBottom = end < nrows
+        block = np.asarray(heights[row - 1 if haloTop else row:end + 1 if haloBottom else end])
+        yield row, surfaceMaps(block, cellsize, nodata, haloTop, haloBottom)
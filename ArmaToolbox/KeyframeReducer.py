@@ -0,0 +1,158 @@
+'''
+Created on 19.10.2026
+
+Automatic keyframe selection for RTM export.
+
+The armature is sampled on every frame of the range, then frames are
+dropped greedily: starting from a kept frame, the segment is extended as
+long as linearly interpolating the channel matrices between its ends
+reproduces every sampled frame in between within the tolerances. The
+position error is measured at the head and tail of every bone, the
+rotation error is the angle between the sampled and interpolated rotation.
+
+The reduction itself only needs NumPy, sampling the armature is done with
+the same code the RTM exporter uses.
+
+'''
+import math
+import numpy as np
+
+# RTM_0101: signature, motion vector, frame and bone count
+RTM_HEADER_SIZE = 8 + 12 + 8
+
+def rtmFileSize(numFrames, numBones):
+    ''' Size of an RTM file in bytes: header, bone names, frames (time + 32 byte name + 12 floats per bone) '''
+    return RTM_HEADER_SIZE + 32 * numBones + numFrames * (4 + numBones * (32 + 48))
+
+def posedPoints(channels, points):
+    '''
+    channels (F, B, 4, 4) matrix_channel, points (B, P, 3) rest positions
+    in armature space. Returns the posed positions (F, B, P, 3).
+    '''
+    return np.einsum('fbij,bpj->fbpi', channels[..., :3, :3], points) + channels[:, :, None, :3, 3]
+
+def normalizedRotations(channels):
+    ''' Upper 3x3 of the channels with unit length columns, so scale doesn't count as rotation '''
+    rot = channels[..., :3, :3]
+    norm = np.linalg.norm(rot, axis=-2, keepdims=True)
+    return rot / np.where(norm == 0, 1, norm)
+
+class KeyframeReducer:
+    '''
+    Reduction of one densely sampled animation. positionTolerance is in
+    armature units (metres), rotationTolerance in radians.
+    '''
+    def __init__(self, channels, points, positionTolerance, rotationTolerance):
+        self.positions = posedPoints(channels, points)
+        self.rotations = normalizedRotations(channels)
+        self.positionTolerance = positionTolerance
+        # Compare against cos(angle) instead of taking arccos everywhere
+        self.minCos = math.cos(rotationTolerance)
+
+    def segmentFits(self, i, j):
+        ''' True if all frames strictly between i and j are within tolerance '''
+        k = np.arange(i + 1, j)
+        if len(k) == 0:
+            return True
+        t = ((k - i) / (j - i))[:, None, None, None]
+
+        # Interpolating the matrices interpolates the transformed points too
+        positions = (1 - t) * self.positions[i] + t * self.positions[j]
+        distance = np.linalg.norm(positions - self.positions[k], axis=-1)
+        if distance.max() > self.positionTolerance:
+            return False
+
+        rotations = normalizedRotations((1 - t) * self.rotations[i] + t * self.rotations[j])
+        # trace(A^T B) = cos(angle) * 2 + 1 for rotations A and B
+        trace = np.sum(rotations * self.rotations[k], axis=(-2, -1))
+        return ((trace - 1) / 2).min() >= self.minCos
+
+    def reduce(self):
+        ''' Indices of the frames to keep, always including the first and last '''
+        numFrames = len(self.positions)
+        if numFrames <= 2:
+            return list(range(numFrames))
+
+        keep = [0]
+        i = 0
+        while i < numFrames - 1:
+            j = i + 2
+            while j < numFrames and self.segmentFits(i, j):
+                j += 1
+            i = j - 1
+            keep.append(i)
+        return keep
+
+def reduceChannels(channels, points, positionTolerance, rotationTolerance):
+    return KeyframeReducer(channels, points, positionTolerance, rotationTolerance).reduce()
+
+###
+##  Blender side
+#
+
+def bonePoints(armature, boneNames):
+    ''' Rest head and tail of the bones in armature space, (B, 2, 3) '''
+    bones = armature.bones
+    return np.array([(tuple(bones[name].head_local), tuple(bones[name].tail_local)) for name in boneNames])
+
+def sampleChannels(context, blendObject, boneNames, frames, sampleAction=True):
+    '''
+    matrix_channel of the bones for every frame as (F, B, 4, 4), in
+    Blender's row major layout
+    '''
+    from RTMExporter import ActionPoseSampler, poseBoneIndices, poseChannels
+
+    if sampleAction and ActionPoseSampler.unsupportedReason(blendObject) is None:
+        sampler = ActionPoseSampler(blendObject)
+        transposed = [sampler.channelArray(poses, boneNames) for poses in sampler.poseMatrices(frames)]
+    else:
+        scene = context.scene
+        oldFrame = scene.frame_current
+        boneIndices = poseBoneIndices(blendObject, boneNames)
+        transposed = []
+        for frame in frames:
+            scene.frame_set(frame)
+            transposed.append(poseChannels(blendObject, boneIndices))
+        scene.frame_set(oldFrame)
+
+    return np.array(transposed, dtype=np.float64).transpose(0, 1, 3, 2)
+
+def reduceArmatureKeyframes(context, positionTolerance=1.0, rotationTolerance=0.5,
+                            startFrame=None, endFrame=None, sampleAction=True):
+    '''
+    Sample the active armature on every frame from startFrame to endFrame
+    (default: the scene range) and replace its RTM keyframe list with the
+    reduced set. Tolerances are in millimetres and degrees. Returns a
+    dictionary with the frame counts and the RTM sizes.
+    '''
+    from RTMExporter import rtmBoneNames
+    from lists import KeyframeRegistry
+
+    blendObject = context.object
+    scene = context.scene
+    if startFrame is None:
+        startFrame = scene.frame_start
+    if endFrame is None:
+        endFrame = scene.frame_end
+
+    boneNames = rtmBoneNames(blendObject.data)
+    frames = list(range(startFrame, endFrame + 1))
+    channels = sampleChannels(context, blendObject, boneNames, frames, sampleAction)
+    points = bonePoints(blendObject.data, boneNames)
+
+    keep = reduceChannels(channels, points, positionTolerance / 1000.0, math.radians(rotationTolerance))
+    keptFrames = [frames[i] for i in keep]
+
+    registry = KeyframeRegistry(blendObject.armaObjProps.keyFrames)
+    previous = len(registry)
+    registry.replace(keptFrames)
+
+    numBones = len(boneNames)
+    return {
+        "sampled": len(frames),
+        "kept": len(keptFrames),
+        "previous": previous,
+        "bytesAllFrames": rtmFileSize(len(frames), numBones),
+        "bytesPrevious": rtmFileSize(previous, numBones),
+        "bytes": rtmFileSize(len(keptFrames), numBones),
+    }
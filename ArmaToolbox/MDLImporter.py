@@ -6,12 +6,14 @@ Created on 06.12.2013
 Import an Arma 2/Arma 3 unbinarized MDL file
 
 '''
-import struct
 import bpy
 import bmesh
 import os.path as path
+import numpy as np
 import ArmaToolbox
 import ArmaTools
+import MLODCodec
+from MLODCodec import decodeWeight
 
 def getLayerMask(layer):
     res = [False, False, False, False, False,
@@ -21,34 +23,6 @@ def getLayerMask(layer):
     res[layer % 20] = True
     return res
 
-# Datatype reading
-def readULong(filePtr):
-    return struct.unpack("i", filePtr.read(4))[0]
-
-def readSignature(filePtr):
-    return filePtr.read(4)
-
-def readFloat(filePtr):
-    return struct.unpack("f", filePtr.read(4))[0]
-
-def readChar(filePtr):
-    return struct.unpack("c", filePtr.read(1))[0]
-
-def readByte(filePtr):
-    return struct.unpack("b", filePtr.read(1))[0]
-
-def readString(filePtr):
-    res = b''
-    t = True
-    while t:
-        a = filePtr.read(1)
-        if a != b'\000':
-            res = res + a
-        else:
-            t = False
-    
-    return res.decode("utf-8")
-
 def makeLodName(fileName, lodLevel):
     lodName = path.basename(fileName)
     lodName = lodName.split(".")[0]
@@ -172,368 +146,206 @@ def resolutionName(r):
     
     return ret
 
-def decodeWeight(b):
-    if  b == 0:
-        return  0.0
-    elif b == 2:
-        return 1.0
-    elif b > 2:
-        return 1.0 - round( (b-2) / 2.55555 )*0.01
-    elif b < 0:
-        return -round( b / 2.55555 ) * 0.01
+def getMaterial(materialData, textureName, materialName):
+    ''' Find or create the material for a texture/rvmat combination '''
+    if len(textureName) == 0 and len(materialName) == 0:
+        return None
+
+    mat = materialData.get((textureName, materialName))
+    if mat is None:
+        # Need to create a new material for this
+        mat = bpy.data.materials.new(path.basename(textureName) + " :: " + path.basename(materialName))
+        mat.armaMatProps.colorString = textureName
+        mat.armaMatProps.rvMat   = materialName
+        if len(textureName) > 0 and textureName[0] == '#':
+            mat.armaMatProps.texType = 'Custom'
+            mat.armaMatProps.colorString = textureName
+        else:
+            mat.armaMatProps.texType = 'Texture'
+            mat.armaMatProps.texture = textureName
+            mat.armaMatProps.colorString = ""
+
+        materialData[(textureName, materialName)] = mat
+    return mat
+
+def setLodProperties(obj, resolution):
+    hasSet = False
+    oldres = resolution
+    resolution = correctedResolution(resolution)
+    offset = oldres - resolution
+    obj.armaObjProps.isArmaObject = True
+    if resolution <= 1000:
+        obj.armaObjProps.lodDistance = resolution
+        hasSet = True
     else:
-        # print ("decodeWeight(",b,") returns 1.0 as else case")
-        return 1.0 #TODO: Correct?
+        obj.armaObjProps.lodDistance = offset #0.0
 
-def loadLOD(coll, filePtr, objectName, materialData, layerFlag, lodnr, loadOnlyView):
-    global objectLayers
-    meshName = objectName
-    weightArray = []
-    # Check for P3DM signature
-    sig = readSignature(filePtr)
-    if sig != b'P3DM':
-        return -1
-    
-    # Read major and minor version
-    major = readULong(filePtr)
-    minor = readULong(filePtr)
-    if major != 0x1c:
-        print("Unknown major version {0}".format(major))
-        return -1
-    if minor != 0x100:
-        print("Unknown minor version {0}".format(minor))
-        return -1
-    
-    numPoints   = readULong(filePtr)
-    numNormals  = readULong(filePtr)
-    numFaces    = readULong(filePtr)
-    print("read lod")
-    dummyFlags  = readULong(filePtr)
-    
-    # Read the Points. Points are XYZTriples followed by an ULONG flags word
-    verts = []
-    for i in range(0, numPoints):
-        point = struct.unpack("fffi", filePtr.read(16))
-        pnt = [point[0],  point[2], point[1]]
-        verts.append(pnt)
-    
-    print("normals (", numNormals, ")...")
-    normals = []
-    for i in range(0, numNormals):
-        normal = struct.unpack("fff", filePtr.read(12))
-        nrm = [normal[0], normal[1], normal[2]]
-        normals.append(normal)
-        #print ("Normal = ", normal)
+    # Set the right LOD type
+    lodPresets = ArmaToolbox.lodPresets
     
+    for n in lodPresets:
+        if float(n[0]) == resolution:
+            obj.armaObjProps.lod = n[0]
+            hasSet = True
+             
+    if hasSet == False:
+        print("Error: unknown lod %f" % (resolution))
+        print("resolution %d" % (correctedResolution(resolution)))
 
-    faceData = []
-    faces = []
-    print("faces...")
-
-
-    # Start reading and adding faces
-    for i in range(0, numFaces):
-        numSides = readULong(filePtr)
-        # Vertex table
-        vIdx = []
-        nrmIdx = []
-        uvs = []
-        for n in range(0, 4):
-            vtable = struct.unpack("iiff", filePtr.read(16))
-            if n<numSides:
-                vIdx.append(vtable[0])
-                nrmIdx.append(vtable[1])
-                uvs.append( [vtable[2], vtable[3]])
-        faceFlags = readULong(filePtr)
-        textureName = readString(filePtr)
-        materialName = readString(filePtr)
-        faceData.append(
-            (numSides, nrmIdx, uvs, faceFlags, textureName, materialName)
-        )
-        faces.append(vIdx)
-        # Handle the material if it doesn't exists yet
-        if not loadOnlyView:
-            if len(textureName) > 0 or  len(materialName)>0:
-                try:
-                    materialData[(textureName, materialName)]
-                except:
-                    # Need to create a new material for this
-                    #mat =  bpy.data.materials.new("Arma Material")
-                    mat = bpy.data.materials.new(path.basename(textureName) + " :: " + path.basename(materialName))
-                    mat.armaMatProps.colorString = textureName
-                    mat.armaMatProps.rvMat   = materialName
-                    if len(textureName) > 0 and textureName[0] == '#':
-                        mat.armaMatProps.texType = 'Custom'
-                        mat.armaMatProps.colorString = textureName
-                    else:
-                        mat.armaMatProps.texType = 'Texture'
-                        mat.armaMatProps.texture = textureName
-                        mat.armaMatProps.colorString = ""
-
-                    materialData[(textureName, materialName)] = mat
-            
-    
-    if readSignature(filePtr) != b'TAGG':
-        print("No tagg signature")
+def addVertexGroupWeights(vgrp, weights):
+    # One call per distinct weight instead of one per vertex
+    indices = np.flatnonzero(weights > 0)
+    values = weights[indices]
+    for w in np.unique(values):
+        vgrp.add(indices[values == w].tolist(), float(w), 'REPLACE')
+
+def addSelection(obj, sel):
+    tagName = sel.name
+    # First, check the tagName for a proxy
+    if tagName[:6] == "proxy:":
+        vgrp = obj.vertex_groups.new(name = "@@armaproxy")
+        prp = obj.armaObjProps.proxyArray
+        prx = tagName.split(":")[1]
+        if prx.find(".") != -1:
+            a = prx.split(".")
+            prx = a[0]
+            idx = a[-1]
+            if len(idx) == 0:
+                idx = "1"
+        else:
+            idx = "1"
+        n = prp.add()
+        n.name = vgrp.name
+        n.index = int(idx)
+        n.path = "P:" + prx
+    else:
+        vgrp = obj.vertex_groups.new(name = tagName)
+
+    addVertexGroupWeights(vgrp, sel.vertexWeights())
+
+def setSharpEdges(mesh, sharpEdges):
+    numVerts = len(mesh.vertices)
+    edgeVerts = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edgeVerts)
+    edgeVerts = edgeVerts.reshape(-1, 2)
+
+    # Sort edges by their (smallest index first) vertex pair
+    keys = edgeVerts.min(axis=1).astype(np.int64) * numVerts + edgeVerts.max(axis=1)
+    order = np.argsort(keys)
+    keys = keys[order]
+
+    sharpKeys = sharpEdges.min(axis=1).astype(np.int64) * numVerts + sharpEdges.max(axis=1)
+    pos = np.minimum(np.searchsorted(keys, sharpKeys), max(len(keys) - 1, 0))
+    found = keys[pos] == sharpKeys if len(keys) > 0 else np.zeros(len(sharpKeys), dtype=bool)
+
+    # Apparently, some models have sharp edges that (no longer) exist.
+    missing = len(sharpKeys) - np.count_nonzero(found)
+    if missing > 0:
+        print(f"WARNING: {missing} sharp edges do not exist")
+
+    flags = np.zeros(len(mesh.edges), dtype=bool)
+    flags[order[pos[found]]] = True
+    mesh.edges.foreach_set("use_edge_sharp", flags)
+
+def loadLOD(coll, stream, objectName, materialData, layerFlag, lodnr, loadOnlyView):
+    meshName = objectName
+
+    print("read lod")
+    try:
+        lod = MLODCodec.readLOD(stream, not loadOnlyView)
+    except MLODCodec.MLODError as e:
+        print(e)
         return -1
-    
-    # Create the mesh. Doing it here makes the named selections
-    # easier to read.
+
+    # Create the mesh. Coordinates in the file are Y up
+    verts = lod.points[:, [0, 2, 1]]
     mymesh = bpy.data.meshes.new(name=meshName)
-    mymesh.from_pydata(verts, [], faces)
+    mymesh.from_pydata(verts.tolist(), [], lod.faceList())
 
     mymesh.update(calc_edges = True)
 
     obj = bpy.data.objects.new(meshName, mymesh)
     
     coll.objects.link(obj)
-    
-    # Build Edge database to make finding sharp edges easier
-    edgeDict = dict()
-    for edge in mymesh.edges:
-        v1 = edge.vertices[0]
-        v2 = edge.vertices[1]
-        if (v1 > v2): # Swap if out of order
-            temp = v2
-            v2 = v1
-            v1 = temp
-        #print(f"adding edge index {edge.index} as ({v1},{v2}) to edge dictionary")
-        edgeDict[(v1,v2)] = edge.index
 
     print("taggs")
-    
-    loop = True
-    sharpEdges = None
-    weight = None
     if not loadOnlyView:
-        while loop:
-            active = readChar(filePtr)
-            tagName = readString(filePtr)
-
-            numBytes = readULong(filePtr)
-
-            #print ("tagg: ",tagName, " size ", numBytes)
-
-            if active == b'\000':
-                if numBytes != 0:
-                    filePtr.seek(numBytes, 1)
-            else:
-                if tagName == "#EndOfFile#":
-                    loop = False
-                elif tagName == "#SharpEdges#":
-                    # Read Sharp Edges
-                    sharpEdges = []
-                    for i in range(0,numBytes,8):
-                        n1 = readULong(filePtr)
-                        n2 = readULong(filePtr)
-                        sharpEdges.append([n1, n2])
-                    #print ("sharp edges", sharpEdges)
-                elif tagName == "#Property#":
-                    # Read named property
-                    propName  = struct.unpack("64s", filePtr.read(64))[0].decode("utf-8")
-                    propValue = struct.unpack("64s", filePtr.read(64))[0].decode("utf-8")
-                    item = obj.armaObjProps.namedProps.add()
-                    item.name=propName;
-                    item.value=propValue
-                elif tagName == "#UVSet#":
-                    id = readULong(filePtr)
-                    layerName = "UVSet " + str(id)
-                    if id == 0:
-                        # Name first layer "UVMap" so that there isn't any fuckups with uv sets
-                        layerName = "UVMap"
-                    #print("adding UV set " + layerName)
-                    mymesh.uv_layers.new(name=layerName)
-                    layer = mymesh.uv_layers[-1]
-                    index = 0
-                    for faceIdx in range(0,numFaces):
-                        n = faceData[faceIdx][0]
-                        for x in range(0,n):
-                            u = readFloat(filePtr)
-                            v = readFloat(filePtr)
-                            layer.data[index].uv = [u,1 - v]
-                            index += 1
-                elif tagName == "#Mass#":
-                    weightArray = []
-                    weight = 0;
-                    for idx in range (0,numPoints):
-                        f = readFloat(filePtr)
-                        weightArray.append(f)
-                        weight += f
-                elif tagName[0] == '#':
-                    # System tag we don't read
-                    filePtr.seek(numBytes, 1)
-                else:
-                    # Named Selection
-                    # Add a vertex group
-                    # First, check the tagName for a proxy
-                    newVGrp = True
-                    if len(tagName) > 5:
-                        if tagName[:6] == "proxy:":
-                            newVGrp = False
-                            vgrp = obj.vertex_groups.new(name = "@@armaproxy")
-                            prp = obj.armaObjProps.proxyArray
-                            prx = tagName.split(":")[1]
-                            if prx.find(".") != -1:
-                                a = prx.split(".")
-                                prx = a[0]
-                                idx = a[-1]
-                                if len(idx) == 0:
-                                    idx = "1"
-                            else:
-                                idx = "1"
-                            n = prp.add()
-                            n.name = vgrp.name
-                            n.index = int(idx)
-                            n.path = "P:" + prx
-                            tagName = "@@armyproxy"
-
-                    if newVGrp == True:
-                        vgrp = obj.vertex_groups.new(name = tagName)
-                    for i in range(0, numPoints):
-                        b = readByte(filePtr)
-                        w = decodeWeight(b)
-                        if (w>0):
-                            vgrp.add([i],float(w),'REPLACE')
-                        #print("b = ",b,"w = ", w)
-                    for i in range(0, numFaces):
-                        b = readByte(filePtr)
-                        w = decodeWeight(b)
-                    #    print("b = ",b,"w = ", w)
-                    #    if w== 1.0:
-                    #        pPoly = obj.data.polygons[i]
-                    #        for n in range(0,len(pPoly.vertices)):
-                    #            idx = pPoly.vertices[n]
-                    #            vgrp.add([idx], w, 'REPLACE')
-                    #filePtr.seek(numFaces, 1)
-    
-    # Done with the taggs, only the resolution is left to read
-    resolution = readFloat(filePtr)  
+        for sel in lod.selections:
+            addSelection(obj, sel)
+
+        for propName, propValue in lod.properties:
+            item = obj.armaObjProps.namedProps.add()
+            item.name = propName
+            item.value = propValue
+
+        for id, uvs in lod.uvSets.items():
+            layerName = "UVSet " + str(id)
+            if id == 0:
+                # Name first layer "UVMap" so that there isn't any fuckups with uv sets
+                layerName = "UVMap"
+            layer = mymesh.uv_layers.new(name=layerName)
+            if len(uvs) == len(mymesh.loops):
+                uvs = uvs.astype(np.float32)
+                uvs[:, 1] = 1 - uvs[:, 1]
+                layer.data.foreach_set("uv", uvs.ravel())
+
+    resolution = lod.resolution
     meshName = meshName + "_" + resolutionName(resolution)      
     mymesh.name = meshName
     obj.name = meshName
 
     print("materials...")
-    indexData = {}
-    # Set up materials
-    for faceIdx in range(0,numFaces):
-        fd = faceData[faceIdx] 
-
-        textureName = fd[4]
-        materialName = fd[5]
-
-        try:
-            mat = materialData[(textureName, materialName)]
-            # Add the material if it isn't in
-            if mat.name not in mymesh.materials:
-                mymesh.materials.append(mat)
-                thisMatIndex = len(mymesh.materials)-1
-                indexData[mat] = thisMatIndex
-                #print("added new material at " + str(thisMatIndex))
-            else:
-                thisMatIndex = indexData [mat]
-                #print("old material " + str(thisMatIndex))
-                
-            mymesh.polygons[faceIdx].material_index = thisMatIndex
-        except:
-            pass
-        
-        
+    if not loadOnlyView and lod.numFaces > 0:
+        indexData = {}
+        matIndex = np.zeros(lod.numFaces, dtype=np.int32)
+        for faceIdx, key in enumerate(zip(lod.textures, lod.materials)):
+            thisMatIndex = indexData.get(key)
+            if thisMatIndex is None:
+                mat = getMaterial(materialData, key[0], key[1])
+                if mat is None:
+                    thisMatIndex = 0
+                else:
+                    mymesh.materials.append(mat)
+                    thisMatIndex = len(mymesh.materials)-1
+                indexData[key] = thisMatIndex
+            matIndex[faceIdx] = thisMatIndex
+        mymesh.polygons.foreach_set("material_index", matIndex)
+
     print("sharp edges")
-    # Set sharp edges
-    #if sharpEdges is not None:
-    #    for edge in mymesh.edges:
-    #        v1 = edge.vertices[0]
-    #        v2 = edge.vertices[1]
-    #        if [v1,v2] in sharpEdges:
-    #            mymesh.edges[edge.index].use_edge_sharp = True
-    #        elif [v2,v1] in sharpEdges:
-    #            mymesh.edges[edge.index].use_edge_sharp = True
-    #        else: 
-    #            print(f"Edge pair {v1},{v2} not found in edges")
-
-    # New Code
-    if sharpEdges is not None:
-        for sharpEdge in sharpEdges:
-            v1 = sharpEdge[0]
-            v2 = sharpEdge[1]
-            if (v1 > v2): # Swap if out of order
-                temp = v2
-                v2 = v1
-                v1 = temp
-            try: # Apparently, some models have sharp edges that (no longer) exist.
-                idx = edgeDict[(v1,v2)]
-                mymesh.edges[idx].use_edge_sharp = True
-            except:
-                print(f"WARNING: Edge {v1},{v2} does not exist")
-
-    #for pair in sharpEdges:
-    #    p1 = pair[0]
-    #    p2 = pair[1]
-    #    edge = mymesh.edges.get([mymesh.vertices[p1], mymesh.vertices[p2]])
-    #    print("edge = ", edge)
-    #    #if edge != None:
-    #    #    edge.use_edge_sharp = True
+    if len(lod.sharpEdges) > 0:
+        setSharpEdges(mymesh, lod.sharpEdges)
 
     # TODO: This causes faces with the same vertices but different normals to
     # be discarded. Don't want that
     #mymesh.validate()
     print("Normal calculation")
     mymesh.calc_normals()
-    for poly in mymesh.polygons:
-        poly.use_smooth = True
+    mymesh.polygons.foreach_set("use_smooth", np.ones(len(mymesh.polygons), dtype=bool))
 
     print("Add edge split")
     maybeAddEdgeSplit(obj)
     #scn.update()
     obj.select_set(True)
-    
-    #if layerFlag == True:
-    #    # Move to layer
-    #    objectLayers = getLayerMask(lodnr)
-    #    bpy.ops.object.move_to_layer(layers=objectLayers)
-
-    hasSet = False
-    oldres = resolution
-    resolution = correctedResolution(resolution)
-    offset = oldres - resolution
-    obj.armaObjProps.isArmaObject = True
-    if resolution <= 1000:
-        obj.armaObjProps.lodDistance = resolution
-        hasSet = True
-    else:
-        obj.armaObjProps.lodDistance = offset #0.0
 
     print("set LOD type")
-    # Set the right LOD type
-    lodPresets = ArmaToolbox.lodPresets
-    
-    for n in lodPresets:
-        if float(n[0]) == resolution:
-            obj.armaObjProps.lod = n[0]
-            hasSet = True
-             
-    if hasSet == False:
-        print("Error: unknown lod %f" % (resolution))
-        print("resolution %d" % (correctedResolution(resolution)))
+    setLodProperties(obj, resolution)
 
     print("weight")
 
-    if not loadOnlyView:
-        if weight is not None:
-            obj.armaObjProps.mass = weight
+    if not loadOnlyView and lod.mass is not None:
+        obj.armaObjProps.mass = float(lod.mass.sum())
 
-        if len(weightArray) > 0:
+        if len(lod.mass) > 0:
             bm = bmesh.new()
             bm.from_mesh(obj.data)
             bm.verts.ensure_lookup_table()
 
             weight_layer = bm.verts.layers.float.new('FHQWeights')
-            weight_layer = bm.verts.layers.float['FHQWeights']
-            print(weight_layer)
-            for i in range(0,len(weightArray)):
-                bm.verts[i][weight_layer] = weightArray[i]
+            for v, w in zip(bm.verts, lod.mass.tolist()):
+                v[weight_layer] = w
 
             bm.to_mesh(obj.data)
+            bm.free()
     
     obj.select_set(False)
 
@@ -557,6 +369,7 @@ def importMDL(context, fileName, layerFlag, loadCount, loadOnlyView):
     currentLayer = 0
     
     filePtr = open(fileName, "rb")
+    stream = MLODCodec.BinaryStream(filePtr)
     
     objName = path.basename(fileName).split(".")[0]
 
@@ -565,13 +378,12 @@ def importMDL(context, fileName, layerFlag, loadCount, loadOnlyView):
     materialData = {}
 
     # Read the header
-    sig = readSignature(filePtr)
-    version = readULong(filePtr)
-    numLods = readULong(filePtr)
+    sig, version, numLods = MLODCodec.readMLODHeader(stream)
     
     print ("Signature = {0}, version={1}, numLods = {2}".format(sig, version, numLods))
     
-    if version != 257 or sig != b'MLOD':
+    if version != MLODCodec.MLOD_VERSION or sig != MLODCodec.MLOD_SIGNATURE:
+        filePtr.close()
         return -1
     
     coll = bpy.data.collections.new(objName)
@@ -582,11 +394,9 @@ def importMDL(context, fileName, layerFlag, loadCount, loadOnlyView):
     
     # Start loading lods
     for i in range(0, numLods):
-        if not loadOnlyView:
-            if loadLOD(coll, filePtr, objName, materialData, layerFlag, i, loadOnlyView) != 0:
-                return -2
-        else:
-            loadLOD(coll, filePtr, objName, materialData, layerFlag, i, loadOnlyView)
+        if loadLOD(coll, stream, objName, materialData, layerFlag, i, loadOnlyView) != 0:
+            filePtr.close()
+            return -2
 
     filePtr.close()
 
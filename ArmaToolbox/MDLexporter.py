@@ -7,9 +7,13 @@ Created on 21.02.2014
 import bpy
 import os
 import math
-import struct
 import bmesh
+import tempfile
+import numpy as np
 import ArmaTools
+import MLODCodec
+from subprocess import call
+from MLODCodec import convertWeight, encodeWeights
 
 from properties import lodName
 
@@ -25,117 +29,41 @@ def stripAddonPath(path):
         return path
     
     
-def getMaterialInfo(face, obj):
+def getSlotMaterialInfo(material):
     textureName = ""
     materialName = ""
-    
-    if face.material_index >= 0 and face.material_index < len(obj.material_slots):
-        material = obj.material_slots[face.material_index].material
-        texType = material.armaMatProps.texType;
-    
-        if texType == 'Texture':
-            textureName = material.armaMatProps.texture;
-            textureName = stripAddonPath(textureName);
-        elif texType == 'Custom':
-            textureName = material.armaMatProps.colorString;
-        elif texType == 'Color':
-            textureName = "#(argb,8,8,3)color({0:.3f},{1:.3f},{2:.3f},1.0,{3})".format( 
-                material.armaMatProps.colorValue.r, 
-                material.armaMatProps.colorValue.g, 
-                material.armaMatProps.colorValue.b, 
-                material.armaMatProps.colorType)
-
-        materialName = stripAddonPath(material.armaMatProps.rvMat)
-        
-    
-    return (materialName, textureName)
-
-def lodKey(obj):
-    if obj.armaObjProps.lod == "-1.0":
-        return obj.armaObjProps.lodDistance
-    else:
-        return float(obj.armaObjProps.lod)
 
-def convertWeight(weight):
-    if weight > 1:
-        weight = 1;
-    value = round(255 - 254 * weight)
-    
-    if value == 255:
-        value = 0
-        
-    #print("weight = ", weight, " value=",value)
-    return value
+    if material is None:
+        return (materialName, textureName)
 
-def writeByte(filePtr, value):
-    filePtr.write(struct.pack("B", value))
+    texType = material.armaMatProps.texType;
 
-def writeSignature(filePtr, sig):
-    filePtr.write(bytes(sig, "UTF-8"))
+    if texType == 'Texture':
+        textureName = material.armaMatProps.texture;
+        textureName = stripAddonPath(textureName);
+    elif texType == 'Custom':
+        textureName = material.armaMatProps.colorString;
+    elif texType == 'Color':
+        textureName = "#(argb,8,8,3)color({0:.3f},{1:.3f},{2:.3f},1.0,{3})".format( 
+            material.armaMatProps.colorValue.r, 
+            material.armaMatProps.colorValue.g, 
+            material.armaMatProps.colorValue.b, 
+            material.armaMatProps.colorType)
 
-def writeULong(filePtr, value):
-    filePtr.write(struct.pack("I", value))
-    
-def writeFloat(filePtr, value):
-    filePtr.write(struct.pack("f", value))
+    materialName = stripAddonPath(material.armaMatProps.rvMat)
 
-def writeString(filePtr, value):
-    data = value.encode('ASCII')
-    packFormat = '<%ds' % (len(data) + 1)
-    filePtr.write(struct.pack(packFormat, data))
+    return (materialName, textureName)
 
-def writeBytes(filePtr, value):
-    filePtr.write(value)
+def getMaterialInfo(face, obj):
+    if face.material_index >= 0 and face.material_index < len(obj.material_slots):
+        return getSlotMaterialInfo(obj.material_slots[face.material_index].material)
+    return ("", "")
 
-# FaceNormals must be inverted (-X, -Y, -Z) for clockwise vertex order (default for DirectX), and not changed for counterclockwise order.
-def writeNormals(filePtr, mesh):
-    for v in mesh.vertices:
-        writeFloat(filePtr, -v.normal.x)
-        writeFloat(filePtr, -v.normal.z)
-        writeFloat(filePtr, -v.normal.y)
-
-def writeVertices(filePtr, mesh):
-    for v in mesh.vertices:
-        writeFloat(filePtr, v.co.x)
-        writeFloat(filePtr, v.co.z)
-        writeFloat(filePtr, v.co.y)
-        writeULong(filePtr, 0)
-
-def writeFaces(filePtr, obj, mesh):
-    for idx,face in enumerate(mesh.polygons):
-        if len(face.vertices) > 4:
-            raise RuntimeError("Model " + obj.name + " contains n-gons and cannot be exported")
-        materialName, textureName = getMaterialInfo(face, obj)
-        writeULong(filePtr, len(face.vertices))
-
-        # UV'S
-        uvs = []
-        for i1, loopindex in enumerate(face.loop_indices):
-            meshloop = mesh.loops[i1]
-            
-            try:
-                uv = mesh.uv_layers[0].data[loopindex].uv
-            except IndexError:
-                uv = [0,0]
-            uvs.append([uv[0], uv[1]])
-
-        for v in range(len(face.vertices)):
-            writeULong(filePtr, face.vertices[v]) # vert id
-            writeULong(filePtr, face.vertices[v]) # normal id
-            uv = uvs[v]
-            #print("u = ", uv[0], "v = ",uv[1])
-            uv[1] = 1 - uv[1]
-            writeFloat(filePtr, uv[0])
-            writeFloat(filePtr, uv[1])
-        
-        if len(face.vertices) == 3:
-            writeULong(filePtr, 0)
-            writeULong(filePtr, 0)
-            writeFloat(filePtr, 0.0)
-            writeFloat(filePtr, 0.0)
-        writeULong(filePtr, 0)
-        writeString(filePtr, textureName)
-        writeString(filePtr, materialName)
+def lodKey(obj):
+    if obj.armaObjProps.lod == "-1.0":
+        return obj.armaObjProps.lodDistance
+    else:
+        return float(obj.armaObjProps.lod)
 
 def proxyPathStrip(pathName):
     if len(pathName) > 3:
@@ -154,169 +82,142 @@ def fullNameIfProxy(obj,name):
         name = "proxy:" + proxyPathStrip(proxy.path) + "." + proxyIndex(proxy.index) 
     return name
 
-def writeNamedSelections(filePtr, obj, mesh):
-    # Build the array
-    print("named selections: Building list of selections")
-    selections = dict()
-    selectionsFace = dict()
-    for idx in range(len(obj.vertex_groups)):
-        name = obj.vertex_groups[idx].name
-        selections[name] = set()
-        selectionsFace[name] = set()
-
-    # We now go through all vertices and add their index to the appropriate groups
-    print("named selections: Going through vertices")
+# FaceNormals must be inverted (-X, -Y, -Z) for clockwise vertex order (default for DirectX), and not changed for counterclockwise order.
+def getNormals(mesh):
+    normals = np.zeros(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("normal", normals)
+    return -normals.reshape(-1, 3)[:, [0, 2, 1]]
+
+def getVertices(mesh):
+    co = np.zeros(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)[:, [0, 2, 1]]
+
+def getLoopUVs(mesh, idx):
+    # V is flipped in the P3D
+    uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+    if idx < len(mesh.uv_layers):
+        mesh.uv_layers[idx].data.foreach_get("uv", uvs)
+    uvs = uvs.reshape(-1, 2)
+    uvs[:, 1] = 1 - uvs[:, 1]
+    return uvs
+
+def setFaces(lod, obj, mesh):
+    numFaces = len(mesh.polygons)
+    sides = np.zeros(numFaces, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", sides)
+    if numFaces > 0 and sides.max() > 4:
+        raise RuntimeError("Model " + obj.name + " contains n-gons and cannot be exported")
+
+    loopVerts = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loopVerts)
+
+    matIndex = np.zeros(numFaces, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", matIndex)
+
+    # Material info only depends on the slot, so look it up once per slot
+    slotInfo = [getSlotMaterialInfo(slot.material) for slot in obj.material_slots]
+    textures = []
+    materials = []
+    for index in matIndex.tolist():
+        if index >= 0 and index < len(slotInfo):
+            materialName, textureName = slotInfo[index]
+        else:
+            materialName, textureName = ("", "")
+        textures.append(textureName)
+        materials.append(materialName)
+
+    # Normal indices are the same as the point indices
+    lod.setFaces(sides, loopVerts, loopVerts, getLoopUVs(mesh, 0), textures, materials)
+
+def getGroupIndex(obj, mesh):
+    '''
+    Inverted vertex group index, built in one pass over the vertices: a list
+    with one (vertex indices, weights) pair of arrays per vertex group.
+    '''
+    numGroups = len(obj.vertex_groups)
+    verts = [[] for i in range(numGroups)]
+    weights = [[] for i in range(numGroups)]
     for vertex in mesh.vertices:
-        groups = vertex.groups
-        for group in groups:
-            name = obj.vertex_groups[group.group].name
-            weight = group.weight
-            selections[name].add((vertex.index, weight))
-
-    # Now, collect face related weights. This can be either of two conditions:
-    # 1) The face is part of a Face Map
-    # 2) The vertices of this face have a weight greater than zero.
-    for face in mesh.polygons:
-        # This will get all the group indices in the current face
-        # Using a set will make sure they are unique
-        groups = set([grp.group for vert in face.vertices for grp in mesh.vertices[vert].groups])
-        for grpIdx in groups:
-            weight = sum([grp.weight for vert in face.vertices for grp in mesh.vertices[vert].groups if grp.group == grpIdx])
-            if weight > 0:
-                name = obj.vertex_groups[grpIdx].name
-                selectionsFace[name].add(face.index)
-
-    # At this point we can dump the array of groups into a file
-    print("named selections: writing to disk")
-    for name in selections:
+        index = vertex.index
+        for group in vertex.groups:
+            if group.group < numGroups:
+                verts[group.group].append(index)
+                weights[group.group].append(group.weight)
+    return [(np.array(v, dtype=np.int64), np.array(w, dtype=np.float32)) for v, w in zip(verts, weights)]
+
+def getNamedSelections(obj, mesh):
+    numVerts = len(mesh.vertices)
+    numFaces = len(mesh.polygons)
+
+    # Single pass over the vertices collecting the members of all groups
+    print("named selections: Going through vertices")
+    groupIndex = getGroupIndex(obj, mesh)
+
+    # A face belongs to a selection if any of its vertices has a weight
+    # greater than zero in that group. Vertex -> loops lookup (loops sorted
+    # by vertex, plus offsets) and loop -> face, so each group only touches
+    # the loops of its own vertices.
+    # TODO: use Face Map
+    loopVerts = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loopVerts)
+    loopStart = np.zeros(numFaces, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loopStart)
+    sides = np.zeros(numFaces, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", sides)
+
+    faceOrder = np.argsort(loopStart, kind='stable')
+    loopFace = np.repeat(faceOrder, sides[faceOrder])
+    vertLoops = np.argsort(loopVerts, kind='stable')
+    loopCount = np.bincount(loopVerts, minlength=numVerts)
+    loopOffset = np.concatenate(([0], np.cumsum(loopCount)))
+
+    selections = []
+    for idx, (verts, weights) in enumerate(groupIndex):
+        name = obj.vertex_groups[idx].name
         selName = fullNameIfProxy(obj, name)
         print(name, "->", selName)
-        writeByte(filePtr, 1)
-        writeString(filePtr, selName)
-        writeULong(filePtr, len(mesh.vertices) + len(mesh.polygons))
-        # Create a blob for the vertices and polygons
-        vertBlob = bytearray(len(mesh.vertices))
-        verts = selections[name]
-        for v in verts:
-            idx = v[0]
-            weight = convertWeight(v[1])
-            vertBlob[idx] = weight
-        writeBytes(filePtr, vertBlob)
-        # Polygons. TODO: use Face Map
-        polyBlob = bytearray(len(mesh.polygons))
-        faces = selectionsFace[name]
-        for f in faces:
-            polyBlob[f] = 1
-        writeBytes(filePtr, polyBlob)
-    print("named selections: done")
-
-def writeSharpEdges(filePtr, mesh):
-    # First, gather the edges of the flat shaded faces.
-    edges = [edge for face in mesh.polygons if not face.use_smooth for edge in face.edge_keys]
-    edges = sorted(set(edges))
-    print("taggs: sharp edges - gather sharp edges")
-    ###
-    # OLD CODE - new code below
-    ###
-    # Gather the edges with the "sharp" flag set
-    #edges2 = [edge for edge in mesh.edges if edge.use_edge_sharp]
-    #print("taggs: sharp edges - find doubles")
-    # We need to go through the edges to find the doubles.
-    #for edge in edges2:
-    #    v1 = edge.vertices[0]
-    #    v2 = edge.vertices[1]
-    #    if not (v1, v2) in edges and not (v2, v1) in edges:
-    #        edges = edges + [(v1, v2)]
-    
-    ###
-    # NEW CODE
-    ###
-    # ALternative approach: Insert the pairs of vertices into the edge list sorted, smallest index first
-    # Turn the list into a set to eliminate doubles
-    # turn it back into a list
-    for edge in mesh.edges:
-        if edge.use_edge_sharp:
-            v1 = edge.vertices[0]
-            v2 = edge.vertices[1]
-            if v1 < v2:
-                edges = edges + [(v1,v2)]
-            else:
-                edges = edges + [(v2,v1)]
-    
-    edge_set = set(edges)
-    edges = list(edge_set)
-
-
-    print("taggs: sharp edges - write them")
-    if (len(edges) > 0): # Only write this if we have sharp edges
-        writeByte(filePtr, 1)
-        writeString(filePtr, '#SharpEdges#')
-        writeULong(filePtr, len(edges) * 2 * 4)
-        for edge in edges:
-            writeULong(filePtr, edge[0])
-            writeULong(filePtr, edge[1])
-
-
-
-def writeMass(filePtr, obj, mesh):
-    writeByte(filePtr, 1)
-    writeString(filePtr, "#Mass#")
-    totalVerts = len(mesh.vertices)
-    writeULong(filePtr, totalVerts * 4)
-    if (totalVerts > 0):
-        bm = bmesh.new()
-        bm.from_mesh(obj.data)
-        bm.verts.ensure_lookup_table()
-        weight_layer = bm.verts.layers.float['FHQWeights']
-        
-        for i in range(0, len(bm.verts)):
-            f = bm.verts[i][weight_layer]
-            writeFloat(filePtr, f)
-    
 
+        vertBlob = np.zeros(numVerts, dtype=np.uint8)
+        vertBlob[verts] = encodeWeights(weights)
 
-def writeNamedProperty(filePtr, name, value):
-    writeByte(filePtr, 1)
-    writeString(filePtr, "#Property#")
-    writeULong(filePtr, 128)
-    filePtr.write(struct.pack("<64s", name.encode("ASCII")))
-    filePtr.write(struct.pack("<64s", value.encode("ASCII")))
-
-""" def writeUVSet(filePtr, layer, mesh, obj, totalUVs, idx):
-    writeByte(filePtr, 1)
-    writeString(filePtr, "#UVSet#")
-    writeULong(filePtr, 4+totalUVs * 8)
-    writeULong(filePtr, idx)
-    # Write UV Pairs
-    for i, face in enumerate(mesh.polygons):
-        for vertIdx in range(0, len(face.vertices)):
-            uvPair = [0,0]
-            try:
-                uvPair = [uvPair for 
-                    uvPair in 
-                    mesh.uv_layers[idx].data[face.index].uv[vertIdx]]
-            except Exception as e:
-                #print(e)
-                pass
-            writeFloat(filePtr, uvPair[0])
-            writeFloat(filePtr, 1-uvPair[1]) """
-
-def writeUVSet(filePtr, layer, mesh, obj, totalUVs, idx):
-    writeByte(filePtr, 1)
-    writeString(filePtr, "#UVSet#")
-    writeULong(filePtr, 4+totalUVs * 8)
-    writeULong(filePtr, idx)
-    # Write UV Pairs
-    for i, polygon in enumerate(mesh.polygons):
-        for vertIdx, loopindex in enumerate(polygon.loop_indices):
-            meshloop = mesh.loops[vertIdx]
-            try:
-                uv = mesh.uv_layers[idx].data[loopindex].uv
-            except:
-                uv = [0,0]
-            uvPair = [uv[0],uv[1]]
-            writeFloat(filePtr, uvPair[0])
-            writeFloat(filePtr, 1-uvPair[1])
+        faceBlob = np.zeros(numFaces, dtype=np.uint8)
+        members = verts[weights > 0]
+        counts = loopCount[members]
+        total = int(counts.sum())
+        if total > 0:
+            first = np.repeat(loopOffset[members] - (np.cumsum(counts) - counts), counts)
+            faceBlob[loopFace[vertLoops[first + np.arange(total)]]] = 1
+
+        selections.append(MLODCodec.MLODSelection(selName, vertBlob, faceBlob))
+    return selections
+
+def getSharpEdges(mesh):
+    # Edges of the flat shaded faces
+    edges = [edge for face in mesh.polygons if not face.use_smooth for edge in face.edge_keys]
+    edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+
+    # Plus the edges with the "sharp" flag set, smallest index first
+    edgeVerts = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edgeVerts)
+    sharp = np.zeros(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get("use_edge_sharp", sharp)
+    edgeVerts = np.sort(edgeVerts.reshape(-1, 2)[sharp], axis=1)
+
+    edges = np.concatenate((edges, edgeVerts))
+    if len(edges) == 0:
+        return edges
+    return np.unique(edges, axis=0)
+
+def getMass(obj, mesh):
+    if len(mesh.vertices) == 0:
+        return np.zeros(0, dtype=np.float32)
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    weight_layer = bm.verts.layers.float['FHQWeights']
+    mass = np.array([v[weight_layer] for v in bm.verts], dtype=np.float32)
+    bm.free()
+    return mass
 
 def checkMass(obj, lod, mesh):
     # Check if the LOD is a geometry or physx, and add a dummy selection
@@ -333,10 +234,6 @@ def checkMass(obj, lod, mesh):
 
 def export_lod(filePtr, obj, wm, idx):
     ArmaTools.optimize_export_lod(obj)
-    # Header
-    writeSignature(filePtr, 'P3DM')
-    writeULong(filePtr, 0x1C)
-    writeULong(filePtr, 0x100)
     print("Write lod ",idx)
     wm.progress_update(idx*5)
     
@@ -352,74 +249,46 @@ def export_lod(filePtr, obj, wm, idx):
     #if lod == 1.000e+13 or lod == 4.000e+13:
     #    checkMass(obj, lod, mesh)
 
+    mlod = MLODCodec.MLODLod()
+
     print("Writing Vertices")    
-    # Write number of vertices, normals, and faces
-    writeULong(filePtr, len(mesh.vertices))         # Number of Vertices
-    writeULong(filePtr, len(mesh.vertices))            # Number of Normals
-    writeULong(filePtr, len(mesh.polygons))   # Number of Faces
-    writeULong(filePtr, 0)                          # Unused Flags
-    
-    # Write vertices/Points
-    writeVertices(filePtr, mesh)
+    mlod.points = getVertices(mesh)
     wm.progress_update(idx*5+1)
     
     print("Writing Normals")
-    # Write normals
     # We can basically write whatever we like here since they are recalculated
-    #normalOffsetInFile = filePtr.tell();
-    writeNormals(filePtr, mesh)
+    mlod.normals = getNormals(mesh)
     wm.progress_update(idx*5+2)
             
     print("Writing faces")
-    # Write faces
-    writeFaces(filePtr, obj, mesh)
+    setFaces(mlod, obj, mesh)
     wm.progress_update(idx*5+3)
 
-
-            
-    # Done, now write Taggs
-    writeSignature(filePtr, 'TAGG')
     print("taggs: Named selections")
-    # Write named selections
-    writeNamedSelections(filePtr, obj, mesh)
+    mlod.selections = getNamedSelections(obj, mesh)
     print("taggs: sharp edges")
-    # Write sharp edges. This isn't the most efficient, but I don't really see a better possibility
-    writeSharpEdges(filePtr, mesh)
+    mlod.sharpEdges = getSharpEdges(mesh)
     wm.progress_update(idx*5+4)
     
     print("taggs: mass (if any)")
     # Write a mass selection if this is a Geometry or PhysX LOD
-    if lod == 1.000e+13 or lod == 4.000e+13:
-        writeMass(filePtr, obj, mesh)
+    if lod in MLODCodec.MASS_LODS:
+        mlod.mass = getMass(obj, mesh)
 
     print("taggs: named props")
-    # Write named properties
-    for prop in obj.armaObjProps.namedProps:
-        name = prop.name
-        value = prop.value
-        writeNamedProperty(filePtr, name, value)
+    mlod.properties = [(prop.name, prop.value) for prop in obj.armaObjProps.namedProps]
     
     print("taggs: uvsets")
-    # Write UVSets
-    # First, count the number of polygon vertices
-    totalUVs = 0
-    for face in mesh.polygons:
-        totalUVs = totalUVs + len(face.vertices)
-    
-    uvt = mesh.uv_layers
-    for i,layer in enumerate(uvt):
+    for i in range(len(mesh.uv_layers)):
         print("Writing UV Set ", i)
-        writeUVSet(filePtr, layer, mesh, obj, totalUVs, i)
-    
-        
-    # Close off the LOD
-    writeByte(filePtr, True)
-    writeString(filePtr, '#EndOfFile#')
-    writeULong(filePtr, 0)
+        mlod.uvSets[i] = getLoopUVs(mesh, i)
+
     if lod == 1.000e4 or lod == 2.000e4:
-        writeFloat(filePtr, lod+obj.armaObjProps.lodDistance)
+        mlod.resolution = lod+obj.armaObjProps.lodDistance
     else:
-        writeFloat(filePtr, lod)
+        mlod.resolution = lod
+
+    MLODCodec.writeLOD(filePtr, mlod)
     
     
 def sameLod(objects, index):
@@ -508,13 +377,24 @@ def exportMDL(myself, fileName, objects, applyModifiers, mergeSameLOD):
 
     return True
 
+# Number of LODs that end up in the file. Objects of the same LOD count
+# only once when they are merged.
+def lodCount(objects, mergeSameLOD):
+    objects = sorted(objects, key=lodKey)
+    if mergeSameLOD == False:
+        return len(objects)
+
+    count = 0
+    for idx in range(len(objects)):
+        if not sameLod(objects, idx):
+            count = count + 1
+    return count
+
 def exportObjectListAsMDL(myself, filePtr, applyModifiers, mergeSameLOD, objects):
     objects = sorted(objects, key=lodKey)
     
     # Write file header
-    writeSignature(filePtr, 'MLOD')
-    writeULong(filePtr, 0x101)
-    writeULong(filePtr, len(objects))
+    MLODCodec.writeMLODHeader(filePtr, lodCount(objects, mergeSameLOD))
     
     wm = bpy.context.window_manager
     total = len(objects) * 5
@@ -584,3 +464,22 @@ def exportObjectListAsMDL(myself, filePtr, applyModifiers, mergeSameLOD, objects
 
     wm.progress_end()
         
+
+
+# Run O2Script over an exported file so that it gets re-saved by the
+# Bohemia tools.
+def convertWithO2Script(o2Script, fileName):
+    # Write a temporary O2script file for this
+    filePtr = tempfile.NamedTemporaryFile("w", delete=False)
+    tmpName = filePtr.name
+    filePtr.write("p3d = newLodObject;\n")
+    filePtr.write('_res = p3d loadP3D "%s";\n' % (fileName))
+    filePtr.write("_res = p3d setActive 4e13;")
+    filePtr.write('save p3d;\n')
+    filePtr.close()
+
+    # Run O2Script to output the P3D
+    command = '"' + o2Script +'" "' + tmpName + '"'
+    print("command = " + command)
+    call (command, shell=True)
+    os.remove(tmpName)
@@ -0,0 +1,468 @@
+'''
+Created on 19.10.2026
+
+Read and write unbinarized P3D (MLOD) files without Blender.
+
+This module only depends on NumPy. It holds the knowledge about the binary
+layout of MLOD files; MDLImporter and MDLexporter translate between the data
+model defined here and Blender meshes.
+
+File layout:
+
+    "MLOD" version numLods
+    numLods times:
+        "P3DM" major minor numPoints numNormals numFaces flags
+        points      numPoints * (x, y, z, flags)
+        normals     numNormals * (x, y, z)
+        faces       numFaces * (sides, 4 * (point, normal, u, v), flags, texture\\0, material\\0)
+        "TAGG"
+        taggs       (active, name\\0, size, data) until "#EndOfFile#"
+        resolution
+
+Coordinates are stored as they appear in the file, i.e. with Y up. UVs
+are stored unflipped as well.
+
+'''
+import struct
+import numpy as np
+
+MLOD_SIGNATURE = b'MLOD'
+MLOD_VERSION = 0x101
+LOD_SIGNATURE = b'P3DM'
+LOD_MAJOR = 0x1c
+LOD_MINOR = 0x100
+TAGG_SIGNATURE = b'TAGG'
+END_OF_FILE = "#EndOfFile#"
+
+POINT_DTYPE = np.dtype([
+    ('pos', '<f4', (3,)),
+    ('flags', '<i4')])
+
+FACE_VERTEX_DTYPE = np.dtype([
+    ('point', '<i4'),
+    ('normal', '<i4'),
+    ('uv', '<f4', (2,))])
+
+FACE_DTYPE = np.dtype([
+    ('sides', '<i4'),
+    ('vertices', FACE_VERTEX_DTYPE, (4,)),
+    ('flags', '<i4')])
+
+# Mass LODs: Geometry and Geometry PhysX
+MASS_LODS = (1.000e+13, 4.000e+13)
+
+
+class MLODError(Exception):
+    pass
+
+
+###
+##  Selection weights
+#
+
+def decodeWeight(b):
+    if  b == 0:
+        return  0.0
+    elif b == 2:
+        return 1.0
+    elif b > 2:
+        return 1.0 - round( (b-2) / 2.55555 )*0.01
+    elif b < 0:
+        return -round( b / 2.55555 ) * 0.01
+    else:
+        return 1.0 #TODO: Correct?
+
+def convertWeight(weight):
+    if weight > 1:
+        weight = 1;
+    value = round(255 - 254 * weight)
+
+    if value == 255:
+        value = 0
+
+    return value
+
+# Lookup table for all 256 (signed) byte values
+_decodeTable = np.array([decodeWeight(b - 256 if b > 127 else b) for b in range(256)], dtype=np.float32)
+
+def decodeWeights(data):
+    ''' Decode an array of selection bytes into weights '''
+    return _decodeTable[np.asarray(data, dtype=np.uint8)]
+
+def encodeWeights(weights):
+    ''' Vectorized convertWeight '''
+    values = np.rint(255 - 254 * np.minimum(np.asarray(weights, dtype=np.float64), 1.0))
+    values[values == 255] = 0
+    return values.astype(np.uint8)
+
+
+###
+##  Data model
+#
+
+class MLODSelection:
+    ''' A named selection. Weights are kept in their encoded byte form. '''
+    def __init__(self, name, vertices, faces):
+        self.name = name
+        self.vertices = vertices    # uint8, one per point
+        self.faces = faces          # uint8, one per face
+
+    def vertexWeights(self):
+        return decodeWeights(self.vertices)
+
+
+class MLODLod:
+    def __init__(self):
+        self.resolution = 0.0
+        self.flags = 0
+        self.points = np.zeros((0, 3), dtype=np.float32)
+        self.pointFlags = np.zeros(0, dtype=np.int32)
+        self.normals = np.zeros((0, 3), dtype=np.float32)
+        self.faces = np.zeros(0, dtype=FACE_DTYPE)
+        self.textures = []          # one per face
+        self.materials = []         # one per face
+        self.selections = []        # MLODSelection, in file order
+        self.sharpEdges = np.zeros((0, 2), dtype=np.int32)
+        self.mass = None            # float32 per point, or None
+        self.properties = []        # (name, value) pairs
+        self.uvSets = {}            # uv set id -> (numLoops, 2) float32
+        self.taggs = []             # other taggs as (name, bytes), written as they are
+
+    @property
+    def numPoints(self):
+        return len(self.points)
+
+    @property
+    def numFaces(self):
+        return len(self.faces)
+
+    def faceSides(self):
+        return self.faces['sides']
+
+    def loopMask(self):
+        ''' (numFaces, 4) mask of the face vertex slots that are in use '''
+        return np.arange(4) < self.faces['sides'][:, None]
+
+    def loopPoints(self):
+        ''' Point indices of all face vertices in face order '''
+        return self.faces['vertices']['point'][self.loopMask()]
+
+    def loopUVs(self):
+        ''' UVs of the face table in face order '''
+        return self.faces['vertices']['uv'][self.loopMask()]
+
+    def faceList(self):
+        ''' Faces as a list of point index lists '''
+        points = self.faces['vertices']['point'].tolist()
+        return [p[:n] for p, n in zip(points, self.faces['sides'].tolist())]
+
+    def selection(self, name):
+        for sel in self.selections:
+            if sel.name == name:
+                return sel
+        return None
+
+    def setFaces(self, sides, points, normals, uvs, textures, materials):
+        '''
+        Build the face table from loop arrays. sides holds the number of
+        vertices per face, points, normals and uvs one entry per loop.
+        '''
+        sides = np.asarray(sides, dtype=np.int32)
+        if len(sides) > 0 and sides.max() > 4:
+            raise MLODError("Faces can have at most four vertices")
+
+        faces = np.zeros(len(sides), dtype=FACE_DTYPE)
+        faces['sides'] = sides
+        mask = np.arange(4) < sides[:, None]
+        verts = faces['vertices']
+        verts['point'][mask] = points
+        verts['normal'][mask] = normals
+        verts['uv'][mask] = uvs
+
+        self.faces = faces
+        self.textures = list(textures)
+        self.materials = list(materials)
+
+
+class MLODFile:
+    def __init__(self, lods=None):
+        self.version = MLOD_VERSION
+        self.lods = lods if lods is not None else []
+
+
+###
+##  Reading
+#
+
+class BinaryStream:
+    '''
+    Buffered reader over a binary file. Reads the file in large chunks so
+    that zero terminated strings and small records don't hit the file
+    object one byte at a time.
+    '''
+    def __init__(self, filePtr, chunkSize=1 << 20):
+        self.filePtr = filePtr
+        self.chunkSize = chunkSize
+        self.buffer = b''
+        self.pos = 0
+
+    def _fill(self, size):
+        available = len(self.buffer) - self.pos
+        if available >= size:
+            return
+        data = self.filePtr.read(max(self.chunkSize, size - available))
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        if len(self.buffer) < size:
+            raise MLODError("Unexpected end of file")
+
+    def read(self, size):
+        self._fill(size)
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def skip(self, size):
+        available = len(self.buffer) - self.pos
+        if size <= available:
+            self.pos += size
+        else:
+            self.filePtr.seek(size - available, 1)
+            self.buffer = b''
+            self.pos = 0
+
+    def readCStringBytes(self):
+        while True:
+            end = self.buffer.find(b'\000', self.pos)
+            if end != -1:
+                data = self.buffer[self.pos:end]
+                self.pos = end + 1
+                return data
+            if not self._more():
+                raise MLODError("Unexpected end of file")
+
+    def readCString(self):
+        return decodeString(self.readCStringBytes())
+
+    def _more(self):
+        data = self.filePtr.read(self.chunkSize)
+        if len(data) == 0:
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, self.read(size))
+
+    def readInt(self):
+        return self.unpack('<i')[0]
+
+    def readFloat(self):
+        return self.unpack('<f')[0]
+
+    def readArray(self, dtype, count):
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.read(dtype.itemsize * count), dtype=dtype, count=count).copy()
+
+
+def decodeString(data):
+    # surrogateescape keeps non-UTF-8 names intact when they're written back
+    return data.decode("utf-8", "surrogateescape")
+
+def encodeString(value):
+    return value.encode("utf-8", "surrogateescape")
+
+def readMLODHeader(stream):
+    ''' Read the file header, returns (signature, version, numLods) '''
+    sig, version, numLods = stream.unpack('<4sii')
+    return sig, version, numLods
+
+def readLODHeader(stream):
+    sig, major, minor = stream.unpack('<4sii')
+    if sig != LOD_SIGNATURE:
+        raise MLODError("Not a P3DM LOD ({0})".format(sig))
+    if major != LOD_MAJOR:
+        raise MLODError("Unknown major version {0}".format(major))
+    if minor != LOD_MINOR:
+        raise MLODError("Unknown minor version {0}".format(minor))
+    return stream.unpack('<iiii')
+
+FACE_RECORD_SIZE = FACE_DTYPE.itemsize
+
+def readFaceTable(stream, numFaces):
+    '''
+    Read the face table. Returns the fixed size records as an array of
+    FACE_DTYPE and the texture and material names as lists.
+    '''
+    records = bytearray()
+    textures = []
+    materials = []
+    for i in range(numFaces):
+        records += stream.read(FACE_RECORD_SIZE)
+        textures.append(stream.readCString())
+        materials.append(stream.readCString())
+    faces = np.frombuffer(bytes(records), dtype=FACE_DTYPE, count=numFaces).copy()
+    return faces, textures, materials
+
+def readTaggHeader(stream):
+    active = stream.read(1)
+    name = stream.readCString()
+    size = stream.readInt()
+    return active != b'\000', name, size
+
+def readLOD(stream, readTaggs=True):
+    '''
+    Read a single LOD from the stream. With readTaggs False, the taggs are
+    skipped and only geometry and resolution are returned.
+    '''
+    lod = MLODLod()
+
+    numPoints, numNormals, numFaces, lod.flags = readLODHeader(stream)
+
+    points = stream.readArray(POINT_DTYPE, numPoints)
+    lod.points = points['pos'].copy()
+    lod.pointFlags = points['flags'].copy()
+    lod.normals = stream.readArray('<f4', numNormals * 3).reshape(numNormals, 3)
+
+    lod.faces, lod.textures, lod.materials = readFaceTable(stream, numFaces)
+
+    if stream.read(4) != TAGG_SIGNATURE:
+        raise MLODError("No tagg signature")
+
+    while True:
+        active, name, size = readTaggHeader(stream)
+        if name == END_OF_FILE:
+            stream.skip(size)
+            break
+        if not active or not readTaggs:
+            stream.skip(size)
+            continue
+        readTagg(stream, lod, name, size)
+
+    lod.resolution = stream.readFloat()
+    return lod
+
+def readTagg(stream, lod, name, size):
+    numPoints = lod.numPoints
+    numFaces = lod.numFaces
+
+    if name == "#SharpEdges#":
+        lod.sharpEdges = stream.readArray('<i4', size // 4).reshape(-1, 2)
+    elif name == "#Property#":
+        data = stream.read(size)
+        propName, propValue = struct.unpack("64s64s", data[:128])
+        lod.properties.append((
+            decodeString(propName.split(b'\000', 1)[0]),
+            decodeString(propValue.split(b'\000', 1)[0])))
+    elif name == "#UVSet#":
+        uvSetId = stream.readInt()
+        count = (size - 4) // 8
+        lod.uvSets[uvSetId] = stream.readArray('<f4', count * 2).reshape(count, 2)
+    elif name == "#Mass#":
+        lod.mass = stream.readArray('<f4', size // 4)
+    elif name[0] == '#':
+        lod.taggs.append((name, stream.read(size)))
+    else:
+        # Named selection
+        data = np.frombuffer(stream.read(size), dtype=np.uint8)
+        lod.selections.append(MLODSelection(name,
+                                            data[:numPoints].copy(),
+                                            data[numPoints:numPoints + numFaces].copy()))
+
+def iterLODs(filePtr, readTaggs=True, maxLods=-1):
+    '''
+    Generator yielding the LODs of an MLOD file one by one, so only a
+    single LOD needs to be in memory at a time.
+    '''
+    stream = BinaryStream(filePtr)
+    sig, version, numLods = readMLODHeader(stream)
+    if sig != MLOD_SIGNATURE or version != MLOD_VERSION:
+        raise MLODError("Not an MLOD file or wrong version ({0}, {1})".format(sig, version))
+    if maxLods != -1:
+        numLods = min(numLods, maxLods)
+    for i in range(numLods):
+        yield readLOD(stream, readTaggs)
+
+def readMLOD(fileName, readTaggs=True):
+    with open(fileName, "rb") as filePtr:
+        return MLODFile(list(iterLODs(filePtr, readTaggs)))
+
+
+###
+##  Writing
+#
+
+def packString(value):
+    return encodeString(value) + b'\000'
+
+def packTagg(name, data):
+    return b'\001' + packString(name) + struct.pack('<I', len(data)) + data
+
+def packProperty(name, value):
+    return packTagg("#Property#", struct.pack("<64s64s", encodeString(name), encodeString(value)))
+
+def writeMLODHeader(filePtr, numLods):
+    filePtr.write(MLOD_SIGNATURE + struct.pack('<II', MLOD_VERSION, numLods))
+
+def packFaceTable(lod):
+    records = lod.faces.astype(FACE_DTYPE, copy=False).tobytes()
+    names = {}
+    parts = []
+    for i, key in enumerate(zip(lod.textures, lod.materials)):
+        suffix = names.get(key)
+        if suffix is None:
+            suffix = packString(key[0]) + packString(key[1])
+            names[key] = suffix
+        offset = i * FACE_RECORD_SIZE
+        parts.append(records[offset:offset + FACE_RECORD_SIZE])
+        parts.append(suffix)
+    return b''.join(parts)
+
+def packTaggs(lod):
+    parts = []
+    for sel in lod.selections:
+        data = np.asarray(sel.vertices, dtype=np.uint8).tobytes() + np.asarray(sel.faces, dtype=np.uint8).tobytes()
+        parts.append(packTagg(sel.name, data))
+
+    if len(lod.sharpEdges) > 0:
+        parts.append(packTagg("#SharpEdges#", np.asarray(lod.sharpEdges, dtype='<u4').tobytes()))
+
+    if lod.mass is not None:
+        parts.append(packTagg("#Mass#", np.asarray(lod.mass, dtype='<f4').tobytes()))
+
+    for name, value in lod.properties:
+        parts.append(packProperty(name, value))
+
+    for uvSetId, uvs in lod.uvSets.items():
+        parts.append(packTagg("#UVSet#", struct.pack('<I', uvSetId) + np.asarray(uvs, dtype='<f4').tobytes()))
+
+    for name, data in lod.taggs:
+        parts.append(packTagg(name, data))
+
+    parts.append(packTagg(END_OF_FILE, b''))
+    return b''.join(parts)
+
+def writeLOD(filePtr, lod):
+    numPoints = lod.numPoints
+    filePtr.write(LOD_SIGNATURE + struct.pack('<6I', LOD_MAJOR, LOD_MINOR,
+                                             numPoints, len(lod.normals), lod.numFaces, lod.flags))
+
+    points = np.zeros(numPoints, dtype=POINT_DTYPE)
+    points['pos'] = lod.points
+    if len(lod.pointFlags) == numPoints:
+        points['flags'] = lod.pointFlags
+    filePtr.write(points.tobytes())
+    filePtr.write(np.asarray(lod.normals, dtype='<f4').tobytes())
+    filePtr.write(packFaceTable(lod))
+
+    filePtr.write(TAGG_SIGNATURE)
+    filePtr.write(packTaggs(lod))
+    filePtr.write(struct.pack('<f', lod.resolution))
+
+def writeMLOD(fileName, lods):
+    with open(fileName, "wb") as filePtr:
+        writeMLODHeader(filePtr, len(lods))
+        for lod in lods:
+            writeLOD(filePtr, lod)
@@ -0,0 +1,307 @@
+'''
+Created on 19.10.2026
+
+Rewrite texture and material paths inside MLOD P3D files without going
+through Blender.
+
+    python P3DRewriter.py --input P:\\ca --table --dry-run --report changes.json
+    python P3DRewriter.py --input P:\\mymod --reparent ca\\=a3\\ --output P:\\mymod_a3
+
+The files are streamed: points, normals, the fixed part of the face records
+and all taggs are copied through byte for byte, only the texture and
+material names of the faces are rewritten. Files are processed in parallel
+in a process pool. With --dry-run nothing is written, the report lists every
+name that would change.
+
+'''
+import sys, os
+sys.path.append(os.path.dirname(__file__))
+
+import json
+import time
+import struct
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import MLODCodec
+from MLODCodec import BinaryStream, MLODError
+from TextureTranslation import defaultTable, normalizeTextureName
+
+COPY_CHUNK = 1 << 20
+
+###
+##  Name translation
+#
+
+def normalizeName(name):
+    return normalizeTextureName(name)
+
+def parseReparent(value):
+    frm, sep, to = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected FROM=TO, got " + value)
+    return (frm, to)
+
+def translateName(name, table, reparent):
+    '''
+    Return the new name for a texture or material path, or the name itself
+    if no rule matches. Procedural textures (#...) are never touched.
+    '''
+    if len(name) == 0 or name[0] == '#':
+        return name
+
+    if table:
+        base, ext = os.path.splitext(name)
+        dst = table.get(normalizeName(name))
+        if dst is not None:
+            return dst + ext
+
+    # Same as ArmaTools.changeParentIf, but case insensitive since the
+    # game doesn't care about case either.
+    stripped = name.lstrip('\\')
+    for frm, to in reparent:
+        if stripped.lower().startswith(frm.lower()):
+            return to + stripped[len(frm):]
+
+    return name
+
+
+###
+##  Streaming rewrite
+#
+
+class Rewriter:
+    '''
+    Copies one MLOD file from a BinaryStream to an output file, passing the
+    face names through translateName.
+    '''
+    def __init__(self, table, reparent):
+        self.table = table
+        self.reparent = reparent
+        self.cache = {}
+        self.changes = []
+
+    def translate(self, raw):
+        try:
+            return self.cache[raw]
+        except KeyError:
+            pass
+        name = MLODCodec.decodeString(raw)
+        newName = translateName(name, self.table, self.reparent)
+        result = raw if newName == name else MLODCodec.encodeString(newName)
+        self.cache[raw] = result
+        return result
+
+    def copy(self, stream, out, size):
+        while size > 0:
+            n = min(size, COPY_CHUNK)
+            if out is not None:
+                out.write(stream.read(n))
+            else:
+                stream.skip(n)
+            size -= n
+
+    def rewriteFaces(self, stream, out, numFaces, lodChanges):
+        parts = []
+        for i in range(numFaces):
+            parts.append(stream.read(MLODCodec.FACE_RECORD_SIZE))
+            for kind in ("texture", "material"):
+                raw = stream.readCStringBytes()
+                new = self.translate(raw)
+                if new != raw:
+                    key = (kind, raw, new)
+                    lodChanges[key] = lodChanges.get(key, 0) + 1
+                parts.append(new)
+                parts.append(b'\000')
+            if len(parts) >= 4096:
+                if out is not None:
+                    out.write(b''.join(parts))
+                parts = []
+        if out is not None:
+            out.write(b''.join(parts))
+
+    def rewriteLOD(self, stream, out):
+        header = stream.read(28)
+        sig, major, minor, numPoints, numNormals, numFaces, flags = struct.unpack('<4s6i', header)
+        if sig != MLODCodec.LOD_SIGNATURE or major != MLODCodec.LOD_MAJOR or minor != MLODCodec.LOD_MINOR:
+            raise MLODError("Unsupported LOD header ({0}, {1}, {2})".format(sig, major, minor))
+        if out is not None:
+            out.write(header)
+
+        self.copy(stream, out, numPoints * MLODCodec.POINT_DTYPE.itemsize + numNormals * 12)
+
+        lodChanges = {}
+        self.rewriteFaces(stream, out, numFaces, lodChanges)
+
+        tagg = stream.read(4)
+        if tagg != MLODCodec.TAGG_SIGNATURE:
+            raise MLODError("No tagg signature")
+        if out is not None:
+            out.write(tagg)
+
+        while True:
+            active = stream.read(1)
+            name = stream.readCStringBytes()
+            size = stream.read(4)
+            if out is not None:
+                out.write(active + name + b'\000' + size)
+            self.copy(stream, out, struct.unpack('<i', size)[0])
+            if name == MLODCodec.END_OF_FILE.encode():
+                break
+
+        resolution = stream.read(4)
+        if out is not None:
+            out.write(resolution)
+
+        resolution = struct.unpack('<f', resolution)[0]
+        for (kind, old, new), count in lodChanges.items():
+            self.changes.append({
+                "lod": resolution,
+                "kind": kind,
+                "old": MLODCodec.decodeString(old),
+                "new": MLODCodec.decodeString(new),
+                "faces": count,
+            })
+
+    def rewrite(self, filePtr, out):
+        stream = BinaryStream(filePtr)
+        header = stream.read(12)
+        sig, version, numLods = struct.unpack('<4sii', header)
+        if sig != MLODCodec.MLOD_SIGNATURE or version != MLODCodec.MLOD_VERSION:
+            raise MLODError("Not an MLOD file or wrong version ({0}, {1})".format(sig, version))
+        if out is not None:
+            out.write(header)
+
+        for i in range(numLods):
+            self.rewriteLOD(stream, out)
+
+        # Anything after the last LOD is copied as it is
+        if out is not None:
+            out.write(stream.buffer[stream.pos:])
+            while True:
+                data = filePtr.read(COPY_CHUNK)
+                if len(data) == 0:
+                    break
+                out.write(data)
+
+
+def rewriteFile(fileName, outputName=None, table=None, reparent=(), dryRun=False):
+    '''
+    Rewrite a single file. outputName None rewrites the file in place, in
+    which case it is only touched if something changed. Returns a report
+    dictionary for the file.
+    '''
+    start = time.perf_counter()
+    report = {"file": fileName, "changes": []}
+    rewriter = Rewriter(table, reparent)
+
+    if outputName is None:
+        outputName = fileName
+
+    try:
+        with open(fileName, "rb") as filePtr:
+            if dryRun:
+                rewriter.rewrite(filePtr, None)
+            else:
+                outputDir = os.path.dirname(os.path.abspath(outputName))
+                os.makedirs(outputDir, exist_ok=True)
+                fd, tmpName = tempfile.mkstemp(suffix=".p3d", dir=outputDir)
+                try:
+                    with os.fdopen(fd, "wb") as out:
+                        rewriter.rewrite(filePtr, out)
+                except:
+                    os.remove(tmpName)
+                    raise
+
+        if not dryRun:
+            if len(rewriter.changes) == 0 and outputName == fileName:
+                os.remove(tmpName)
+            else:
+                os.replace(tmpName, outputName)
+                report["output"] = outputName
+    except (MLODError, OSError) as e:
+        report["error"] = str(e)
+
+    report["changes"] = rewriter.changes
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def _rewriteJob(job):
+    return rewriteFile(*job)
+
+def findP3DFiles(inputDir):
+    result = []
+    for root, dirs, files in os.walk(inputDir):
+        for name in files:
+            if name.lower().endswith(".p3d"):
+                result.append(os.path.join(root, name))
+    return sorted(result)
+
+def rewriteFiles(fileNames, inputDir=None, outputDir=None, table=None, reparent=(), dryRun=False, jobs=None):
+    '''
+    Rewrite a list of files in a process pool. If outputDir is given, the
+    files are written there, keeping their path relative to inputDir.
+    '''
+    jobList = []
+    for fileName in fileNames:
+        outputName = None
+        if outputDir is not None:
+            rel = os.path.relpath(fileName, inputDir) if inputDir else os.path.basename(fileName)
+            outputName = os.path.join(outputDir, rel)
+        jobList.append((fileName, outputName, table, list(reparent), dryRun))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_rewriteJob, jobList, chunksize=4))
+
+    return {
+        "files": results,
+        "changed": [r["file"] for r in results if len(r["changes"]) > 0],
+        "errors": [r for r in results if "error" in r],
+        "dryRun": dryRun,
+        "seconds": time.perf_counter() - start,
+    }
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="P3DRewriter",
+                                     description="Rewrite texture and material paths in MLOD P3D files")
+    parser.add_argument("--input", required=True, help="P3D file or directory to search for P3D files")
+    parser.add_argument("--output", default=None, help="Output directory. Files are rewritten in place if omitted")
+    parser.add_argument("--table", action="store_true",
+                        help="Apply the texture translation tables (ca\\ to a3\\, CUP and user overrides)")
+    parser.add_argument("--translations", action="append", default=[], metavar="FILE",
+                        help="Additional texture translation file, overrides the others. Implies --table. Can be repeated")
+    parser.add_argument("--reparent", action="append", type=parseReparent, default=[], metavar="FROM=TO",
+                        help="Replace the path prefix FROM by TO. Can be repeated")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArguments(sys.argv[1:] if argv is None else argv)
+
+    table = None
+    if args.table or args.translations:
+        table = defaultTable(args.translations)
+
+    if os.path.isdir(args.input):
+        inputDir = args.input
+        fileNames = findP3DFiles(args.input)
+    else:
+        inputDir = os.path.dirname(args.input)
+        fileNames = [args.input]
+
+    report = rewriteFiles(fileNames, inputDir, args.output, table, args.reparent, args.dry_run, args.jobs)
+
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,10 +33,13 @@ global.
 import struct
 import bpy
 import bmesh
+import os
 import os.path as path
 import ArmaToolbox
 import math
 import mathutils
+import re
+import numpy as np
 
 def writeSignature(filePtr, sig):
     filePtr.write(bytes(sig, "UTF-8"))
@@ -54,52 +57,269 @@ def RTMFrameTime(frame, startFrame, endFrame):
     frameIdx = frame - startFrame
     return frameIdx / (endFrame - startFrame)
         
-def writeRTMFrame(filePtr, boneNames, blendObject, keyframe, frameTime):
-    writeFloat(filePtr, frameTime)
-    for boneName in boneNames:
-        writeBone(filePtr, boneName)
-        
-        poseBone = blendObject.pose.bones[boneName]
-        mat = mathutils.Matrix(poseBone.matrix_channel)
-        mat.transpose()
-
-        # M00 M02 M01
-        # M20 M22 M21
-        # M10 M12 M11
-        # M30 M32 M31
-
-        writeFloat(filePtr, mat[0][0])
-        writeFloat(filePtr, mat[0][2])
-        writeFloat(filePtr, mat[0][1])
-
-        writeFloat(filePtr, mat[2][0])
-        writeFloat(filePtr, mat[2][2])
-        writeFloat(filePtr, mat[2][1])
-
-        writeFloat(filePtr, mat[1][0])
-        writeFloat(filePtr, mat[1][2])
-        writeFloat(filePtr, mat[1][1])
-        
-        writeFloat(filePtr, mat[3][0])
-        writeFloat(filePtr, mat[3][2])
-        writeFloat(filePtr, mat[3][1])
+# One bone of a frame: name and the 4x3 matrix
+RTM_BONE_DTYPE = np.dtype([('name', 'S32'), ('matrix', '<f4', (12,))])
+
+def rtmMatrices(channels):
+    '''
+    Convert (B, 4, 4) transposed matrix_channel arrays (the memory layout
+    foreach_get returns) to the (B, 12) layout of the RTM file:
+
+    M00 M02 M01
+    M20 M22 M21
+    M10 M12 M11
+    M30 M32 M31
+    '''
+    return channels[:, [0, 2, 1, 3]][:, :, [0, 2, 1]].reshape(-1, 12)
+
+class RTMFrameWriter:
+    '''
+    Packs a whole frame into a single buffer. The bone name records are
+    encoded once and reused for every frame.
+    '''
+    def __init__(self, boneNames):
+        self.records = np.zeros(len(boneNames), dtype=RTM_BONE_DTYPE)
+        self.records['name'] = [bytes(boneName, "UTF-8") for boneName in boneNames]
+        self.nameRecords = self.records['name'].tobytes()
+
+    def boneNameRecords(self):
+        return self.nameRecords
+
+    def header(self, motionVector, numFrames):
+        ''' Signature, motion vector (file order), frame and bone count and the bone names '''
+        return (struct.pack('<8s3f2I', b"RTM_0101", motionVector[0], motionVector[1], motionVector[2],
+                            numFrames, len(self.records))
+                + self.nameRecords)
+
+    def pack(self, frameTime, channels):
+        self.records['matrix'] = rtmMatrices(channels)
+        return struct.pack('<f', frameTime) + self.records.tobytes()
+
+def rtmBoneNames(armature):
+    ''' Bones that go into the RTM. Names starting or ending with @ are left out '''
+    boneNames = []
+    for bone in armature.bones:
+        if len(bone.name)>0:
+            if bone.name[0] != '@' and bone.name[-1] != '@':
+                boneNames.append(bone.name)
+    return boneNames
+
+def poseBoneIndices(blendObject, boneNames):
+    index = {pbone.name: i for i, pbone in enumerate(blendObject.pose.bones)}
+    return np.array([index[boneName] for boneName in boneNames], dtype=np.int64)
+
+def poseChannels(blendObject, boneIndices):
+    ''' Transposed matrix_channel of the given pose bones as (B, 4, 4) '''
+    poseBones = blendObject.pose.bones
+    data = np.empty(len(poseBones) * 16, dtype=np.float32)
+    poseBones.foreach_get("matrix_channel", data)
+    return data.reshape(-1, 4, 4)[boneIndices]
+
+def writeRTMFrame(filePtr, frameWriter, blendObject, boneIndices, frameTime):
+    filePtr.write(frameWriter.pack(frameTime, poseChannels(blendObject, boneIndices)))
+
+
+###
+##  Action sampling
+#
+#   Evaluating the armature's action directly instead of calling
+#   scene.frame_set for every keyframe. frame_set updates the whole
+#   depsgraph (meshes, modifiers, drivers...) while all we need is the
+#   pose channels of a single armature. This only works when the pose is
+#   fully defined by the action, see ActionPoseSampler.unsupportedReason.
 
+_channelPath = re.compile(r'^pose\.bones\["((?:[^"\\]|\\.)*)"\]\.(location|rotation_quaternion|rotation_euler|rotation_axis_angle|scale)$')
 
-def getMotionVector(context, boneName, firstKf, lastKf):
+_channelSizes = {
+    "location": 3,
+    "rotation_quaternion": 4,
+    "rotation_euler": 3,
+    "rotation_axis_angle": 4,
+    "scale": 3,
+}
+
+def channelBoneName(match):
+    ''' Unescaped bone name of a _channelPath match '''
+    return match.group(1).replace('\\"', '"').replace('\\\\', '\\')
+
+class ActionPoseSampler:
+    def __init__(self, blendObject):
+        self.blendObject = blendObject
+        armature = blendObject.data
+
+        # Parents before children
+        self.bones = []
+        def walk(bone):
+            self.bones.append(bone)
+            for child in bone.children:
+                walk(child)
+        for bone in armature.bones:
+            if bone.parent is None:
+                walk(bone)
+
+        self.restRelative = {}
+        self.restInverse = {}
+        for bone in self.bones:
+            if bone.parent is None:
+                self.restRelative[bone.name] = bone.matrix_local.copy()
+            else:
+                self.restRelative[bone.name] = bone.parent.matrix_local.inverted() @ bone.matrix_local
+            self.restInverse[bone.name] = bone.matrix_local.inverted()
+
+    @staticmethod
+    def unsupportedReason(blendObject):
+        '''
+        None if the pose of blendObject can be computed from its action
+        alone, otherwise the reason why not.
+        '''
+        anim = blendObject.animation_data
+        if anim is None or anim.action is None:
+            return "no action"
+        reason = ActionPoseSampler.actionUnsupportedReason(anim.action)
+        if reason is not None:
+            return reason
+        return ActionPoseSampler.objectUnsupportedReason(blendObject)
+
+    @staticmethod
+    def actionUnsupportedReason(action):
+        ''' The part of unsupportedReason that depends on the action '''
+        # The sampler only evaluates bone channels. Anything else the action
+        # animates (the object's own transform in particular, which moves
+        # matrix_world and thus the motion vector) needs frame_set
+        for fcurve in action.fcurves:
+            if not fcurve.mute and not fcurve.data_path.startswith("pose.bones["):
+                return "object animation (" + fcurve.data_path + ")"
+        return None
+
+    @staticmethod
+    def objectUnsupportedReason(blendObject):
+        ''' The part of unsupportedReason that is the same for every action '''
+        anim = blendObject.animation_data
+        if anim is None:
+            return "no action"
+        if len(anim.drivers) > 0:
+            return "drivers"
+        if any(not track.mute for track in anim.nla_tracks):
+            return "NLA tracks"
+        if getattr(anim, "action_influence", 1.0) != 1.0 or getattr(anim, "action_blend_type", 'REPLACE') != 'REPLACE':
+            return "action blending"
+        if blendObject.data.pose_position != 'POSE':
+            return "armature in rest position"
+        if blendObject.data.animation_data is not None and len(blendObject.data.animation_data.drivers) > 0:
+            return "drivers"
+        if any(not c.mute for c in blendObject.constraints):
+            return "object constraints"
+
+        for pbone in blendObject.pose.bones:
+            if any(not c.mute for c in pbone.constraints):
+                return "constraints on " + pbone.name
+            bone = pbone.bone
+            if not bone.use_inherit_rotation or not bone.use_local_location or bone.use_relative_parent:
+                return "inheritance settings of " + pbone.name
+            if getattr(bone, "inherit_scale", 'FULL') != 'FULL':
+                return "inheritance settings of " + pbone.name
+        return None
+
+    def evaluateChannels(self, frames):
+        '''
+        Returns {boneName: {channel: array (frames, size)}}. Channels
+        without an fcurve keep their current value, just like they would
+        with frame_set.
+        '''
+        numFrames = len(frames)
+        values = {}
+        for pbone in self.blendObject.pose.bones:
+            values[pbone.name] = {
+                channel: np.tile(np.array(getattr(pbone, channel), dtype=np.float64), (numFrames, 1))
+                    for channel in _channelSizes
+            }
+
+        for fcurve in self.blendObject.animation_data.action.fcurves:
+            if fcurve.mute:
+                continue
+            match = _channelPath.match(fcurve.data_path)
+            if match is None:
+                continue
+            boneName = channelBoneName(match)
+            channel = match.group(2)
+            if boneName not in values or fcurve.array_index >= _channelSizes[channel]:
+                continue
+            evaluate = fcurve.evaluate
+            values[boneName][channel][:, fcurve.array_index] = [evaluate(f) for f in frames]
+        return values
+
+    def rotationMatrix(self, pbone, channels, i):
+        mode = pbone.rotation_mode
+        if mode == 'QUATERNION':
+            q = mathutils.Quaternion(channels["rotation_quaternion"][i])
+            if q.magnitude == 0:
+                return mathutils.Matrix.Identity(3)
+            q.normalize()
+            return q.to_matrix()
+        elif mode == 'AXIS_ANGLE':
+            angle, x, y, z = channels["rotation_axis_angle"][i]
+            axis = mathutils.Vector((x, y, z))
+            if axis.length == 0:
+                return mathutils.Matrix.Identity(3)
+            return mathutils.Matrix.Rotation(angle, 3, axis.normalized())
+        else:
+            return mathutils.Euler(channels["rotation_euler"][i], mode).to_matrix()
+
+    def poseMatrices(self, frames):
+        '''
+        Returns one dictionary per frame with the armature space pose matrix
+        (pose_bone.matrix) of every bone.
+        '''
+        values = self.evaluateChannels(frames)
+        pbones = self.blendObject.pose.bones
+        result = []
+        for i in range(len(frames)):
+            poses = {}
+            for bone in self.bones:
+                pbone = pbones[bone.name]
+                channels = values[bone.name]
+                # Same as pose_bone.matrix_basis: loc @ rot @ scale
+                basis = self.rotationMatrix(pbone, channels, i).to_4x4()
+                sx, sy, sz = channels["scale"][i]
+                basis = basis @ mathutils.Matrix.Diagonal((sx, sy, sz, 1.0))
+                basis.translation = basis.translation + mathutils.Vector(channels["location"][i])
+
+                pose = self.restRelative[bone.name] @ basis
+                if bone.parent is not None:
+                    pose = poses[bone.parent.name] @ pose
+                poses[bone.name] = pose
+            result.append(poses)
+        return result
+
+    def channelArray(self, poses, boneNames):
+        '''
+        matrix_channel (pose @ rest^-1) of the bones, transposed like
+        poseChannels returns them
+        '''
+        channels = np.array([poses[name] @ self.restInverse[name] for name in boneNames], dtype=np.float32)
+        return channels.reshape(-1, 4, 4).transpose(0, 2, 1)
+
+
+def getMotionVector(context, boneName, firstKf, lastKf, sampler=None):
 
     blendObject = context.object
     armature = blendObject.data
     scene = context.scene
 
-    scene.frame_set(firstKf)
-    bone = blendObject.pose.bones[boneName]
-    matrix_final = blendObject.matrix_world * bone.matrix
-    vec1 = matrix_final.to_translation()
+    if sampler is not None:
+        poses = sampler.poseMatrices([firstKf, lastKf])
+        vec1 = (blendObject.matrix_world @ poses[0][boneName]).to_translation()
+        vec2 = (blendObject.matrix_world @ poses[1][boneName]).to_translation()
+    else:
+        scene.frame_set(firstKf)
+        bone = blendObject.pose.bones[boneName]
+        matrix_final = blendObject.matrix_world @ bone.matrix
+        vec1 = matrix_final.to_translation()
 
-    scene.frame_set(lastKf)
-    bone = blendObject.pose.bones[boneName]
-    matrix_final = blendObject.matrix_world * bone.matrix
-    vec2 = matrix_final.to_translation()
+        scene.frame_set(lastKf)
+        bone = blendObject.pose.bones[boneName]
+        matrix_final = blendObject.matrix_world @ bone.matrix
+        vec2 = matrix_final.to_translation()
 
     vector = vec2 - vec1
     
@@ -107,7 +327,28 @@ def getMotionVector(context, boneName, firstKf, lastKf):
     v = [vector[0], vector[2], vector[1]]
     return v
 
-def exportRTM(context, keyframeList, filepath="", staticPose=False, clipFrames=True):
+def packRTMFrames(scene, blendObject, frameWriter, boneNames, boneIndices, keyframeList,
+                  startFrame, endFrame, sampler=None):
+    ''' Packed frames for the keyframes, sampled from the action or with frame_set '''
+    if sampler is not None:
+        return [frameWriter.pack(RTMFrameTime(keyframe, startFrame, endFrame),
+                                 sampler.channelArray(poses, boneNames))
+                    for keyframe, poses in zip(keyframeList, sampler.poseMatrices(keyframeList))]
+
+    frames = []
+    for keyframe in keyframeList:
+        scene.frame_set(keyframe)
+        frames.append(frameWriter.pack(RTMFrameTime(keyframe, startFrame, endFrame),
+                                       poseChannels(blendObject, boneIndices)))
+    return frames
+
+def exportRTM(context, keyframeList, filepath="", staticPose=False, clipFrames=True, sampleAction=True):
+    '''
+    With sampleAction, the pose channels are computed from the armature's
+    action instead of calling scene.frame_set for every keyframe. This
+    falls back to frame_set when the pose depends on more than the action
+    (constraints, drivers, NLA...).
+    '''
     filePtr = open(filepath, "wb")
     
     blendObject = context.object
@@ -132,12 +373,15 @@ def exportRTM(context, keyframeList, filepath="", staticPose=False, clipFrames=T
         staticPose = True
     
     # Find our bone names
-    boneNames = []
-    
-    for bone in armature.bones:
-        if len(bone.name)>0:
-            if bone.name[0] != '@' and bone.name[-1] != '@':
-                boneNames.append(bone.name)
+    boneNames = rtmBoneNames(armature)
+
+    sampler = None
+    if sampleAction and not staticPose:
+        reason = ActionPoseSampler.unsupportedReason(blendObject)
+        if reason is None:
+            sampler = ActionPoseSampler(blendObject)
+        else:
+            print("RTM export: sampling with frame_set because of " + reason)
 
 
     # At this point we're ready to start writing
@@ -159,7 +403,7 @@ def exportRTM(context, keyframeList, filepath="", staticPose=False, clipFrames=T
     else:
         # With a bone selected, calculate the real motion vector
         boneName = blendObject.armaObjProps.centerBone
-        vector = getMotionVector(context, boneName, keyframeList[0], keyframeList[-1])
+        vector = getMotionVector(context, boneName, keyframeList[0], keyframeList[-1], sampler)
         writeFloat(filePtr, vector[0])
         writeFloat(filePtr, vector[1])
         writeFloat(filePtr, vector[2])
@@ -173,22 +417,191 @@ def exportRTM(context, keyframeList, filepath="", staticPose=False, clipFrames=T
     writeULong(filePtr, len(boneNames))
     
     # Write out the bone names
-    for boneName in boneNames:
-        writeBone(filePtr, boneName)
+    frameWriter = RTMFrameWriter(boneNames)
+    boneIndices = poseBoneIndices(blendObject, boneNames)
+    filePtr.write(frameWriter.boneNameRecords())
     keyframeList = sorted(keyframeList)
     if not staticPose:    
         ############################
         # Start writing RTM Frames
         # for a non-static animation
-        for keyframe in keyframeList:
-            scene.frame_set(keyframe)
-            writeRTMFrame(filePtr, boneNames, blendObject, keyframe, RTMFrameTime(keyframe, startFrame, endFrame)) 
+        for frame in packRTMFrames(scene, blendObject, frameWriter, boneNames, boneIndices,
+                                   keyframeList, startFrame, endFrame, sampler):
+            filePtr.write(frame)
     else:
         ############################
         # Wrtie out the current pose
         # as a static pose
-        writeRTMFrame(filePtr, boneNames, blendObject, 0, 0)
-        writeRTMFrame(filePtr, boneNames, blendObject, 1, 1)
+        writeRTMFrame(filePtr, frameWriter, blendObject, boneIndices, 0)
+        writeRTMFrame(filePtr, frameWriter, blendObject, boneIndices, 1)
     
     
-    filePtr.close()
\ No newline at end of file
+    filePtr.close()
+
+
+###
+##  Exporting all actions of an armature
+#
+#   The bone list, the name records and the sampler (rest matrices,
+#   hierarchy) are set up once. Each action is assigned to the armature in
+#   turn and sampled, the finished file is handed to a writer thread while
+#   the next action is sampled.
+
+_invalidFileChars = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+def actionFileName(action):
+    return _invalidFileChars.sub('_', action.name) + ".rtm"
+
+def actionAnimatesArmature(action, blendObject):
+    ''' True if the action has an fcurve for one of the armature's pose bones '''
+    poseBones = blendObject.pose.bones
+    for fcurve in action.fcurves:
+        match = _channelPath.match(fcurve.data_path)
+        if match is not None and channelBoneName(match) in poseBones:
+            return True
+    return False
+
+def armatureActions(blendObject, patterns=None):
+    '''
+    Actions for this armature, optionally filtered by a list of fnmatch
+    patterns on the action name
+    '''
+    import fnmatch
+    result = []
+    for action in bpy.data.actions:
+        if patterns and not any(fnmatch.fnmatch(action.name, pat) for pat in patterns):
+            continue
+        if actionAnimatesArmature(action, blendObject):
+            result.append(action)
+    return result
+
+def actionKeyframes(action, mode, keyframeList=None):
+    '''
+    Frames to export for an action and the (start, end) range the frame
+    times are relative to. mode is
+        'KEYS'  every frame that has a key in one of the fcurves
+        'ALL'   every frame of the action's frame range
+        'LIST'  the armature's RTM keyframe list, clipped to the action
+    '''
+    start = int(math.floor(action.frame_range[0]))
+    end = int(math.ceil(action.frame_range[1]))
+    if end <= start:
+        end = start + 1
+
+    if mode == 'ALL':
+        frames = range(start, end + 1)
+    elif mode == 'LIST':
+        frames = [k for k in (keyframeList or []) if start <= k <= end]
+    else:
+        keys = set()
+        for fcurve in action.fcurves:
+            co = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+            fcurve.keyframe_points.foreach_get("co", co)
+            keys.update(int(round(f)) for f in co[0::2])
+        frames = keys
+
+    return sorted(set(frames)), start, end
+
+def writeRTMFile(fileName, parts):
+    with open(fileName, "wb") as filePtr:
+        filePtr.write(b''.join(parts))
+    return fileName
+
+def exportActions(context, outputDir, actions=None, frameMode='KEYS', sampleAction=True, writers=4):
+    '''
+    Export every action in actions (default: all actions animating the
+    active armature) to <outputDir>/<action>.rtm. The armature's action is
+    restored afterwards. Returns a list of {action, file, frames, seconds}
+    and a list of {action, error}.
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    import time
+
+    blendObject = context.object
+    scene = context.scene
+    props = blendObject.armaObjProps
+
+    if actions is None:
+        actions = armatureActions(blendObject)
+    keyframeList = [k.timeIndex for k in props.keyFrames]
+
+    boneNames = rtmBoneNames(blendObject.data)
+    frameWriter = RTMFrameWriter(boneNames)
+    boneIndices = poseBoneIndices(blendObject, boneNames)
+
+    if blendObject.animation_data is None:
+        blendObject.animation_data_create()
+    anim = blendObject.animation_data
+    oldAction = anim.action
+    oldFrame = scene.frame_current
+
+    os.makedirs(outputDir, exist_ok=True)
+    results = []
+    errors = []
+    sharedSampler = None
+    checked = False
+    usedFrameSet = False
+
+    try:
+        with ThreadPoolExecutor(max_workers=writers) as pool:
+            pending = []
+            for action in actions:
+                start = time.perf_counter()
+                anim.action = action
+
+                # The object and armature settings are the same for all
+                # actions and only need checking once, the action's own
+                # channels are checked for each action
+                if sampleAction and not checked:
+                    checked = True
+                    reason = ActionPoseSampler.objectUnsupportedReason(blendObject)
+                    if reason is None:
+                        sharedSampler = ActionPoseSampler(blendObject)
+                    else:
+                        print("RTM export: sampling with frame_set because of " + reason)
+
+                sampler = sharedSampler
+                if sampler is not None:
+                    reason = ActionPoseSampler.actionUnsupportedReason(action)
+                    if reason is not None:
+                        print("RTM export: sampling {0} with frame_set because of {1}".format(action.name, reason))
+                        sampler = None
+                usedFrameSet = usedFrameSet or sampler is None
+
+                keyframes, startFrame, endFrame = actionKeyframes(action, frameMode, keyframeList)
+                if len(keyframes) == 0:
+                    errors.append({"action": action.name, "error": "no keyframes"})
+                    continue
+
+                if len(props.centerBone) == 0:
+                    vector = props.motionVector
+                    motionVector = (vector[0], vector[2], vector[1])
+                else:
+                    motionVector = getMotionVector(context, props.centerBone, keyframes[0], keyframes[-1], sampler)
+
+                parts = [frameWriter.header(motionVector, len(keyframes))]
+                parts += packRTMFrames(scene, blendObject, frameWriter, boneNames, boneIndices,
+                                       keyframes, startFrame, endFrame, sampler)
+
+                fileName = path.join(outputDir, actionFileName(action))
+                pending.append((action.name, fileName, len(keyframes), time.perf_counter() - start,
+                                pool.submit(writeRTMFile, fileName, parts)))
+
+            for actionName, fileName, numFrames, seconds, future in pending:
+                try:
+                    future.result()
+                except OSError as e:
+                    errors.append({"action": actionName, "error": str(e)})
+                    continue
+                results.append({
+                    "action": actionName,
+                    "file": fileName,
+                    "frames": numFrames,
+                    "seconds": seconds,
+                })
+    finally:
+        anim.action = oldAction
+        if usedFrameSet:
+            scene.frame_set(oldFrame)
+
+    return results, errors
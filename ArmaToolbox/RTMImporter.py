@@ -0,0 +1,270 @@
+'''
+Created on 19.10.2026
+
+Import RTM_0101 animations onto an armature.
+
+The file is read in one go into a structured NumPy array. The RV matrices
+are turned back into matrix_channel (see RTMExporter.rtmMatrices for the
+layout), then into local pose transforms relative to the parent bone:
+
+    pose    = channel @ rest
+    basis   = (parent_pose @ parent_rest^-1 @ rest)^-1 @ pose
+
+for all frames and bones at once. The keys are added to the fcurves in
+bulk with keyframe_points.add/foreach_set.
+
+'''
+import struct
+import bpy
+import mathutils
+import os.path as path
+import numpy as np
+
+from RTMExporter import RTM_BONE_DTYPE
+from lists import KeyframeRegistry
+
+RTM_SIGNATURE = b"RTM_0101"
+
+class RTMError(Exception):
+    pass
+
+def readRTM(fileName):
+    '''
+    Returns a dictionary with the motion vector (Blender axes), the frame
+    times, the bone names and the (frames, bones, 4, 4) channel matrices
+    (Blender layout, translation in the last column).
+    '''
+    with open(fileName, "rb") as filePtr:
+        data = filePtr.read()
+
+    if data[:8] != RTM_SIGNATURE:
+        raise RTMError("Not an RTM_0101 file")
+
+    mx, mz, my = struct.unpack_from("<3f", data, 8)
+    numFrames, numBones = struct.unpack_from("<2I", data, 20)
+    offset = 28
+
+    names = np.frombuffer(data, dtype='S32', count=numBones, offset=offset)
+    offset += 32 * numBones
+    boneNames = [n.decode("UTF-8", "replace") for n in names]
+
+    frameDtype = np.dtype([('time', '<f4'), ('bones', RTM_BONE_DTYPE, (numBones,))])
+    if len(data) < offset + frameDtype.itemsize * numFrames:
+        raise RTMError("File is truncated")
+    frames = np.frombuffer(data, dtype=frameDtype, count=numFrames, offset=offset)
+
+    return {
+        "motionVector": (mx, my, mz),
+        "times": frames['time'].astype(np.float64),
+        "boneNames": boneNames,
+        "channels": channelsFromRTM(frames['bones']['matrix']),
+    }
+
+def channelsFromRTM(matrices):
+    '''
+    Inverse of RTMExporter.rtmMatrices. matrices is (..., 12), returns
+    (..., 4, 4) matrix_channel in Blender's (row major) layout.
+    '''
+    rows = matrices.reshape(matrices.shape[:-1] + (4, 3)).astype(np.float64)
+    transposed = np.zeros(matrices.shape[:-1] + (4, 4))
+    # Undo the row and column swizzle of the exporter
+    transposed[..., [0, 2, 1, 3], :3] = rows[..., :, [0, 2, 1]]
+    transposed[..., 3, 3] = 1.0
+    return np.swapaxes(transposed, -1, -2)
+
+###
+##  Matrix math
+#
+
+def localTransforms(channels, rest, parents):
+    '''
+    Pose bone matrix_basis for every frame and bone.
+    channels (F, B, 4, 4), rest the bones' matrix_local (B, 4, 4), parents
+    the index of each bone's parent or -1. Bones must come after their
+    parents.
+    '''
+    poses = channels @ rest
+    basis = np.empty_like(poses)
+    for b, parent in enumerate(parents):
+        if parent < 0:
+            restRelative = rest[b]
+            parentPose = np.eye(4)
+        else:
+            restRelative = np.linalg.inv(rest[parent]) @ rest[b]
+            parentPose = poses[:, parent]
+        basis[:, b] = np.linalg.inv(parentPose @ restRelative) @ poses[:, b]
+    return basis
+
+def decomposeMatrices(matrices):
+    ''' (..., 4, 4) into location (..., 3), quaternion (..., 4, wxyz) and scale (..., 3) '''
+    location = matrices[..., :3, 3]
+    rot = matrices[..., :3, :3]
+    scale = np.linalg.norm(rot, axis=-2)
+    rot = rot / np.where(scale == 0, 1, scale)[..., None, :]
+
+    # Shepperd's method, picking the largest diagonal element for stability
+    m = rot
+    trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+    candidates = np.stack((trace, m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]), axis=-1)
+    choice = np.argmax(candidates, axis=-1)
+
+    q = np.empty(m.shape[:-2] + (4,))
+    s = np.sqrt(np.maximum(1.0 + trace, 1e-12)) * 2
+    q0 = np.stack((0.25 * s,
+                   (m[..., 2, 1] - m[..., 1, 2]) / s,
+                   (m[..., 0, 2] - m[..., 2, 0]) / s,
+                   (m[..., 1, 0] - m[..., 0, 1]) / s), axis=-1)
+
+    s = np.sqrt(np.maximum(1.0 + m[..., 0, 0] - m[..., 1, 1] - m[..., 2, 2], 1e-12)) * 2
+    q1 = np.stack(((m[..., 2, 1] - m[..., 1, 2]) / s,
+                   0.25 * s,
+                   (m[..., 0, 1] + m[..., 1, 0]) / s,
+                   (m[..., 0, 2] + m[..., 2, 0]) / s), axis=-1)
+
+    s = np.sqrt(np.maximum(1.0 + m[..., 1, 1] - m[..., 0, 0] - m[..., 2, 2], 1e-12)) * 2
+    q2 = np.stack(((m[..., 0, 2] - m[..., 2, 0]) / s,
+                   (m[..., 0, 1] + m[..., 1, 0]) / s,
+                   0.25 * s,
+                   (m[..., 1, 2] + m[..., 2, 1]) / s), axis=-1)
+
+    s = np.sqrt(np.maximum(1.0 + m[..., 2, 2] - m[..., 0, 0] - m[..., 1, 1], 1e-12)) * 2
+    q3 = np.stack(((m[..., 1, 0] - m[..., 0, 1]) / s,
+                   (m[..., 0, 2] + m[..., 2, 0]) / s,
+                   (m[..., 1, 2] + m[..., 2, 1]) / s,
+                   0.25 * s), axis=-1)
+
+    q = np.choose(choice[..., None], (q0, q1, q2, q3))
+    q /= np.linalg.norm(q, axis=-1, keepdims=True)
+    return location, q, scale
+
+def makeQuaternionsContinuous(quats):
+    '''
+    Flip quaternions along the first (frame) axis so that consecutive keys
+    take the short way, otherwise the fcurve interpolation spins around.
+    '''
+    quats = quats.copy()
+    for f in range(1, len(quats)):
+        flip = np.sum(quats[f] * quats[f - 1], axis=-1) < 0
+        quats[f][flip] = -quats[f][flip]
+    return quats
+
+###
+##  Blender side
+#
+
+def addFCurve(action, dataPath, index, group, frames, values):
+    fcurve = action.fcurves.find(dataPath, index=index)
+    if fcurve is not None:
+        action.fcurves.remove(fcurve)
+    fcurve = action.fcurves.new(dataPath, index=index, action_group=group)
+    fcurve.keyframe_points.add(len(frames))
+    co = np.empty(len(frames) * 2, dtype=np.float32)
+    co[0::2] = frames
+    co[1::2] = values
+    fcurve.keyframe_points.foreach_set("co", co)
+    fcurve.update()
+    return fcurve
+
+def rotationChannels(rotationMode, quats):
+    ''' Convert (F, 4) quaternions to the values of the bone's rotation mode '''
+    if rotationMode == 'QUATERNION':
+        return "rotation_quaternion", quats
+
+    values = []
+    previous = None
+    for q in quats:
+        q = mathutils.Quaternion(q)
+        if rotationMode == 'AXIS_ANGLE':
+            axis, angle = q.to_axis_angle()
+            values.append((angle, axis[0], axis[1], axis[2]))
+        else:
+            e = q.to_euler(rotationMode) if previous is None else q.to_euler(rotationMode, previous)
+            previous = e
+            values.append(tuple(e))
+
+    if rotationMode == 'AXIS_ANGLE':
+        return "rotation_axis_angle", np.array(values)
+    return "rotation_euler", np.array(values)
+
+def importRTM(context, fileName, frameStart=None, frameLength=0, setFrameRange=True,
+              addKeyframeList=True, includeScale=False):
+    '''
+    Import an RTM onto the active armature as a new action. Frame times
+    (0..1) are mapped to frameStart .. frameStart + frameLength, with
+    frameLength 0 meaning one frame per RTM frame. Returns the action.
+    '''
+    blendObject = context.object
+    armature = blendObject.data
+    rtm = readRTM(fileName)
+
+    if frameStart is None:
+        frameStart = context.scene.frame_start
+    numFrames = len(rtm["times"])
+    if frameLength <= 0:
+        frameLength = max(numFrames - 1, 1)
+    frames = frameStart + rtm["times"] * frameLength
+
+    # Bones of the armature in hierarchy order, parents first
+    order = []
+    def walk(bone):
+        order.append(bone)
+        for child in bone.children:
+            walk(child)
+    for bone in armature.bones:
+        if bone.parent is None:
+            walk(bone)
+
+    boneIndex = {bone.name: i for i, bone in enumerate(order)}
+    fileIndex = {name.lower(): i for i, name in enumerate(rtm["boneNames"])}
+
+    # Bones that aren't in the file keep their rest pose
+    channels = np.tile(np.eye(4), (numFrames, len(order), 1, 1))
+    found = []
+    for bone in order:
+        i = fileIndex.get(bone.name.lower())
+        if i is not None:
+            channels[:, boneIndex[bone.name]] = rtm["channels"][:, i]
+            found.append(bone.name)
+
+    rest = np.array([np.array(bone.matrix_local) for bone in order])
+    parents = [boneIndex[bone.parent.name] if bone.parent is not None else -1 for bone in order]
+
+    basis = localTransforms(channels, rest, parents)
+    location, quats, scale = decomposeMatrices(basis)
+    quats = makeQuaternionsContinuous(quats)
+
+    action = bpy.data.actions.new(path.splitext(path.basename(fileName))[0])
+    if blendObject.animation_data is None:
+        blendObject.animation_data_create()
+    blendObject.animation_data.action = action
+
+    for name in found:
+        b = boneIndex[name]
+        pbone = blendObject.pose.bones[name]
+        prefix = 'pose.bones["%s"].' % bpy.utils.escape_identifier(name)
+
+        for axis in range(3):
+            addFCurve(action, prefix + "location", axis, name, frames, location[:, b, axis])
+
+        channel, values = rotationChannels(pbone.rotation_mode, quats[:, b])
+        for axis in range(values.shape[1]):
+            addFCurve(action, prefix + channel, axis, name, frames, values[:, axis])
+
+        if includeScale:
+            for axis in range(3):
+                addFCurve(action, prefix + "scale", axis, name, frames, scale[:, b, axis])
+
+    mx, my, mz = rtm["motionVector"]
+    blendObject.armaObjProps.motionVector = (mx, my, mz)
+
+    if addKeyframeList:
+        KeyframeRegistry(blendObject.armaObjProps.keyFrames).addMany(frames)
+
+    if setFrameRange:
+        context.scene.frame_start = int(frameStart)
+        context.scene.frame_end = int(round(frameStart + frameLength))
+
+    missing = len(rtm["boneNames"]) - len(found)
+    if missing > 0:
+        print("RTM import: {0} bones of the file are not in the armature".format(missing))
+    return action
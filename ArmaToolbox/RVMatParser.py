@@ -0,0 +1,337 @@
+'''
+Created on 19.10.2026
+
+Tokenizer and parser for rvmat files (the config class syntax).
+
+    class Stage1
+    {
+        texture = "a3\data_f\env_co.paa";    // comment
+        uvSource = "tex";
+        class uvTransform { aside[] = {1, 0, 0}; };
+    };
+
+The parser builds a small tree of RVClass, RVValue and RVArray nodes. Every
+value keeps the span (start, end) of its text in the file, so textures can
+be replaced in place without touching the rest of the file.
+
+Parsed files are cached by path, size and modification time: relocating a
+material and scanning dependencies parse each rvmat only once per session,
+and a file that changed on disk is parsed again.
+
+'''
+import os
+import re
+
+class RVMatError(Exception):
+    pass
+
+TOKEN_RE = re.compile(r'''
+      (?P<space>\s+)
+    | (?P<comment>//[^\n]*|/\*.*?\*/)
+    | (?P<directive>\#(?:include|define|undef|ifdef|ifndef|else|endif)\b[^\n]*)
+    | (?P<string>"(?:[^"]|"")*"|'[^']*')
+    | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<punct>[{}\[\];=,:]|\+=)
+    | (?P<other>.)
+    ''', re.X | re.S)
+
+SKIPPED_TOKENS = ("space", "comment", "directive")
+
+# Maps every byte to one character and back, so a file that is written out
+# again keeps everything but the replaced spans byte for byte, whatever code
+# page its comments were written in.
+RVMAT_ENCODING = "latin-1"
+
+class Token:
+    __slots__ = ("kind", "text", "start", "end")
+
+    def __init__(self, kind, text, start, end):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "Token({0}, {1!r})".format(self.kind, self.text)
+
+def tokenize(text):
+    ''' Tokens of the text, without whitespace, comments and preprocessor lines '''
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind not in SKIPPED_TOKENS:
+            yield Token(kind, match.group(), match.start(), match.end())
+
+def unquote(text):
+    if text[0] == '"':
+        return text[1:-1].replace('""', '"')
+    return text[1:-1]
+
+###
+##  Tree
+#
+
+class RVValue:
+    '''
+    A single value. value is a str or a number, start and end the span of
+    the value in the file, without the quotes of a string.
+    '''
+    def __init__(self, value, start, end):
+        self.value = value
+        self.start = start
+        self.end = end
+
+class RVArray:
+    def __init__(self, items, start, end):
+        self.items = items
+        self.start = start
+        self.end = end
+
+class RVClass:
+    '''
+    A class body. entries maps the entry names to RVValue, RVArray or
+    RVClass in file order; lookups with get() ignore case like the engine.
+    '''
+    def __init__(self, name, base=None, start=0, end=0):
+        self.name = name
+        self.base = base
+        self.start = start
+        self.end = end
+        self.entries = {}
+        self.lowerNames = {}
+
+    def add(self, name, node):
+        self.entries[name] = node
+        self.lowerNames[name.lower()] = name
+
+    def get(self, name, default=None):
+        key = self.lowerNames.get(name.lower())
+        return default if key is None else self.entries[key]
+
+    def classes(self):
+        return [node for node in self.entries.values() if isinstance(node, RVClass)]
+
+###
+##  Parser
+#
+
+class Parser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = list(tokenize(text))
+        self.pos = 0
+
+    def error(self, message, offset=None):
+        if offset is None:
+            offset = self.tokens[self.pos].start if self.pos < len(self.tokens) else len(self.text)
+        line = self.text.count("\n", 0, offset) + 1
+        return RVMatError("Line {0}: {1}".format(line, message))
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise self.error("Unexpected end of file")
+        self.pos += 1
+        return token
+
+    def accept(self, text):
+        token = self.peek()
+        if token is not None and token.text == text:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text):
+        token = self.next()
+        if token.text != text:
+            raise self.error("Expected '{0}', found '{1}'".format(text, token.text), token.start)
+        return token
+
+    def parse(self):
+        root = RVClass("", start=0, end=len(self.text))
+        self.parseEntries(root, None)
+        return root
+
+    def parseEntries(self, cls, closing):
+        while True:
+            token = self.peek()
+            if token is None:
+                if closing is not None:
+                    raise self.error("Missing '}' for class " + cls.name)
+                return
+            if token.text == closing:
+                return
+            if token.text == ';':
+                self.pos += 1
+                continue
+            if token.kind != "name":
+                raise self.error("Unexpected '{0}'".format(token.text), token.start)
+
+            self.pos += 1
+            keyword = token.text.lower()
+            if keyword == "class":
+                self.parseClass(cls)
+            elif keyword == "delete":
+                self.next()
+                self.accept(';')
+            else:
+                self.parseAssignment(cls, token.text)
+
+    def parseClass(self, parent):
+        name = self.next()
+        if name.kind != "name":
+            raise self.error("Class name expected", name.start)
+        base = None
+        if self.accept(':'):
+            base = self.next().text
+        if self.accept(';'):
+            # Forward declaration
+            parent.add(name.text, RVClass(name.text, base, name.start, name.end))
+            return
+        self.expect('{')
+        cls = RVClass(name.text, base, name.start)
+        self.parseEntries(cls, '}')
+        cls.end = self.expect('}').end
+        self.accept(';')
+        parent.add(name.text, cls)
+
+    def parseAssignment(self, cls, name):
+        if self.accept('['):
+            self.expect(']')
+            if not self.accept('+='):
+                self.expect('=')
+            cls.add(name, self.parseArray())
+        else:
+            self.expect('=')
+            cls.add(name, self.parseValue((';', '}')))
+        self.accept(';')
+
+    def parseArray(self):
+        start = self.expect('{').start
+        items = []
+        while not self.accept('}'):
+            token = self.peek()
+            if token is None:
+                raise self.error("Missing '}' in array")
+            if token.text == ',':
+                self.pos += 1
+            elif token.text == '{':
+                items.append(self.parseArray())
+            else:
+                items.append(self.parseValue((',', '}')))
+        return RVArray(items, start, self.tokens[self.pos - 1].end)
+
+    def parseValue(self, terminators):
+        '''
+        A string, a number or an unquoted value. Unquoted values run to the
+        next terminator or the end of the line and are returned as text.
+        '''
+        first = self.next()
+        if first.kind == "string":
+            return RVValue(unquote(first.text), first.start + 1, first.end - 1)
+
+        last = first
+        while True:
+            token = self.peek()
+            if token is None or token.text in terminators or '\n' in self.text[last.end:token.start]:
+                break
+            last = self.next()
+
+        raw = self.text[first.start:last.end]
+        if first is last and first.kind == "number":
+            value = float(raw) if any(c in raw for c in ".eE") else int(raw)
+            return RVValue(value, first.start, last.end)
+        return RVValue(raw, first.start, last.end)
+
+def parseRVMat(text):
+    ''' Parse rvmat text, returns the root RVClass '''
+    return Parser(text).parse()
+
+###
+##  Textures
+#
+
+class TextureRef:
+    ''' A texture entry: its value, the span of the value in the file and the owning class path '''
+    __slots__ = ("texture", "start", "end", "path")
+
+    def __init__(self, texture, start, end, path):
+        self.texture = texture
+        self.start = start
+        self.end = end
+        self.path = path
+
+def iterTextures(cls, path=""):
+    ''' All texture entries in the class and its subclasses, in file order '''
+    for name, node in cls.entries.items():
+        if isinstance(node, RVClass):
+            yield from iterTextures(node, path + name + ".")
+        elif isinstance(node, RVValue) and name.lower() == "texture" and isinstance(node.value, str):
+            yield TextureRef(node.value, node.start, node.end, path + name)
+
+class RVMatFile:
+    def __init__(self, fileName, text):
+        self.fileName = fileName
+        self.text = text
+        self.root = parseRVMat(text)
+        self.textures = list(iterTextures(self.root))
+
+    def stageTextures(self, procedural=False):
+        ''' Texture names of the stages, procedural textures (#...) only if asked for '''
+        return [ref.texture for ref in self.textures
+                if len(ref.texture) > 0 and (procedural or ref.texture[0] != '#')]
+
+    def replaceTextures(self, replace):
+        '''
+        Text with the texture values replaced. replace is called with each
+        TextureRef and returns the new value or None to keep it.
+        '''
+        pieces = []
+        last = 0
+        for ref in self.textures:
+            new = replace(ref)
+            if new is None or new == ref.texture:
+                continue
+            pieces.append(self.text[last:ref.start])
+            pieces.append(new)
+            last = ref.end
+        pieces.append(self.text[last:])
+        return "".join(pieces)
+
+###
+##  Cache
+#
+
+# normalized path -> ((size, mtime), RVMatFile)
+_cache = {}
+
+def cacheKey(fileName):
+    return os.path.normcase(os.path.abspath(fileName))
+
+def loadRVMat(fileName):
+    ''' Parsed RVMatFile for a file, from the cache as long as the file didn't change '''
+    key = cacheKey(fileName)
+    st = os.stat(fileName)
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(fileName, encoding=RVMAT_ENCODING, newline="") as f:
+        text = f.read()
+    try:
+        rvmat = RVMatFile(fileName, text)
+    except RVMatError as e:
+        raise RVMatError("{0}: {1}".format(fileName, e))
+    _cache[key] = (stamp, rvmat)
+    return rvmat
+
+def invalidate(fileName=None):
+    ''' Drop a file, or everything, from the cache '''
+    if fileName is None:
+        _cache.clear()
+    else:
+        _cache.pop(cacheKey(fileName), None)
@@ -5,108 +5,22 @@ from subprocess import Popen,PIPE,call
 import os.path as path
 import tempfile
 import shutil
-import bpy
-
-
-static_texture_translation = [
-["ca\\data\\env_bathroom_co","a3\\data_f\\env_bathroom_co"],
-["ca\\data\\data\\default_co","a3\\data_f\\default_co"],
-["ca\\data\\env_land_co","a3\\data_f\\env_land_co"],
-["ca\\data\\env_chrome_co","a3\\data_f\\env_chrome_co"],
-["ca\\data\\env_co","a3\\data_f\\env_co"],
-["ca\\data\\env_land_optic_co","a3\\data_f\\env_land_optic_co"],
-["ca\\wheeled\\data\\bis_klan","a3\\data_f\\bis_klan"],
-["ca\\weapons\\data\\bullettracer\\tracer_red","a3\\weapons_f\\data\\bullettracer\\tracer_red"],
-["ca\\weapons\\data\\bullettracer\\tracer_yellow","a3\\weapons_f\\data\\bullettracer\\tracer_yellow"],
-["ca\\weapons\\data\\bullettracer\\tracer_green","a3\\weapons_f\\data\\bullettracer\\tracer_green"],
-["ca\\wheeled\\data\\clear_empty","a3\\data_f\\clear_empty"],
-["ca\\ca_e\\data\\carflare_ca","a3\\data_f\\carflare_ca"],
-["ca\\weapons\\data\\detailmaps\\metal_detail_dt","\\a3\\weapons_f\\data\\detailmaps\\metal_detail_dt"],
-["ca\\weapons\\data\\detailmaps\\metal_rough_dt","\\a3\\weapons_f\\data\\detailmaps\\metal_rough_dt"],
-["ca\\data\\env_land_plastic_co","a3\\data_f\\env_land_plastic_co"],
-["ca\\data\\default_ti_ca", "a3\\data_f\\default_ti_ca"],
-["ca\\ca_e\\data\\destruct_ti_ca", "a3\data_f\\destruct_ti_ca"], 
-["ca\\data_baf\\env_land_baf_co", "a3\\data_f\\env_land_co"],
-["ca\\weapons_e\\data\default_ti_ca", "a3\\data_f\\default_ti_ca"],
-["ca\\data\\destruct\\metal_rough_half_dt", "CUP\\BaseConfigs\\CUP_BaseData\\Data\\metal_rough_half_dt"],
-["ca\\data\\destruct\\metal_rough_full_dt", "CUP\\BaseConfigs\\CUP_BaseData\\Data\\metal_rough_full_dt"],
-["ca\\data\\destruct\\destruct_plech_half_dt",  "a3\\data_f\\destruct\\destruct_plech_half_dt"],
-["ca\\data\\destruct\\destruct_plech_half_mc",  "a3\\data_f\\destruct\\destruct_plech_half_mc"],
-["ca\\data\\destruct\\destruct_plech_half_smdi",  "a3\\data_f\\destruct\\destruct_plech_half_smdi"],
-["ca\\data\\destruct\\destruct_plech_full_dt",  "a3\\data_f\\destruct\\destruct_plech_full_dt"],
-["ca\\data\\destruct\\destruct_plech_full_mc",  "a3\\data_f\\destruct\\destruct_plech_full_mc"],
-["ca\\data\\destruct\\destruct_plech_full_smdi",  "a3\\data_f\\destruct\\destruct_plech_full_smdi"],
-["ca\\data\\destruct\\destruct_rubber_half_dt",  "a3\\data_f\\destruct\\destr_rubber_half_dt"],
-["ca\\data\\destruct\\damage_metal_basicarmor_dt", "a3\\data_f\\destruct\\damage_metal_basicarmor_dt"],
-["ca\\data\\destruct\\destr_glass_plexi_full_nohq",  "a3\\data_f\\destruct\\destr_glass_plexi_full_nohq"],
-["ca\\data\\destruct\\destr_glass_plexi_full_ca",  "a3\\data_f\\destruct\\destr_glass_plexi_full_ca"],
-["ca\\data\\destruct\\destr_glass_plexi_full_smdi",  "a3\\data_f\\destruct\\destr_glass_plexi_full_smdi"],
-["ca\\data\\destruct\\destr_glass_plexi_half_nohq",  "a3\\data_f\\destruct\\destr_glass_plexi_half_nohq"],
-["ca\\data\\destruct\\destr_glass_plexi_half_ca",  "a3\\data_f\\destruct\\destr_glass_plexi_half_ca"],
-["ca\\data\\destruct\\destr_glass_plexi_half_smdi",  "a3\\data_f\\destruct\\destr_glass_plexi_half_smdi"],
-["ca\\structures\\Data\\DetailMaps\\Metal_Detail_DT", "\\a3\\weapons_f\\data\\detailmaps\\metal_detail_dt"],
-["ca\\data\\destruct\\destr_glass_armour2_full_nohq",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\destr_glass_armour2_full_nohq"],
-["ca\\data\\destruct\\destr_glass_armour2_full_ca",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\destr_glass_armour2_full_ca"],
-["ca\\data\\destruct\\destr_glass_armour2_full_smdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\destr_glass_armour2_full_smdi"],
-["ca\\data\\destruct\\destr_glass_armour2_half_nohq",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\destr_glass_armour2_half_nohq"],
-["ca\\data\\destruct\\destr_glass_armour2_half_ca",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\destr_glass_armour2_half_ca"],
-["ca\\data\\destruct\\destr_glass_armour2_half_smdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\destr_glass_armour2_half_smdi"],
-["ca\\data\\destruct\\metal_01_broken_full_dt",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\metal_01_broken_full_dt"],
-["ca\\data\\destruct\\metal_01_broken_full_dtsmdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\metal_01_broken_full_dtsmdi"],
-["ca\\data\\destruct\\metal_01_broken_half_dt",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\metal_01_broken_half_dt"],
-["ca\\data\\destruct\\metal_01_broken_half_dtsmdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Datadestruct\\\\metal_01_broken_half_dtsmdi"],
-["ca\\data\\destruct\\vehicle_destr512_256_mc",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr512_256_mc"],
-["ca\\data\\destruct\\vehicle_destr512_256_smdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr512_256_smdi"],
-["ca\\data\\destruct\\vehicle_destr512_512_mc",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr512_512_mc"],
-["ca\\data\\destruct\\vehicle_destr512_512_smdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr512_512_smdi"],
-["ca\\data\\destruct\\vehicle_destr2048_1024_mc",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr2048_1024_mc"],
-["ca\\data\\destruct\\vehicle_destr2048_2048_mc",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr2048_2048_mc"],
-["ca\\data\\destruct\\vehicle_destr2048_2048_smdi",  "CUP\\BaseConfigs\\CUP_BaseData\\Data\\destruct\\vehicle_destr2048_2048_smdi"]
-
-]
+from RVMatParser import loadRVMat, invalidate, RVMAT_ENCODING, RVMatError
+from TextureTranslation import defaultTable, normalizeTextureName
 
 
 def rt_FindTextureNames(rvMatFile):
-    
-    textures = []
-    
-    with open(rvMatFile) as f:
-        content = f.readlines()
-        # you may also want to remove whitespace characters like `\n` at the end of each line
-        content = [x.strip() for x in content] 
-        f.close()
-        
-    for l in content:
-        if "texture" in l.lower():
-            t = l.split("=")
-            if len(t) == 2:
-                texture = t[1];
-                if texture.rfind(";") >= 0:
-                    texture = texture[:-1]
-                texture = texture.strip("\"")
-                texture = texture.strip("'")
-                texture = texture.strip()
-
-                if texture[0] != '#':
-                    textures.append(texture)
-                
-    return textures
+    ''' Stage textures of an rvmat, without procedural textures. The file is parsed once and cached '''
+    return loadRVMat(rvMatFile).stageTextures()
 
 def rt_findTextureMatch(textureName):
-    # Clean up the texture name
-    # split the extension
-    base,ext = path.splitext(textureName)
-    
-    # make it lower-case
-    base = base.lower()
+    # Clean up the texture name: no extension, lower case, no leading \
+    base = normalizeTextureName(textureName)
     
-    # Remove leading \
-    base = base.strip('\\')
-    
-    for pair in static_texture_translation:
-        #print(pair[0], "==", base, "?")
-        if pair[0] == base:
-            return pair[1] + ".paa", True
+    # Translations come from the mapping files, see TextureTranslation
+    translated = defaultTable().get(base)
+    if translated is not None:
+        return translated + ".paa", True
 
     return base + ".paa", False
 
@@ -114,52 +28,35 @@ def rt_findTextureMatch(textureName):
 ##  Read textures inside an rvMat file
 #
 def rt_readTextures(rvMatFile):
-    
-    textures = []
-    
-    with open(rvMatFile) as f:
-        content = f.readlines()
-        content = [x.strip() for x in content] 
-        
-    for l in content:
-        if "texture" in l.lower():
-            t = l.split("=")
-            if len(t) == 2:
-                texture = t[1];
-                if texture.rfind(";") >= 0:
-                    texture = texture[:-1]
-                texture = texture.strip("\"")
-                texture = texture.strip("'")
-                texture = texture.strip()
-
-                if texture[0] != '#':
-                    textures.append(texture)
-                
-    return textures
+    return rt_FindTextureNames(rvMatFile)
 
 ###
 ##  Replace the texture names in an rvmat file
 #   
 def ft_replaceNames(rvmatName, repList):
-    with open(rvmatName) as f:
-        content = f.readlines()
-
-    
-    with open(rvmatName, "w") as f:
-        for l in content:
-            if "texture" in l.lower():
-                out = l
-                for rep in repList:
-                    idx = l.lower().find(rep[0].lower())
-                    if idx != -1:
-                        out = l[:idx] + rep[1] + l[idx+len(rep[0]):]
-                        print(out)
-                        break
-                f.write(out)
-            else:
-                f.write(l)
-
-    
+    '''
+    Replace texture names in the file. repList holds [old, new] pairs, the
+    first pair whose old name occurs in a texture value (ignoring case)
+    replaces that part of the value. Only the spans of the texture values
+    are changed, the rest of the file is kept as it is.
+    '''
+    rvmat = loadRVMat(rvmatName)
+
+    def replace(ref):
+        value = ref.texture.lower()
+        for rep in repList:
+            idx = value.find(rep[0].lower())
+            if idx != -1:
+                out = ref.texture[:idx] + rep[1] + ref.texture[idx+len(rep[0]):]
+                print(ref.path, "=", out)
+                return out
+        return None
+
+    text = rvmat.replaceTextures(replace)
+    if text != rvmat.text:
+        with open(rvmatName, "w", encoding=RVMAT_ENCODING, newline="") as f:
+            f.write(text)
+        invalidate(rvmatName)
 
 def rt_smartCopy(srcFile, dstFile):
     if path.exists(srcFile):
@@ -291,6 +188,14 @@ def rt_CopyTexture(texName, outputPath):
             rt_SmartCopy(texName, outputPath)
 
 def mt_RelocateMaterial(textureName, materialName, outputPath, copyRV, prefixPath):
+    '''
+    Copy the material's rvmat and texture to outputPath and point the
+    materials using them there. Returns None, or an error message if the
+    rvmat can't be parsed; the material is left as it was then.
+    '''
+    # Imported here so the rest of this module can be used outside of Blender
+    import bpy
+
     #print("mt_RelocateMaterial: textureName = ", textureName, " materialName = ", materialName, "\n")
     if len(materialName) > 0:
         baseMat = path.basename(materialName)
@@ -305,7 +210,11 @@ def mt_RelocateMaterial(textureName, materialName, outputPath, copyRV, prefixPat
         outputName = path.join(outputPath, baseMat)
         
         if copyRV == True:
-            rt_CopyRVMat(rvmatName, outputName, prefixPath)
+            try:
+                rt_CopyRVMat(rvmatName, outputName, prefixPath)
+            except RVMatError as e:
+                print("Skipping material {0}: {1}".format(materialName, e))
+                return str(e)
         else:
             shutil.copy(rvmatName, outputName)
             
@@ -329,3 +238,4 @@ def mt_RelocateMaterial(textureName, materialName, outputPath, copyRV, prefixPat
             if mat.armaMatProps.texType == 'Texture':
                 if mat.armaMatProps.texture == textureName:
                     mat.armaMatProps.texture = outputName
+    return None
@@ -0,0 +1,386 @@
+'''
+Created on 19.10.2026
+
+Round trip and throughput check for the P3D import/export code. Meant to
+be run before merging changes to MDLexporter, MDLImporter or MLODCodec:
+
+    blender -b --factory-startup --python-exit-code 1 --python RoundTripCheck.py -- --report roundtrip.json
+
+Every case generates a model, exports it (A), imports A into an empty
+scene and exports that again (B). A and B must have the same content:
+geometry, faces, names, sharp edges, mass and UV sets exactly (UVs and
+normals up to float rounding), selection weights up to the precision of
+the byte encoding. Cases with only 0/1 weights must be byte identical.
+The cases also check proxy selection names, the shadow LOD offset and the
+mass tagg, and fail if export or import throughput drops below the floor
+given in MB/s.
+
+Without Blender (plain Python with NumPy) only the codec checks run: the
+weight encoding and a codec write/read/write round trip.
+
+'''
+import sys, os
+sys.path.append(os.path.dirname(__file__))
+
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+import MLODCodec
+from MLODCodec import convertWeight, decodeWeight, encodeWeights, decodeWeights
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# One step of the byte encoding is 1/254 and decodeWeight rounds to 0.01,
+# together that's up to 0.013
+WEIGHT_TOLERANCE = 0.015
+FLOAT_TOLERANCE = 1e-5
+
+# Default throughput floors in MB/s
+EXPORT_FLOOR = 1.0
+IMPORT_FLOOR = 2.0
+CODEC_FLOOR = 20.0
+
+class CheckResult:
+    def __init__(self, name):
+        self.name = name
+        self.failures = []
+        self.info = {}
+
+    def fail(self, message):
+        self.failures.append(message)
+
+    def expect(self, condition, message):
+        if not condition:
+            self.fail(message)
+
+    def asDict(self):
+        return {"case": self.name, "passed": len(self.failures) == 0,
+                "failures": self.failures, "info": self.info}
+
+def throughput(numBytes, seconds):
+    return numBytes / (1024 * 1024) / max(seconds, 1e-9)
+
+def checkThroughput(result, what, numBytes, seconds, floor):
+    mbs = throughput(numBytes, seconds)
+    result.info[what + "MBs"] = mbs
+    result.expect(mbs >= floor, "{0} throughput {1:.2f} MB/s is below the floor of {2:.2f} MB/s".format(what, mbs, floor))
+
+###
+##  Comparing two MLOD files
+#
+
+def compareLods(result, index, a, b, exactWeights):
+    prefix = "LOD {0} ({1}): ".format(index, a.resolution)
+    def expect(condition, message):
+        result.expect(condition, prefix + message)
+
+    expect(a.resolution == b.resolution, "resolution {0} != {1}".format(a.resolution, b.resolution))
+    if a.numPoints != b.numPoints or a.numFaces != b.numFaces:
+        expect(False, "{0} points/{1} faces != {2} points/{3} faces".format(
+            a.numPoints, a.numFaces, b.numPoints, b.numFaces))
+        return
+
+    expect(np.array_equal(a.points, b.points), "points differ")
+    expect(np.allclose(a.normals, b.normals, atol=FLOAT_TOLERANCE), "normals differ")
+
+    fa, fb = a.faces, b.faces
+    expect(np.array_equal(fa['sides'], fb['sides']), "face sides differ")
+    expect(np.array_equal(fa['flags'], fb['flags']), "face flags differ")
+    expect(np.array_equal(fa['vertices']['point'], fb['vertices']['point']), "face vertices differ")
+    expect(np.allclose(fa['vertices']['uv'], fb['vertices']['uv'], atol=FLOAT_TOLERANCE), "face UVs differ")
+    expect(a.textures == b.textures, "face textures differ")
+    expect(a.materials == b.materials, "face materials differ")
+
+    expect(np.array_equal(a.sharpEdges, b.sharpEdges), "sharp edges differ")
+    expect((a.mass is None) == (b.mass is None), "mass tagg only in one file")
+    if a.mass is not None and b.mass is not None:
+        expect(np.array_equal(a.mass, b.mass), "mass differs")
+    expect(a.properties == b.properties, "named properties differ")
+
+    expect(sorted(a.uvSets) == sorted(b.uvSets), "UV set ids differ")
+    for id in a.uvSets:
+        if id in b.uvSets:
+            expect(np.allclose(a.uvSets[id], b.uvSets[id], atol=FLOAT_TOLERANCE), "UV set {0} differs".format(id))
+
+    expect([s.name for s in a.selections] == [s.name for s in b.selections], "selection names differ")
+    for sa, sb in zip(a.selections, b.selections):
+        expect(np.array_equal(sa.faces, sb.faces), "faces of selection {0} differ".format(sa.name))
+        if exactWeights:
+            expect(np.array_equal(sa.vertices, sb.vertices), "weights of selection {0} differ".format(sa.name))
+        else:
+            error = np.abs(sa.vertexWeights() - sb.vertexWeights())
+            expect(len(error) == 0 or error.max() <= WEIGHT_TOLERANCE,
+                   "weights of selection {0} differ by up to {1:.4f}".format(sa.name, error.max()))
+
+def compareFiles(result, fileA, fileB, exactWeights):
+    lodsA = MLODCodec.readMLOD(fileA).lods
+    lodsB = MLODCodec.readMLOD(fileB).lods
+    result.expect(len(lodsA) == len(lodsB), "{0} LODs != {1} LODs".format(len(lodsA), len(lodsB)))
+    for i, (a, b) in enumerate(zip(lodsA, lodsB)):
+        compareLods(result, i, a, b, exactWeights)
+
+    with open(fileA, "rb") as f:
+        dataA = f.read()
+    with open(fileB, "rb") as f:
+        dataB = f.read()
+    result.info["identical"] = dataA == dataB
+    if exactWeights:
+        result.expect(dataA == dataB, "files are not byte identical")
+    return lodsA
+
+###
+##  Codec checks, no Blender needed
+#
+
+def checkWeights():
+    result = CheckResult("weights")
+    weights = np.linspace(0, 1, 1001)
+
+    encoded = encodeWeights(weights)
+    scalar = np.array([convertWeight(w) for w in weights]) & 0xff
+    result.expect(np.array_equal(encoded, scalar), "encodeWeights and convertWeight disagree")
+
+    signed = [b - 256 if b > 127 else b for b in range(256)]
+    table = decodeWeights(np.arange(256))
+    result.expect(np.allclose(table, [decodeWeight(b) for b in signed]), "decodeWeights and decodeWeight disagree")
+
+    error = np.abs(decodeWeights(encoded) - weights)
+    result.info["maxError"] = float(error.max())
+    result.expect(error.max() <= WEIGHT_TOLERANCE, "weight round trip error {0:.4f}".format(error.max()))
+
+    result.expect(decodeWeight(convertWeight(0.0)) == 0.0, "weight 0 does not survive")
+    result.expect(decodeWeight(convertWeight(1.0)) == 1.0, "weight 1 does not survive")
+    return result
+
+def syntheticLod(rnd, numPoints, numFaces, resolution, numSelections, numUVSets, mass):
+    lod = MLODCodec.MLODLod()
+    lod.resolution = resolution
+    lod.points = rnd.random_sample((numPoints, 3)).astype(np.float32)
+    lod.normals = rnd.random_sample((numPoints, 3)).astype(np.float32)
+
+    sides = rnd.randint(3, 5, numFaces)
+    numLoops = int(sides.sum())
+    points = rnd.randint(0, numPoints, numLoops)
+    uvs = rnd.random_sample((numLoops, 2)).astype(np.float32)
+    textures = ["bench\\data\\texture_%d_co.paa" % (i % 7) for i in range(numFaces)]
+    materials = ["bench\\data\\material_%d.rvmat" % (i % 5) for i in range(numFaces)]
+    lod.setFaces(sides, points, points, uvs, textures, materials)
+
+    for i in range(numSelections):
+        lod.selections.append(MLODCodec.MLODSelection("selection_%d" % i,
+                                                      encodeWeights(rnd.random_sample(numPoints)),
+                                                      rnd.randint(0, 2, numFaces).astype(np.uint8)))
+    lod.sharpEdges = np.unique(np.sort(rnd.randint(0, numPoints, (numPoints // 4, 2)), axis=1), axis=0)
+    if mass:
+        lod.mass = rnd.random_sample(numPoints).astype(np.float32)
+    lod.properties = [("class", "house"), ("autocenter", "0")]
+    for i in range(numUVSets):
+        lod.uvSets[i] = rnd.random_sample((numLoops, 2)).astype(np.float32)
+    return lod
+
+def checkCodec(workDir, numPoints, floor):
+    result = CheckResult("codec %d points" % numPoints)
+    rnd = np.random.RandomState(numPoints)
+    lods = [syntheticLod(rnd, numPoints, numPoints, 1.0, 10, 2, False),
+            syntheticLod(rnd, numPoints, numPoints, 1.000e+4 + 5, 0, 0, False),
+            syntheticLod(rnd, numPoints, numPoints, 1.000e+13, 4, 1, True)]
+
+    fileA = os.path.join(workDir, "codec_a.p3d")
+    fileB = os.path.join(workDir, "codec_b.p3d")
+
+    start = time.perf_counter()
+    MLODCodec.writeMLOD(fileA, lods)
+    writeSeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read = MLODCodec.readMLOD(fileA)
+    readSeconds = time.perf_counter() - start
+
+    MLODCodec.writeMLOD(fileB, read.lods)
+    compareFiles(result, fileA, fileB, True)
+
+    size = os.path.getsize(fileA)
+    result.info["bytes"] = size
+    checkThroughput(result, "write", size, writeSeconds, floor)
+    checkThroughput(result, "read", size, readSeconds, floor)
+    return result
+
+###
+##  Blender round trip
+#
+
+# name, vertices, lods as (lod preset, lodDistance), only 0/1 weights
+BLENDER_CASES = [
+    ("binary weights", 2000, [('-1.0', 0.0), ('1.000e+13', 0.0)], True),
+    ("fractional weights", 2000, [('-1.0', 0.0), ('2.0', 0.0)], False),
+    ("shadow offsets", 2000, [('1.000e+4', 0.0), ('1.000e+4', 5.0), ('1.000e+4', 12.0)], True),
+    ("large", 100000, [('-1.0', 0.0), ('1.000e+13', 0.0), ('4.000e+13', 0.0)], False),
+]
+
+PROXY_PATH = "P:\\bench\\proxies\\proxy_%d.p3d"
+NUM_PROXIES = 3
+NUM_SELECTIONS = 6
+
+def buildCaseObjects(numVerts, lods, binaryWeights, rnd):
+    import bmesh
+    from mathutils import Vector
+    from ArmaProxy import CreateProxyPos
+    from Benchmark import gridMesh, makeMaterials
+
+    materials = makeMaterials(4)
+    objects = []
+    for n, (lod, distance) in enumerate(lods):
+        mesh = gridMesh("roundtrip_%d" % n, numVerts)
+        obj = bpy.data.objects.new(mesh.name, mesh)
+        bpy.context.scene.collection.objects.link(obj)
+        obj.armaObjProps.isArmaObject = True
+        obj.armaObjProps.lod = lod
+        obj.armaObjProps.lodDistance = distance
+
+        for mat in materials:
+            mesh.materials.append(mat)
+        mesh.polygons.foreach_set("material_index",
+                                  rnd.randint(0, len(materials), len(mesh.polygons)).astype(np.int32))
+
+        layer = mesh.uv_layers.new(name="UVMap")
+        layer.data.foreach_set("uv", rnd.random_sample(len(mesh.loops) * 2).astype(np.float32))
+
+        sharp = rnd.random_sample(len(mesh.edges)) < 0.05
+        mesh.edges.foreach_set("use_edge_sharp", sharp)
+
+        numVerts = len(mesh.vertices)
+        for i in range(NUM_SELECTIONS):
+            vgrp = obj.vertex_groups.new(name="selection_%d" % i)
+            verts = np.flatnonzero(rnd.random_sample(numVerts) < 0.2).tolist()
+            if binaryWeights:
+                vgrp.add(verts, 1.0, 'REPLACE')
+            else:
+                for v, w in zip(verts, rnd.random_sample(len(verts)).tolist()):
+                    vgrp.add([v], w, 'REPLACE')
+
+        for i in range(NUM_PROXIES):
+            CreateProxyPos(obj, Vector((i, 0, 0)), PROXY_PATH % i, i + 1)
+
+        prop = obj.armaObjProps.namedProps.add()
+        prop.name = "autocenter"
+        prop.value = "0"
+
+        if lod in ('1.000e+13', '4.000e+13'):
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            weight_layer = bm.verts.layers.float.new('FHQWeights')
+            for v in bm.verts:
+                v[weight_layer] = float(v.index % 10)
+            bm.to_mesh(mesh)
+            bm.free()
+
+        objects.append(obj)
+    return objects
+
+def checkExpectations(result, lods, objects):
+    from MDLexporter import fullNameIfProxy, lodKey
+
+    ordered = sorted(objects, key=lodKey)
+    for lod, obj in zip(lods, ordered):
+        # Shadow LODs carry their offset in the resolution
+        expected = abs(lodKey(obj))
+        if expected == 1.000e+4 or expected == 2.000e+4:
+            expected += obj.armaObjProps.lodDistance
+        result.expect(np.float32(lod.resolution) == np.float32(expected),
+                      "{0}: resolution {1}, expected {2}".format(obj.name, lod.resolution, expected))
+
+        names = [s.name for s in lod.selections]
+        for prox in obj.armaObjProps.proxyArray:
+            name = fullNameIfProxy(obj, prox.name)
+            result.expect(name in names, "{0}: proxy selection {1} missing".format(obj.name, name))
+            result.expect(name.startswith("proxy:") and name.endswith(".%03d" % prox.index),
+                          "{0}: bad proxy selection name {1}".format(obj.name, name))
+
+        isMassLod = abs(lodKey(obj)) in MLODCodec.MASS_LODS
+        result.expect((lod.mass is not None) == isMassLod, "{0}: mass tagg presence".format(obj.name))
+        if lod.mass is not None:
+            expectedMass = (np.arange(lod.numPoints) % 10).astype(np.float32)
+            result.expect(np.array_equal(lod.mass, expectedMass), "{0}: mass values differ".format(obj.name))
+
+def checkBlenderCase(workDir, name, numVerts, lods, binaryWeights, exportFloor, importFloor):
+    from Benchmark import clearScene
+    from MDLexporter import exportMDL
+    from MDLImporter import importMDL
+
+    result = CheckResult(name)
+    rnd = np.random.RandomState(numVerts)
+    fileA = os.path.join(workDir, "roundtrip_a.p3d")
+    fileB = os.path.join(workDir, "roundtrip_b.p3d")
+
+    clearScene()
+    objects = buildCaseObjects(numVerts, lods, binaryWeights, rnd)
+
+    start = time.perf_counter()
+    exportMDL(None, fileA, objects, False, False)
+    exportSeconds = time.perf_counter() - start
+    checkExpectations(result, MLODCodec.readMLOD(fileA).lods, objects)
+
+    clearScene()
+    start = time.perf_counter()
+    error = importMDL(bpy.context, fileA, False, -1, False)
+    importSeconds = time.perf_counter() - start
+    result.expect(error == 0, "importMDL returned {0}".format(error))
+
+    imported = [obj for obj in bpy.data.objects if obj.type == 'MESH']
+    exportMDL(None, fileB, imported, False, False)
+    compareFiles(result, fileA, fileB, binaryWeights)
+
+    size = os.path.getsize(fileA)
+    result.info["bytes"] = size
+    checkThroughput(result, "export", size, exportSeconds, exportFloor)
+    checkThroughput(result, "import", size, importSeconds, importFloor)
+    return result
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="RoundTripCheck", description="P3D round trip and throughput check")
+    parser.add_argument("--codec-only", action="store_true", help="Only run the checks that don't need Blender")
+    parser.add_argument("--export-floor", type=float, default=EXPORT_FLOOR, help="Minimum export MB/s")
+    parser.add_argument("--import-floor", type=float, default=IMPORT_FLOOR, help="Minimum import MB/s")
+    parser.add_argument("--codec-floor", type=float, default=CODEC_FLOOR, help="Minimum codec read/write MB/s")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+def main():
+    if bpy is not None:
+        from BatchExport import scriptArguments, ensureAddon
+        args = parseArguments(scriptArguments())
+    else:
+        args = parseArguments(sys.argv[1:])
+
+    results = [checkWeights()]
+    with tempfile.TemporaryDirectory() as workDir:
+        for numPoints in (1000, 100000):
+            results.append(checkCodec(workDir, numPoints, args.codec_floor))
+
+        if bpy is not None and not args.codec_only:
+            ensureAddon()
+            for name, numVerts, lods, binaryWeights in BLENDER_CASES:
+                results.append(checkBlenderCase(workDir, name, numVerts, lods, binaryWeights,
+                                                args.export_floor, args.import_floor))
+
+    report = [r.asDict() for r in results]
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text)
+    print(text)
+
+    failed = [r.name for r in results if len(r.failures) > 0]
+    if failed:
+        print("FAILED: " + ", ".join(failed))
+        sys.exit(1)
+    print("All round trip checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+'''
+Created on 19.10.2026
+
+Texture translation tables (for example Arma 2 to Arma 3 texture paths),
+loaded from JSON mapping files:
+
+    {
+        "description": "...",
+        "textures": { "ca\\data\\env_co": "a3\\data_f\\env_co" },
+        "prefixes": { "ca\\mymod\\data\\": "mymod_a3\\data\\" }
+    }
+
+"textures" maps single textures, "prefixes" whole directories. The files in
+translations/ next to this module are loaded first, in name order, then the
+user files: ~/.armatoolbox/texture_translations.json and everything listed
+in the ARMATOOLBOX_TRANSLATIONS environment variable. Later files override
+earlier ones.
+
+Texture keys are normalized (lower case, backslashes, no extension or
+leading backslash) into a dict. Prefix rules go into a trie of path
+components. A lookup costs O(path length) however many entries there are.
+
+'''
+import os
+import json
+
+TRANSLATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translations")
+USER_TRANSLATION_FILE = os.path.join(os.path.expanduser("~"), ".armatoolbox", "texture_translations.json")
+TRANSLATION_ENV = "ARMATOOLBOX_TRANSLATIONS"
+
+class TranslationError(Exception):
+    pass
+
+def normalizeTextureName(name):
+    ''' Lookup key of a texture: lower case, backslashes, no extension or leading backslash '''
+    base = os.path.splitext(name.replace('/', '\\'))[0]
+    return base.lower().strip('\\')
+
+def pathComponents(name):
+    return [c for c in name.replace('/', '\\').lower().split('\\') if len(c) > 0]
+
+class PrefixTrie:
+    '''
+    Directory prefix rules, one trie node per path component. A node is a
+    dict of child components; the replacement of a rule that ends at the
+    node is stored under the None key.
+    '''
+    def __init__(self):
+        self.root = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, prefix, replacement):
+        node = self.root
+        for component in pathComponents(prefix):
+            node = node.setdefault(component, {})
+        if None not in node:
+            self.count += 1
+        node[None] = replacement.strip('\\')
+
+    def match(self, name):
+        '''
+        Replacement of the longest prefix rule matching name, plus the
+        number of path components it covers. (None, 0) if nothing matches.
+        '''
+        node = self.root
+        best = (None, 0)
+        for depth, component in enumerate(pathComponents(name)):
+            node = node.get(component)
+            if node is None:
+                break
+            if None in node:
+                best = (node[None], depth + 1)
+        return best
+
+class TranslationTable:
+    def __init__(self):
+        self.textures = {}
+        self.prefixes = PrefixTrie()
+        self.files = []
+
+    def __len__(self):
+        return len(self.textures) + len(self.prefixes)
+
+    def addTexture(self, src, dst):
+        self.textures[normalizeTextureName(src)] = dst
+
+    def addPrefix(self, src, dst):
+        self.prefixes.add(src, dst)
+
+    def load(self, fileName):
+        ''' Merge a mapping file into the table, its entries override the ones already there '''
+        try:
+            with open(fileName, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise TranslationError("{0}: {1}".format(fileName, e))
+
+        for src, dst in data.get("textures", {}).items():
+            self.addTexture(src, dst)
+        for src, dst in data.get("prefixes", {}).items():
+            self.addPrefix(src, dst)
+        self.files.append(fileName)
+
+    def get(self, key, default=None):
+        ''' Translation of an already normalized name, without extension '''
+        dst = self.textures.get(key)
+        if dst is not None:
+            return dst
+
+        replacement, depth = self.prefixes.match(key)
+        if replacement is None:
+            return default
+        rest = pathComponents(key)[depth:]
+        return "\\".join([replacement] + rest) if len(replacement) > 0 else "\\".join(rest)
+
+    def translate(self, name):
+        ''' Translated texture path without extension, or None if no rule matches '''
+        return self.get(normalizeTextureName(name))
+
+def shippedTranslationFiles():
+    if not os.path.isdir(TRANSLATION_DIR):
+        return []
+    return [os.path.join(TRANSLATION_DIR, f) for f in sorted(os.listdir(TRANSLATION_DIR))
+            if f.lower().endswith(".json")]
+
+def translationFiles(extraFiles=()):
+    ''' The mapping files to load, in order: the shipped ones, the user's, then extraFiles '''
+    files = shippedTranslationFiles()
+    if os.path.isfile(USER_TRANSLATION_FILE):
+        files.append(USER_TRANSLATION_FILE)
+    files += [f for f in os.environ.get(TRANSLATION_ENV, "").split(os.pathsep) if len(f) > 0]
+    files += list(extraFiles)
+    return files
+
+# (files, stamps) -> TranslationTable of the last defaultTable call
+_defaultTable = None
+# Listed files that don't exist, warned about once each
+_missingFiles = set()
+
+def defaultTable(extraFiles=()):
+    '''
+    Table merged from translationFiles(). It is built once and reused until
+    the list of files or one of the files changes. Listed files that don't
+    exist are skipped with a warning.
+    '''
+    global _defaultTable
+    stamps = []
+    for fileName in translationFiles(extraFiles):
+        try:
+            st = os.stat(fileName)
+        except OSError:
+            if fileName not in _missingFiles:
+                _missingFiles.add(fileName)
+                print("WARNING: texture translation file " + fileName + " not found, skipped")
+            continue
+        stamps.append((fileName, st.st_size, st.st_mtime_ns))
+    stamps = tuple(stamps)
+
+    if _defaultTable is not None and _defaultTable[0] == stamps:
+        return _defaultTable[1]
+
+    if len(shippedTranslationFiles()) == 0:
+        # Without them no ca\ texture is translated, which is easy to miss
+        print("WARNING: no texture translation files found in " + TRANSLATION_DIR
+              + ", the translations/ folder is probably missing from the installation")
+
+    table = TranslationTable()
+    for fileName, size, mtime in stamps:
+        table.load(fileName)
+    _defaultTable = (stamps, table)
+    return table
@@ -21,15 +21,17 @@ import sys
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 from bpy.app.handlers import persistent
 from BITxtWriter import exportBITxt
+from BITxtImporter import importBITxt
 from MDLImporter import importMDL
-from RTMExporter import exportRTM
-from ASCImporter import importASC
-from ASCExporter import exportASC
+from RTMExporter import exportRTM, exportActions, armatureActions
+from RTMImporter import importRTM
+from ASCImporter import importASC, importRaster
+from ASCExporter import exportASC, exportRaster
 from subprocess import call
 from time import sleep
 from traceback import print_tb
 from ArmaTools import *
-from MDLexporter import exportMDL
+from MDLexporter import exportMDL, convertWithO2Script
 from RVMatTools import rt_CopyRVMat, mt_RelocateMaterial, mt_getMaterialInfo
 import tempfile
 #import winreg 
@@ -175,6 +177,10 @@ class ATBX_OT_rtm_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
             name="Clip Frames to [0,1]", 
             description="Do not export frames that are outside the 0,1 interval for RTM files", 
             default=True)
+    sampleAction : bpy.props.BoolProperty(
+            name="Sample Action Directly",
+            description="Compute the pose from the armature's action instead of updating the whole scene for every frame. Falls back to the slow method if there are constraints, drivers or NLA tracks",
+            default=True)
     
     # Should only pop up on armature
     @classmethod
@@ -203,10 +209,59 @@ class ATBX_OT_rtm_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
         if len(keyframeList) == 0: 
             self.staticPose = True
        
-        exportRTM(context, keyframeList, self.filepath, self.staticPose, self.clipFrames)
+        exportRTM(context, keyframeList, self.filepath, self.staticPose, self.clipFrames, self.sampleAction)
         
         return{'FINISHED'}
 
+class ATBX_OT_rtm_export_actions(bpy.types.Operator):
+    """Export every action of the armature to its own RTM file"""
+    bl_idname = "armatoolbox.export_rtm_actions"
+    bl_label = "Export Actions as RTM"
+    bl_description = "Export all (or a filtered subset of) the armature's actions as Arma 2/3 RTM Animation files"
+
+    directory : bpy.props.StringProperty(
+            subtype='DIR_PATH')
+    actionFilter : bpy.props.StringProperty(
+            name="Action Filter",
+            description="Only export actions matching these patterns (separated by spaces, * and ? wildcards)",
+            default="*")
+    frameMode : bpy.props.EnumProperty(
+            name="Frames",
+            description="Which frames of each action to export",
+            items=(('KEYS', "Keyed Frames", "Every frame that has a key in the action"),
+                   ('ALL', "All Frames", "Every frame of the action's frame range"),
+                   ('LIST', "RTM Keyframe List", "The armature's RTM keyframe list, clipped to the action")),
+            default='KEYS')
+    sampleAction : bpy.props.BoolProperty(
+            name="Sample Action Directly",
+            description="Compute the pose from the action instead of updating the whole scene for every frame. Falls back to the slow method if there are constraints, drivers or NLA tracks",
+            default=True)
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.object
+        return (obj is not None) and (obj.type == 'ARMATURE') and (obj.armaObjProps.isArmaObject == True)
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        actions = armatureActions(context.object, self.actionFilter.split())
+        if len(actions) == 0:
+            self.report({'WARNING'}, "No matching actions")
+            return {'CANCELLED'}
+
+        results, errors = exportActions(context, self.directory, actions, self.frameMode, self.sampleAction)
+        for e in errors:
+            print("RTM export of {0} failed: {1}".format(e["action"], e["error"]))
+
+        if len(errors) > 0:
+            self.report({'WARNING'}, "Exported {0} actions, {1} failed (see console)".format(len(results), len(errors)))
+        else:
+            self.report({'INFO'}, "Exported {0} actions".format(len(results)))
+        return{'FINISHED'}
+
 ###
 ##   Export Operator
 #
@@ -262,26 +317,11 @@ class ATBX_OT_p3d_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
             if exportMDL(self, file_name, objects, self.applyModifiers, self.mergeSameLOD) == False:
                 continue
             
-            # Write a temporary O2script file for this
-            filePtr = tempfile.NamedTemporaryFile("w", delete=False)
-            tmpName = filePtr.name
-            filePtr.write("p3d = newLodObject;\n")
-            filePtr.write('_res = p3d loadP3D "%s";\n' % (file_name))
-            filePtr.write("_res = p3d setActive 4e13;")
-            filePtr.write('save p3d;\n')
-            filePtr.close()
-            
             # Run O2Script to output the P3D
             #command = os.path.join(context.window_manager.armatoolbox.o2path, "O2Script.exe")
             user_preferences = context.preferences
             addon_prefs = user_preferences.addons[__name__].preferences
-            command = addon_prefs.o2ScriptProp
-            command = '"' + command +'" "' + tmpName + '"'
-            #print("command (before abspath) = " + command)
-            #command = os.path.abspath(command)
-            print("command = " + command)
-            call (command, shell=True)
-            os.remove(tmpName)
+            convertWithO2Script(addon_prefs.o2ScriptProp, file_name)
             #except Exception as e:
             #    self.report({'WARNING', 'INFO'}, "I/O error: {0}".format(e))
             
@@ -298,6 +338,11 @@ class ATBX_OT_asc_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
         options={'HIDDEN'})
     
     filename_ext = ".asc"
+
+    stitchTiles : bpy.props.BoolProperty(
+        name="Stitch Tiles",
+        description="If the object is a tile of a tiled import, export all tiles of the heightfield as one ASC file",
+        default=True)
     
     @classmethod
     def poll(cls, context):
@@ -306,7 +351,7 @@ class ATBX_OT_asc_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
     
     def execute(self, context):
         try:
-            exportASC(context, self.filepath)
+            exportASC(context, self.filepath, self.stitchTiles)
         except Exception as e:
             exc_tb = sys.exc_info()[2]
             print_tb(exc_tb)
@@ -315,6 +360,46 @@ class ATBX_OT_asc_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
             
         return{'FINISHED'}
         
+class ATBX_OT_heightmap_export(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
+    bl_idname="armatoolbox.export_heightmap"
+    bl_label = "Export Heightmap"
+    bl_description = "Export as raw or .npy heightmap with a JSON sidecar"
+
+    filter_glob : bpy.props.StringProperty(
+        default="*.npy;*.r32;*.r16;*.raw",
+        options={'HIDDEN'})
+
+    filename_ext = ".r32"
+    # .npy, .r16 and .raw are fine too, don't append .r32 to them
+    check_extension = False
+
+    dataType : bpy.props.EnumProperty(
+        name="Data Type",
+        description="Type of the stored heights",
+        items=(('float32', "32 bit float", "Heights in metres as they are"),
+               ('uint16', "16 bit integer", "Heights scaled to the 16 bit range, scale and offset in the sidecar"),
+               ('float16', "16 bit float", "Half precision heights in metres")),
+        default='float32')
+    stitchTiles : bpy.props.BoolProperty(
+        name="Stitch Tiles",
+        description="If the object is a tile of a tiled import, export all tiles of the heightfield as one file",
+        default=True)
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.object
+        return (obj is not None) and (obj.type == 'MESH') and (obj.armaHFProps.isHeightfield == True)
+
+    def execute(self, context):
+        try:
+            exportRaster(context, self.filepath, self.dataType, self.stitchTiles)
+        except Exception as e:
+            exc_tb = sys.exc_info()[2]
+            print_tb(exc_tb)
+            self.report({'WARNING', 'INFO'}, "I/O error: {0}".format(e))
+
+        return{'FINISHED'}
+
 ###
 ##   Import Operator
 #
@@ -353,6 +438,31 @@ class ATBX_OT_p3d_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         return{'FINISHED'}
 
 
+class ATBX_OT_bitxt_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
+    bl_idname="armatoolbox.import_bitxt"
+    bl_label = "Import BITxt"
+    bl_description = "Import a BITxt text model"
+    
+    filter_glob : bpy.props.StringProperty(
+        default="*.txt",
+        options={'HIDDEN'})
+
+    filename_ext = ".txt"
+
+    def execute (self, context):
+        try:
+            objects = importBITxt(context, self.filepath)
+        except Exception as e:
+            exc_tb = sys.exc_info()[2]
+            print_tb(exc_tb)
+            print ("{0}".format(exc_tb))
+            self.report({'WARNING', 'INFO'}, "I/O error: {0}\n{1}".format(e, exc_tb))
+            return{'FINISHED'}
+
+        self.report({'INFO'}, "Imported {0} LOD(s)".format(len(objects)))
+        return{'FINISHED'}
+
+
 class ATBX_OT_asc_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
     bl_idname="armatoolbox.importasc"
     bl_label = "Import ASC"
@@ -364,10 +474,34 @@ class ATBX_OT_asc_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
 
     filename_ext = ".asc"
 
+    tileCount : bpy.props.IntProperty(
+        name="Tiles per Side",
+        description="Split the heightfield into this many tiles along each side. 1 imports a single object",
+        default=1, min=1, max=64)
+    overlap : bpy.props.IntProperty(
+        name="Tile Overlap",
+        description="Extra rows and columns each tile shares with its neighbours",
+        default=1, min=0)
+    preview : bpy.props.BoolProperty(
+        name="Preview",
+        description="Import a decimated preview. Regions can be refined to full resolution later without reading the ASC file again",
+        default=False)
+    previewStep : bpy.props.IntProperty(
+        name="Preview Step",
+        description="Use every Nth sample in each direction",
+        default=8, min=2)
+    previewMethod : bpy.props.EnumProperty(
+        name="Preview Method",
+        description="How the preview samples are taken",
+        items=(('STRIDE', "Every Nth Sample", "Take every Nth sample of the grid"),
+               ('MEAN', "Mean", "Mean of the cells each preview sample covers (step rounded down to a power of two)")),
+        default='STRIDE')
+
     def execute (self, context):
         error = -2
         try:
-            error = importASC(context, self.filepath)
+            error = importASC(context, self.filepath, self.tileCount, self.overlap,
+                              self.previewStep if self.preview else 1, self.previewMethod)
         except Exception as e:
             exc_tb = sys.exc_info()[2]
             print_tb(exc_tb)
@@ -381,18 +515,89 @@ class ATBX_OT_asc_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
 
         return{'FINISHED'}
         
+class ATBX_OT_rtm_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
+    """Import RTM Animation file"""
+    bl_idname = "armatoolbox.import_rtm"
+    bl_label = "Import RTM"
+    bl_description = "Import an Arma 2/3 RTM Animation file onto the active armature"
+
+    filename_ext = ".rtm"
+    filter_glob : bpy.props.StringProperty(
+            default="*.rtm",
+            options={'HIDDEN'})
+    frameLength : bpy.props.IntProperty(
+            name="Length in Frames",
+            description="Number of frames the animation is spread over. 0 uses one frame per RTM frame",
+            default=0, min=0)
+    setFrameRange : bpy.props.BoolProperty(
+            name="Set Frame Range",
+            description="Set the scene's frame range to the animation",
+            default=True)
+    addKeyframeList : bpy.props.BoolProperty(
+            name="Add Keyframes to RTM List",
+            description="Add the imported frames to the armature's RTM keyframe list",
+            default=True)
+    includeScale : bpy.props.BoolProperty(
+            name="Import Scale",
+            description="Also create scale fcurves",
+            default=False)
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.object
+        return (obj is not None) and (obj.type == 'ARMATURE')
+
+    def execute(self, context):
+        try:
+            importRTM(context, self.filepath, context.scene.frame_start, self.frameLength,
+                      self.setFrameRange, self.addKeyframeList, self.includeScale)
+        except Exception as e:
+            exc_tb = sys.exc_info()[2]
+            print_tb(exc_tb)
+            self.report({'WARNING', 'INFO'}, "I/O error: {0}".format(e))
+
+        return{'FINISHED'}
+
 def ArmaToolboxExportMenuFunc(self, context):
     self.layout.operator(ATBX_OT_p3d_export.bl_idname, text="Arma 3 P3D (.p3d)")
 
+class ATBX_OT_heightmap_import(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
+    bl_idname="armatoolbox.import_heightmap"
+    bl_label = "Import Heightmap"
+    bl_description = "Import a raw or .npy heightmap with a JSON sidecar"
+
+    filter_glob : bpy.props.StringProperty(
+        default="*.npy;*.r32;*.r16;*.raw",
+        options={'HIDDEN'})
+
+    def execute(self, context):
+        try:
+            importRaster(context, self.filepath)
+        except Exception as e:
+            exc_tb = sys.exc_info()[2]
+            print_tb(exc_tb)
+            self.report({'WARNING', 'INFO'}, "I/O error: {0}".format(e))
+
+        return{'FINISHED'}
+
 def ArmaToolboxImportMenuFunc(self, context):
     self.layout.operator(ATBX_OT_p3d_import.bl_idname, text="Arma 3 P3D (.p3d)")
 
+def ArmaToolboxImportBITxtMenuFunc(self, context):
+    self.layout.operator(ATBX_OT_bitxt_import.bl_idname, text="Arma 3 BITxt Model (.txt)")
+
 def ArmaToolboxImportASCMenuFunc(self, context):
     self.layout.operator(ATBX_OT_asc_import.bl_idname, text="Arma 3 ASC DEM File (.asc)")
 
 def ArmaToolboxExportASCMenuFunc(self, context):
     self.layout.operator(ATBX_OT_asc_export.bl_idname, text="Arma 3 ASC DEM File (.asc)")
 
+def ArmaToolboxImportHeightmapMenuFunc(self, context):
+    self.layout.operator(ATBX_OT_heightmap_import.bl_idname, text="Arma 3 Heightmap (.r32/.r16/.npy)")
+
+def ArmaToolboxExportHeightmapMenuFunc(self, context):
+    self.layout.operator(ATBX_OT_heightmap_export.bl_idname, text="Arma 3 Heightmap (.r32/.r16/.npy)")
+
 '''def addProxy():
     verts = [(0,0,0),
              (0,0,2),
@@ -469,6 +674,12 @@ def ArmaToolboxAddProxyMenuFunc(self, context):
 
 def ArmaToolboxExportRTMMenuFunc(self, context):
     self.layout.operator(ATBX_OT_rtm_export.bl_idname, text="Arma 3 .RTM Animation")
+
+def ArmaToolboxExportRTMActionsMenuFunc(self, context):
+    self.layout.operator(ATBX_OT_rtm_export_actions.bl_idname, text="Arma 3 .RTM Animations (All Actions)")
+
+def ArmaToolboxImportRTMMenuFunc(self, context):
+    self.layout.operator(ATBX_OT_rtm_import.bl_idname, text="Arma 3 .RTM Animation")
         
 
 ###################################
@@ -575,9 +786,14 @@ classes = (
     ArmaToolboxPreferences,
     ATBX_OT_p3d_import,
     ATBX_OT_p3d_export,
+    ATBX_OT_bitxt_import,
     ATBX_OT_asc_import,
     ATBX_OT_asc_export,
-    ATBX_OT_rtm_export
+    ATBX_OT_heightmap_import,
+    ATBX_OT_heightmap_export,
+    ATBX_OT_rtm_export,
+    ATBX_OT_rtm_export_actions,
+    ATBX_OT_rtm_import
 )
 
 def register():
@@ -607,10 +823,15 @@ def register():
 
     bpy.types.TOPBAR_MT_file_export.append(ArmaToolboxExportMenuFunc)
     bpy.types.TOPBAR_MT_file_import.append(ArmaToolboxImportMenuFunc)
+    bpy.types.TOPBAR_MT_file_import.append(ArmaToolboxImportBITxtMenuFunc)
     bpy.types.TOPBAR_MT_file_import.append(ArmaToolboxImportASCMenuFunc)
     bpy.types.TOPBAR_MT_file_export.append(ArmaToolboxExportASCMenuFunc)
+    bpy.types.TOPBAR_MT_file_import.append(ArmaToolboxImportHeightmapMenuFunc)
+    bpy.types.TOPBAR_MT_file_export.append(ArmaToolboxExportHeightmapMenuFunc)
     #bpy.types.INFO_MT_mesh_add.append(ArmaToolboxAddProxyMenuFunc)
     bpy.types.TOPBAR_MT_file_export.append(ArmaToolboxExportRTMMenuFunc)
+    bpy.types.TOPBAR_MT_file_export.append(ArmaToolboxExportRTMActionsMenuFunc)
+    bpy.types.TOPBAR_MT_file_import.append(ArmaToolboxImportRTMMenuFunc)
 
     if load_handler not in bpy.app.handlers.load_post:
         bpy.app.handlers.load_post.append(load_handler)
@@ -626,11 +847,16 @@ def unregister():
 
     bpy.types.TOPBAR_MT_file_export.remove(ArmaToolboxExportMenuFunc)
     bpy.types.TOPBAR_MT_file_import.remove(ArmaToolboxImportMenuFunc)
+    bpy.types.TOPBAR_MT_file_import.remove(ArmaToolboxImportBITxtMenuFunc)
     bpy.types.TOPBAR_MT_file_import.remove(ArmaToolboxImportASCMenuFunc)
     bpy.types.TOPBAR_MT_file_export.remove(ArmaToolboxExportASCMenuFunc)
+    bpy.types.TOPBAR_MT_file_import.remove(ArmaToolboxImportHeightmapMenuFunc)
+    bpy.types.TOPBAR_MT_file_export.remove(ArmaToolboxExportHeightmapMenuFunc)
     #bpy.utils.unregister_class(ArmaToolboxAddNewProxy)
     #bpy.types.TOPBAR_MT_file_import.remove(ArmaToolboxAddProxyMenuFunc)
     bpy.types.TOPBAR_MT_file_export.remove(ArmaToolboxExportRTMMenuFunc)
+    bpy.types.TOPBAR_MT_file_export.remove(ArmaToolboxExportRTMActionsMenuFunc)
+    bpy.types.TOPBAR_MT_file_import.remove(ArmaToolboxImportRTMMenuFunc)
 
     from bpy.utils import unregister_class
     from . import properties,panels,lists,operators
@@ -1,4 +1,5 @@
 import bpy
+import numpy as np
 
 class ATBX_UL_named_prop_list(bpy.types.UIList):
     # The draw_item function is called for each item of the collection that is visible in the list.
@@ -25,16 +26,32 @@ class ATBX_UL_key_frame_list(bpy.types.UIList):
 
         layout.label(text = "%d (time: %f)" %  (prop.timeIndex, timeIdx))
     
+    # (data pointer, propname) -> (timeIndex array, order). filter_items
+    # runs on every redraw, the order only changes with the collection.
+    # Only a few lists are drawn at a time, the cache is dropped when it
+    # grows past ORDER_CACHE_SIZE entries.
+    _orderCache = {}
+    ORDER_CACHE_SIZE = 16
+
     def filter_items(self, context, data, propname):
-        helper_funcs = bpy.types.UI_UL_list
         keyFrames = getattr(data, propname)
         # Default return values.
         flt_flags = []
-        flt_neworder = []
 
-        # Reorder by name or average weight.
-        _sort = [(idx, frame) for idx, frame in enumerate(keyFrames)]
-        flt_neworder = helper_funcs.sort_items_helper(_sort, lambda e: e[1].timeIndex, False)
+        # Reorder by time
+        timeIndices = KeyframeRegistry.timeIndices(keyFrames)
+        cacheKey = (data.as_pointer(), propname)
+        cached = self._orderCache.get(cacheKey)
+        if cached is not None and np.array_equal(cached[0], timeIndices):
+            return flt_flags, cached[1]
+
+        # flt_neworder[i] is the position item i is drawn at
+        order = np.empty(len(timeIndices), dtype=np.int64)
+        order[np.argsort(timeIndices, kind='stable')] = np.arange(len(timeIndices))
+        flt_neworder = order.tolist()
+        if cacheKey not in self._orderCache and len(self._orderCache) >= self.ORDER_CACHE_SIZE:
+            self._orderCache.clear()
+        self._orderCache[cacheKey] = (timeIndices, flt_neworder)
 
         return flt_flags, flt_neworder
 
@@ -121,15 +138,88 @@ list_classes = (
     ATBX_UL_convert_list
 )
 
+###
+##  Keyframe registry
+#
+#   armaObjProps.keyFrames is a plain collection, finding a frame in it means
+#   walking all items. The registry reads the time indices once with
+#   foreach_get and keeps a set of them, so adding or removing many frames
+#   is linear in the size of the collection.
+
+class KeyframeRegistry:
+    def __init__(self, prop):
+        self.prop = prop
+        self.frames = set(self.timeIndices(prop).tolist())
+
+    @staticmethod
+    def timeIndices(prop):
+        data = np.empty(len(prop), dtype=np.int32)
+        prop.foreach_get("timeIndex", data)
+        return data
+
+    def __contains__(self, frame):
+        return int(round(frame)) in self.frames
+
+    def __len__(self):
+        return len(self.prop)
+
+    def sortedFrames(self):
+        return sorted(self.frames)
+
+    def _append(self, frames):
+        # Items are added first and their time indices set in one go, only
+        # the names need a loop. add() can reallocate the collection, so
+        # the items are looked up by index afterwards instead of keeping
+        # the references it returned.
+        start = len(self.prop)
+        for frame in frames:
+            self.prop.add()
+        data = self.timeIndices(self.prop)
+        data[start:] = frames
+        self.prop.foreach_set("timeIndex", data)
+        for i, frame in enumerate(frames):
+            self.prop[start + i].name = str(frame)
+        self.frames.update(frames)
+
+    def add(self, frame):
+        ''' Add a single frame, returns the new item or None if the frame was already there '''
+        frame = int(round(frame))
+        if frame in self.frames:
+            return None
+        self._append([frame])
+        return self.prop[len(self.prop) - 1]
+
+    def addMany(self, frames):
+        ''' Add all frames that aren't in the list yet, in ascending order. Returns the number added '''
+        new = sorted(set(int(round(f)) for f in frames) - self.frames)
+        if len(new) > 0:
+            self._append(new)
+        return len(new)
+
+    def addRange(self, start, end, step=1):
+        return self.addMany(range(start, end, step))
+
+    def removeMany(self, frames):
+        ''' Remove the given frames, returns the number removed '''
+        remove = set(int(round(f)) for f in frames) & self.frames
+        if len(remove) > 0:
+            self.replace(self.frames - remove)
+        return len(remove)
+
+    def removeRange(self, start, end, step=1):
+        return self.removeMany(range(start, end, step))
+
+    def replace(self, frames):
+        ''' Replace the whole list with frames, sorted '''
+        self.prop.clear()
+        self.frames = set()
+        self.addMany(frames)
+
+    def rebuildSorted(self):
+        self.replace(set(self.frames))
+
 def safeAddTime(frame, prop):
-    for k in prop:
-        if k.timeIndex == frame:
-            return
-        
-    item = prop.add()
-    item.timeIndex = frame
-    item.name = str(frame)
-    return item
+    return KeyframeRegistry(prop).add(frame)
 
 def register():
     from bpy.utils import register_class
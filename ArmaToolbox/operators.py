@@ -1,11 +1,13 @@
 import bpy
 import bpy_extras
-from lists import safeAddTime
+from lists import safeAddTime, KeyframeRegistry
 from . import properties
 from ArmaProxy import CopyProxy, CreateProxyPos, SelectProxy
 import bmesh
 import ArmaTools
 import RVMatTools
+from RVMatParser import RVMatError
+import AssetIndex
 from math import *
 from mathutils import *
 from ArmaToolbox import getLodsToFix
@@ -187,8 +189,7 @@ class ATBX_OT_add_frame_range(bpy.types.Operator):
         end = guiProps.framePanelEnd
         step = guiProps.framePanelStep
 
-        for frame in range(start, end, step):
-            safeAddTime(frame, prp)
+        KeyframeRegistry(prp).addRange(start, end, step)
 
         return {"FINISHED"}
 
@@ -220,20 +221,122 @@ class ATBX_OT_add_all_key_frames(bpy.types.Operator):
         obj = context.active_object
         prp = obj.armaObjProps.keyFrames
 
-        keyframes = []
+        keyframes = set()
 
         if obj.animation_data is not None and obj.animation_data.action is not None:
             fcurves = obj.animation_data.action.fcurves
             for curve in fcurves:
-                for kp in curve.keyframe_points:
-                    if kp.co.x not in keyframes:
-                        keyframes.append(kp.co.x)
+                co = [0.0] * (len(curve.keyframe_points) * 2)
+                curve.keyframe_points.foreach_get("co", co)
+                keyframes.update(co[0::2])
 
-        keyframes.sort()
+        KeyframeRegistry(prp).addMany(keyframes)
 
-        for frame in keyframes:
-            safeAddTime(frame, prp)
+        return {"FINISHED"}
+
+
+class ATBX_OT_reduce_key_frames(bpy.types.Operator):
+    bl_idname = "armatoolbox.reduce_key_frames"
+    bl_label = ""
+    bl_description = "Replace the keyframe list with the fewest frames that reproduce the animation within the tolerances"
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.type == 'ARMATURE' and obj.animation_data is not None
+
+    def execute(self, context):
+        from KeyframeReducer import reduceArmatureKeyframes
+        guiProps = context.window_manager.armaGUIProps
+        result = reduceArmatureKeyframes(context, guiProps.reducePositionTolerance,
+                                         guiProps.reduceRotationTolerance)
+
+        if result["previous"] > 0:
+            before = "{0} frames / {1:.1f} KB before".format(result["previous"], result["bytesPrevious"] / 1024)
+        else:
+            before = "{0:.1f} KB with all frames".format(result["bytesAllFrames"] / 1024)
+        self.report({'INFO'}, "Kept {0} of {1} frames, RTM {2:.1f} KB ({3})".format(
+            result["kept"], result["sampled"], result["bytes"] / 1024, before))
+        return {"FINISHED"}
+
+
+class ATBX_OT_refine_heightfield(bpy.types.Operator):
+    bl_idname = "armatoolbox.refine_heightfield"
+    bl_label = "Refine Heightfield"
+    bl_description = "Create a full resolution object for the selected part of a heightfield preview (all of it if nothing is selected)"
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return (obj is not None and obj.type == 'MESH' and obj.armaHFProps.isHeightfield
+                and obj.armaHFProps.previewStep > 1 and len(obj.armaHFProps.pyramidSource) > 0)
+
+    def execute(self, context):
+        from ASCImporter import previewRegion, refineHeightfield
+        import numpy as np
+
+        obj = context.active_object
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+        vertices = obj.data.vertices
+        selected = np.zeros(len(vertices), dtype=bool)
+        vertices.foreach_get("select", selected)
+
+        try:
+            region = previewRegion(obj, selected)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        try:
+            result = refineHeightfield(context, obj, *region)
+        except OSError as e:
+            self.report({'ERROR'}, "Can't read the heightfield pyramid: {0}".format(e))
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Created {0} ({1}x{2})".format(result.name, result.armaHFProps.ncols,
+                                                             result.armaHFProps.nrows))
+        return {"FINISHED"}
+
+
+class ATBX_OT_heightfield_surface_maps(bpy.types.Operator):
+    bl_idname = "armatoolbox.heightfield_surface_maps"
+    bl_label = "Surface Maps"
+    bl_description = "Compute slope, aspect and curvature maps of the heightfield (all tiles if it is a tile)"
+    bl_options = {'REGISTER', 'UNDO'}
 
+    slope: bpy.props.BoolProperty(name="Slope", description="Slope in degrees", default=True)
+    aspect: bpy.props.BoolProperty(name="Aspect", description="Direction the slope faces, degrees clockwise from north, -1 on flat ground", default=True)
+    curvature: bpy.props.BoolProperty(name="Curvature", description="Curvature, positive is convex", default=True)
+    output: bpy.props.EnumProperty(
+        name="Output",
+        description="Where to store the maps",
+        items=(('ATTRIBUTES', "Attributes", "Float attributes on the vertices"),
+               ('IMAGES', "Images", "Float images, one pixel per vertex")),
+        default='ATTRIBUTES')
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.type == 'MESH' and obj.armaHFProps.isHeightfield
+
+    def execute(self, context):
+        maps = [name for name in ("slope", "aspect", "curvature") if getattr(self, name)]
+        if len(maps) == 0:
+            return {'CANCELLED'}
+
+        obj = context.active_object
+        mode = obj.mode
+        if mode == 'EDIT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        try:
+            objects = ArmaTools.heightfieldSurfaceMaps(context, obj, maps, self.output)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        finally:
+            if mode == 'EDIT':
+                bpy.ops.object.mode_set(mode='EDIT')
+
+        self.report({'INFO'}, "Computed {0} for {1} object(s)".format(", ".join(maps), len(objects)))
         return {"FINISHED"}
 
 
@@ -686,6 +789,58 @@ class ATBX_OT_ensure_quads(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def openAssetIndex(context):
+    ''' Open the asset index if there is one, otherwise return None '''
+    guiProps = context.window_manager.armaGUIProps
+    dbFile = guiProps.assetIndexFile
+    if len(dbFile) == 0:
+        if len(guiProps.assetIndexRoot) == 0:
+            return None
+        dbFile = AssetIndex.defaultIndexFile(bpy.path.abspath(guiProps.assetIndexRoot))
+    dbFile = bpy.path.abspath(dbFile)
+    if not os.path.isfile(dbFile):
+        return None
+    return AssetIndex.openIndex(dbFile)
+
+def reportReferencingModels(operator, context, rvmatName):
+    db = openAssetIndex(context)
+    if db is None:
+        return
+    models = AssetIndex.modelsUsingMaterial(db, rvmatName)
+    db.close()
+    for m in models:
+        print(m)
+    operator.report({'INFO'}, "{0} indexed models use {1}".format(len(models), rvmatName))
+
+
+class ATBX_OT_build_asset_index(bpy.types.Operator):
+    '''Index the P3D and rvmat files of a folder'''
+    bl_idname = "armatoolbox.build_asset_index"
+    bl_label = "Update Asset Index"
+
+    def execute(self, context):
+        guiProps = context.window_manager.armaGUIProps
+        root = bpy.path.abspath(guiProps.assetIndexRoot)
+        if not os.path.isdir(root):
+            self.report({'ERROR_INVALID_INPUT'}, "Folder to index does not exist")
+            return {'CANCELLED'}
+
+        dbFile = guiProps.assetIndexFile
+        if len(dbFile) == 0:
+            dbFile = AssetIndex.defaultIndexFile(root)
+        dbFile = bpy.path.abspath(dbFile)
+
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        result = AssetIndex.updateIndex(dbFile, root,
+                                        progress=lambda done, total: wm.progress_update(100 * done // total))
+        wm.progress_end()
+
+        self.report({'INFO'}, "Indexed {0} files ({1} updated, {2} removed, {3} failed)".format(
+            result["files"], result["scanned"], result["removed"], result["failed"]))
+        return {'FINISHED'}
+
+
 class ATBX_OT_rvmat_relocator(bpy.types.Operator):
     '''Relocate a single RVMat to a different directory'''
     bl_idname = "armatoolbox.rvmatrelocator"
@@ -696,7 +851,12 @@ class ATBX_OT_rvmat_relocator(bpy.types.Operator):
         rvfile = guiProps.rvmatRelocFile
         rvout = guiProps.rvmatOutputFolder
         prefixPath = guiProps.matPrefixFolder
-        RVMatTools.rt_CopyRVMat(rvfile, rvout, prefixPath)
+        try:
+            RVMatTools.rt_CopyRVMat(rvfile, rvout, prefixPath)
+        except RVMatError as e:
+            self.report({'ERROR'}, "Can't parse the rvmat: {0}".format(e))
+            return {'CANCELLED'}
+        reportReferencingModels(self, context, rvfile)
         return {'FINISHED'}
 
 
@@ -721,7 +881,12 @@ class ATBX_OT_material_relocator(bpy.types.Operator):
 
         materialName = self.material
         textureName = self.texture
-        RVMatTools.mt_RelocateMaterial(textureName, materialName, outputPath, guiProps.matAutoHandleRV, prefixPath)
+        error = RVMatTools.mt_RelocateMaterial(textureName, materialName, outputPath, guiProps.matAutoHandleRV, prefixPath)
+        if error is not None:
+            self.report({'WARNING'}, "Material not relocated, can't parse the rvmat: {0}".format(error))
+            return {'CANCELLED'}
+        if len(materialName) > 0:
+            reportReferencingModels(self, context, materialName)
 
         return {'FINISHED'}
 
@@ -1199,6 +1364,28 @@ class ATBX_OT_import_proxy_mlod(bpy.types.Operator):
 
         obj_name = file_path[file_path.rfind("\\") + 1:].split(".")[0] + '_1'
 
+        if error == -1 or error == -2:
+            baseName = obj_name[:obj_name.rfind("_")]
+            db = openAssetIndex(context)
+            if db is not None:
+                try:
+                    # Ask the index first, mlod with suffix wins
+                    for name in (baseName + mlod_suffix, baseName):
+                        found = AssetIndex.findFiles(db, name + ".p3d", mlods_path)
+                        if len(found) > 0:
+                            obj_name = name + '_1'
+                            error = -2
+                            try:
+                                error = importMDL(context, found[0], False, 1, True)
+                            except Exception as e:
+                                exc_tb = sys.exc_info()[2]
+                                print_tb(exc_tb)
+                                print("{0}".format(exc_tb))
+                                self.report({'WARNING', 'INFO'}, "I/O error: {0}\n{1}".format(e, exc_tb))
+                            break
+                finally:
+                    db.close()
+
         if error == -1 or error == -2:
             for root, dirs, files, in os.walk(mlods_path):
                 for name in files:
@@ -1263,9 +1450,13 @@ class ATBX_OT_import_proxy_mlod(bpy.types.Operator):
 
 
 op_classes = (
+    ATBX_OT_build_asset_index,
     ATBX_OT_add_frame_range,
     ATBX_OT_add_key_frame,
     ATBX_OT_add_all_key_frames,
+    ATBX_OT_reduce_key_frames,
+    ATBX_OT_refine_heightfield,
+    ATBX_OT_heightfield_surface_maps,
     ATBX_OT_rem_key_frame,
     ATBX_OT_rem_all_key_frames,
     ATBX_OT_add_prop,
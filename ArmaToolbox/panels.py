@@ -118,6 +118,11 @@ class ATBX_PT_properties_panel(bpy.types.Panel):
                 row = layout.row()
                 row.operator("armatoolbox.add_all_key_frames", text="Add Armature Timeline Keys",
                              icon="RESTRICT_INSTANCED_ON")
+                box = layout.box()
+                sub = box.column(align=True)
+                sub.prop(guiProps, "reducePositionTolerance", text="Position (mm)")
+                sub.prop(guiProps, "reduceRotationTolerance", text="Rotation (deg)")
+                box.operator("armatoolbox.reduce_key_frames", text="Reduce Keyframes", icon="IPO_LINEAR")
                 col = layout.column(align=True)
                 split = col.split(factor=0.15)
                 if guiProps.framePanelOpen:
@@ -453,6 +458,9 @@ class ATBX_PT_relocation_tool_panel(bpy.types.Panel):
         layout.prop(guiProps, "rvmatOutputFolder", text="Output Folder")
         layout.prop(guiProps, "matPrefixFolder", text="Search Prefix")
         layout.separator()
+        layout.operator("armatoolbox.build_asset_index", text="Update Asset Index")
+        layout.prop(guiProps, "assetIndexRoot", text="Index Folder")
+        layout.prop(guiProps, "assetIndexFile", text="Index File")
 
 
 class ATBX_PT_material_relocation_panel(bpy.types.Panel):
@@ -593,10 +601,27 @@ class ATBX_PT_hf_properties_panel(bpy.types.Panel):
             row = layout.row()
             row.prop(hrp, "undefVal", text="NODATA_value")
 
-            verts = len(obj.data.vertices)
-            verts = sqrt(verts)
             row = layout.row()
-            row.label(text="rows/cols: " + str(int(verts)))
+            if hrp.ncols > 0 and hrp.nrows > 0:
+                row.label(text="cols/rows: {0}x{1}".format(hrp.ncols, hrp.nrows))
+            else:
+                verts = len(obj.data.vertices)
+                verts = sqrt(verts)
+                row.label(text="rows/cols: " + str(int(verts)))
+
+            if len(hrp.tileGroup) > 0:
+                row = layout.row()
+                row.label(text="Tile {0},{1} of {2} ({3}x{3})".format(hrp.tileRow, hrp.tileCol,
+                                                                   hrp.tileGroup, hrp.tileCount))
+
+            if hrp.previewStep > 1:
+                row = layout.row()
+                row.label(text="Preview, every {0}. sample".format(hrp.previewStep))
+                row = layout.row()
+                row.operator("armatoolbox.refine_heightfield", text="Refine Selection")
+
+            row = layout.row()
+            row.operator("armatoolbox.heightfield_surface_maps", text="Slope/Aspect/Curvature Maps")
 
 
 ### Not really needed
@@ -131,6 +131,67 @@ class ArmaToolboxHeightfieldProperties(bpy.types.PropertyGroup):
         name="NODATA value",
         description="Value for Heightfield holes",
         default=-9999)
+    ncols: bpy.props.IntProperty(
+        name="Columns",
+        description="Number of vertex columns of the heightfield mesh",
+        default=0, min=0)
+    nrows: bpy.props.IntProperty(
+        name="Rows",
+        description="Number of vertex rows of the heightfield mesh",
+        default=0, min=0)
+
+    # Tiled import, see Heightfield.tileBounds
+    tileGroup: bpy.props.StringProperty(
+        name="Tile Group",
+        description="Name shared by all tiles of one heightfield. Empty if the object is not a tile",
+        default="")
+    tileCount: bpy.props.IntProperty(
+        name="Tile Count",
+        description="Number of tiles along each side of the heightfield",
+        default=1, min=1)
+    tileRow: bpy.props.IntProperty(
+        name="Tile Row",
+        description="Row of this tile, 0 is the northern edge",
+        default=0, min=0)
+    tileCol: bpy.props.IntProperty(
+        name="Tile Column",
+        description="Column of this tile, 0 is the western edge",
+        default=0, min=0)
+    gridRowOffset: bpy.props.IntProperty(
+        name="Grid Row Offset",
+        description="Grid row of the tile's first vertex row",
+        default=0, min=0)
+    gridColOffset: bpy.props.IntProperty(
+        name="Grid Column Offset",
+        description="Grid column of the tile's first vertex column",
+        default=0, min=0)
+    gridRows: bpy.props.IntProperty(
+        name="Grid Rows",
+        description="Number of rows of the whole heightfield",
+        default=0, min=0)
+    gridCols: bpy.props.IntProperty(
+        name="Grid Columns",
+        description="Number of columns of the whole heightfield",
+        default=0, min=0)
+    overlap: bpy.props.IntProperty(
+        name="Overlap",
+        description="Extra rows and columns the tile shares with its neighbours",
+        default=0, min=0)
+
+    # Preview import, see Heightfield.HeightfieldPyramid
+    pyramidSource: bpy.props.StringProperty(
+        name="Source",
+        description="ASC file whose pyramid this heightfield was built from",
+        subtype='FILE_PATH',
+        default="")
+    previewStep: bpy.props.IntProperty(
+        name="Preview Step",
+        description="Distance between the samples of a preview in grid cells. 1 is full resolution",
+        default=1, min=1)
+    previewOffset: bpy.props.FloatProperty(
+        name="Preview Offset",
+        description="Grid position of the first preview sample",
+        default=0.0, min=0.0)
 
 
 class ArmaToolboxProperties(bpy.types.PropertyGroup):
@@ -237,6 +298,13 @@ class ArmaToolboxGUIProps(bpy.types.PropertyGroup):
                                           description="Step of the range of frames to add to the list",
                                           default=5, min=1)
 
+    reducePositionTolerance: bpy.props.FloatProperty(name="Position Tolerance",
+                                                     description="Largest allowed position error of a bone's head or tail, in millimetres",
+                                                     default=1.0, min=0.0, precision=2)
+    reduceRotationTolerance: bpy.props.FloatProperty(name="Rotation Tolerance",
+                                                     description="Largest allowed rotation error of a bone, in degrees",
+                                                     default=0.5, min=0.0, precision=2)
+
     bulkRenamePanelOpen: bpy.props.BoolProperty(name="Open Bulk Rename Settings Panel",
                                                 description="Open or close the settings of the 'Bulk Rename' tool",
                                                 default=False)
@@ -281,6 +349,13 @@ class ArmaToolboxGUIProps(bpy.types.PropertyGroup):
     mlodEmptyProxyFile: bpy.props.StringProperty("mlodEmptyProxyFile", description="Mlod for empty proxy",
                                                  subtype='FILE_PATH')
 
+    # Asset index
+    assetIndexRoot: bpy.props.StringProperty("assetIndexRoot", description="Folder to index", subtype='DIR_PATH',
+                                             default="P:\\")
+    assetIndexFile: bpy.props.StringProperty("assetIndexFile",
+                                             description="Asset index database. Defaults to ArmaToolbox.index in the indexed folder",
+                                             subtype='FILE_PATH')
+
     # Material Relocator
     matOutputFolder: bpy.props.StringProperty("matOutputFolder", description="RVMat output", subtype='DIR_PATH')
     matAutoHandleRV: bpy.props.BoolProperty(name="matAutoHandleRV", description="Automatically relocate RVMat",
@@ -1,2 +1,2 @@
-xcopy /y ArmaToolbox\*.* "%appdata%\Blender Foundation\Blender\3.1\scripts\addons\ArmaToolbox"
+xcopy /y /s /i ArmaToolbox\*.* "%appdata%\Blender Foundation\Blender\3.1\scripts\addons\ArmaToolbox"
 del /s/q "%appdata%\Blender Foundation\Blender\3.1\scripts\addons\ArmaToolbox\__pycache__"
\ No newline at end of file